@@ -1,31 +1,50 @@
-from flask import Flask, jsonify, session
+from flask import Flask, Response, jsonify, session
 from flask_cors import CORS
-import os
-from datetime import timedelta
+import atexit
+
+# Debug / production settings
+from backend.config import get_config, DEFAULT_SECRET_KEY
 
 # Import database initialization
-from backend.models.database import init_db
+from backend.models.database import init_db, release_db_connection, close_db_connections
 
 # Import blueprints
 from backend.routes.auth import auth_bp
 from backend.routes.portfolio import portfolio_bp
 from backend.routes.market import market_bp
+from backend.routes.stream import stream_bp
+from backend.routes.leaderboard import leaderboard_bp
+
+# Request timing and the /metrics exposition
+from backend.utils.metrics import init_app as init_metrics, render_metrics
+
+# Background jobs
+from backend.utils.market_poller import market_poller
+from backend.utils.snapshot_job import snapshot_job
+from backend.utils.leaderboard import leaderboard
+from backend.utils.valuation import valuation_book
+from backend.utils.order_engine import order_engine
+from backend.utils.stream_hub import stream_hub
+
+def create_app(config_name=None, start_jobs=True):
+    """
+    Create and configure the Flask application.
 
-def create_app():
-    """Create and configure the Flask application."""
+    config_name selects a class from backend.config (CELESTA_ENV by default).
+    Pass start_jobs=False when the process will fork afterwards, as under
+    gunicorn with preload, and call start_background_jobs in each worker.
+    """
     app = Flask(__name__)
     
     # Configuration
-    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'celesta-super-secret-key-change-in-production')
-    app.config['SESSION_COOKIE_SECURE'] = False  # Set to True in production with HTTPS
-    app.config['SESSION_COOKIE_HTTPONLY'] = True
-    app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-    app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
+    app.config.from_object(get_config(config_name))
+    if not app.config['DEBUG'] and app.config['SECRET_KEY'] == DEFAULT_SECRET_KEY:
+        print("Warning: SECRET_KEY is not set, sessions are signed with the default key")
     
     # Enable CORS for frontend communication
     CORS(app, 
          supports_credentials=True, 
-         origins=['http://localhost:3000', 'http://localhost:3001'],
+         origins=app.config['CORS_ORIGINS'],
          allow_headers=['Content-Type', 'Authorization'],
          expose_headers=['Content-Type'],
          methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'])
@@ -33,10 +52,22 @@ def create_app():
     # Initialize database
     init_db()
     
+    # Pooled connections: roll back leftovers per request, close on shutdown
+    app.teardown_appcontext(release_db_connection)
+    atexit.register(close_db_connections)
+    
+    # Per-endpoint latency histograms and in-flight counts
+    init_metrics(app)
+    
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(portfolio_bp, url_prefix='/api/portfolio')
     app.register_blueprint(market_bp, url_prefix='/api/market')
+    app.register_blueprint(stream_bp, url_prefix='/api/stream')
+    app.register_blueprint(leaderboard_bp, url_prefix='/api/leaderboard')
+    
+    if start_jobs:
+        start_background_jobs(app)
     
     # Root endpoint
     @app.route('/')
@@ -49,7 +80,9 @@ def create_app():
             'endpoints': {
                 'auth': '/api/auth',
                 'portfolio': '/api/portfolio',
-                'market': '/api/market'
+                'market': '/api/market',
+                'stream': '/api/stream',
+                'leaderboard': '/api/leaderboard'
             }
         })
     
@@ -69,6 +102,11 @@ def create_app():
     def health():
         return jsonify({'status': 'healthy', 'message': 'API is running'}), 200
     
+    # Prometheus scrape endpoint
+    @app.route('/metrics')
+    def metrics():
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+    
     # Error handlers
     @app.errorhandler(404)
     def not_found(error):
@@ -80,6 +118,45 @@ def create_app():
     
     return app
 
+def start_background_jobs(app, leader=True):
+    """
+    Start the enabled background threads. leader=False skips the
+    once-per-deployment jobs and makes the market poller follow the
+    leader's quotes instead of calling upstream.
+    """
+    # Keep held, trending and recently requested symbols fresh in the background;
+    # only the leader calls upstream, the other workers follow its quotes
+    if app.config['MARKET_POLLER']:
+        market_poller.start(leader=leader)
+    
+    # Write a portfolio value snapshot for every user once per interval
+    if leader and app.config['SNAPSHOT_JOB']:
+        snapshot_job.start()
+    
+    # Fill resting orders as quotes cross them; one process per database,
+    # so no order is ever triggered twice
+    if leader and app.config['ORDER_ENGINE']:
+        order_engine.start()
+    
+    # Load the leaderboard now and re-rank it from the portfolio table
+    # periodically; runs in every worker since each keeps its own ranking
+    if app.config['LEADERBOARD_RERANK']:
+        leaderboard.start()
+    
+    # Check loaded valuations against the portfolio table and reload any
+    # that drifted; runs in every worker since each keeps its own book
+    if app.config['VALUATION_CHECK']:
+        valuation_book.start()
+
+def stop_background_jobs():
+    """Stop the background threads and end open event streams."""
+    stream_hub.shutdown()
+    market_poller.stop()
+    snapshot_job.stop()
+    order_engine.stop()
+    leaderboard.stop()
+    valuation_book.stop()
+
 if __name__ == '__main__':
     app = create_app()
     print("\n" + "="*50)
@@ -90,5 +167,5 @@ if __name__ == '__main__':
     print("📖 API Docs: http://localhost:5001")
     print("="*50 + "\n")
     
-    app.run(debug=True, host='0.0.0.0', port=5001)
+    app.run(debug=app.config['DEBUG'], host='0.0.0.0', port=5001)
 
@@ -0,0 +1,51 @@
+import os
+from datetime import timedelta
+
+DEFAULT_SECRET_KEY = 'celesta-super-secret-key-change-in-production'
+
+
+class Config:
+    """Settings shared by every environment."""
+
+    DEBUG = False
+    SECRET_KEY = os.environ.get('SECRET_KEY', DEFAULT_SECRET_KEY)
+    SESSION_COOKIE_SECURE = False
+    SESSION_COOKIE_HTTPONLY = True
+    SESSION_COOKIE_SAMESITE = 'Lax'
+    PERMANENT_SESSION_LIFETIME = timedelta(days=7)
+    CORS_ORIGINS = os.environ.get('CORS_ORIGINS', 'http://localhost:3000,http://localhost:3001').split(',')
+    MARKET_POLLER = os.environ.get('MARKET_POLLER', '1') == '1'
+    SNAPSHOT_JOB = os.environ.get('SNAPSHOT_JOB', '1') == '1'
+    LEADERBOARD_RERANK = os.environ.get('LEADERBOARD_RERANK', '1') == '1'
+    ORDER_ENGINE = os.environ.get('ORDER_ENGINE', '1') == '1'
+    VALUATION_CHECK = os.environ.get('VALUATION_CHECK', '1') == '1'
+
+
+class DevelopmentConfig(Config):
+    """Werkzeug dev server with the debugger and reloader."""
+
+    DEBUG = True
+
+
+class ProductionConfig(Config):
+    """Multi-worker deployment behind HTTPS (see gunicorn.conf.py)."""
+
+    # Set SESSION_COOKIE_SECURE=0 only when serving plain HTTP
+    SESSION_COOKIE_SECURE = os.environ.get('SESSION_COOKIE_SECURE', '1') == '1'
+
+
+CONFIGS = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+}
+
+# Environment used when create_app is not given one
+CELESTA_ENV = os.environ.get('CELESTA_ENV', 'development')
+
+
+def get_config(name=None):
+    """Return the config class for an environment name."""
+    name = name or CELESTA_ENV
+    if name not in CONFIGS:
+        raise ValueError(f"Unknown CELESTA_ENV '{name}', expected one of {', '.join(CONFIGS)}")
+    return CONFIGS[name]
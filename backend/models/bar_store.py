@@ -0,0 +1,154 @@
+import os
+import time
+
+from backend.models.database import get_db_connection
+from backend.utils.metrics import traced
+
+# Intraday bars older than this many days are dropped by compact_bars
+BAR_INTRADAY_RETENTION_DAYS = float(os.environ.get('BAR_INTRADAY_RETENTION_DAYS', 60))
+
+# Series nobody has read for this many days are dropped by compact_bars
+BAR_IDLE_DAYS = float(os.environ.get('BAR_IDLE_DAYS', 90))
+
+# Seconds between last_read_ts updates for a series that keeps being read
+BAR_READ_TOUCH_SECONDS = 3600
+
+# Intervals at or above one day; everything else counts as intraday
+DAILY_INTERVALS = ('1d', '5d', '1wk', '1mo', '3mo')
+
+@traced('db')
+def get_coverage(provider, symbol, asset_type, interval):
+    """Get the (start_ts, end_ts) range already fetched for a series from provider, or None."""
+    conn = get_db_connection()
+    row = conn.execute(
+        '''SELECT start_ts, end_ts FROM market_bar_coverage
+           WHERE provider = ? AND symbol = ? AND asset_type = ? AND interval = ?''',
+        (provider, symbol, asset_type, interval)
+    ).fetchone()
+    return (row['start_ts'], row['end_ts']) if row else None
+
+@traced('db')
+def store_bars(provider, symbol, asset_type, interval, bars, start_ts, end_ts):
+    """
+    Upsert bars from provider and extend the series coverage to include [start_ts, end_ts].
+
+    bars: iterable of (ts, open, high, low, close, volume) with ts in epoch seconds
+    Overlapping bars replace the stored ones, so re-fetching a range is safe.
+    An empty fetch stores nothing and leaves the coverage alone, so the
+    range is fetched again on the next read instead of staying a hole.
+    """
+    bars = list(bars)
+    if not bars:
+        return
+    conn = get_db_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.executemany(
+            '''INSERT OR REPLACE INTO market_bars
+                   (provider, symbol, asset_type, interval, ts, open, high, low, close, volume)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            ((provider, symbol, asset_type, interval) + tuple(bar) for bar in bars)
+        )
+        conn.execute(
+            '''INSERT INTO market_bar_coverage
+                   (provider, symbol, asset_type, interval, start_ts, end_ts, last_read_ts)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(provider, symbol, asset_type, interval) DO UPDATE SET
+                   start_ts = min(start_ts, excluded.start_ts),
+                   end_ts = max(end_ts, excluded.end_ts)''',
+            (provider, symbol, asset_type, interval, int(start_ts), int(end_ts), int(time.time()))
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+@traced('db')
+def get_bars(provider, symbol, asset_type, interval, start_ts, end_ts=None):
+    """Get provider's stored (ts, open, high, low, close, volume) rows in [start_ts, end_ts], oldest first."""
+    conn = get_db_connection()
+    end_ts = end_ts if end_ts is not None else 2 ** 62
+    # Plain tuples: building sqlite3.Row objects dominates long range reads
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    rows = cursor.execute(
+        '''SELECT ts, open, high, low, close, volume FROM market_bars
+           WHERE provider = ? AND symbol = ? AND asset_type = ? AND interval = ? AND ts >= ? AND ts <= ?
+           ORDER BY ts ASC''',
+        (provider, symbol, asset_type, interval, int(start_ts), int(end_ts))
+    ).fetchall()
+    if not rows:
+        # Nothing in range (a weekend or holiday): fall back to the latest bar
+        rows = cursor.execute(
+            '''SELECT ts, open, high, low, close, volume FROM market_bars
+               WHERE provider = ? AND symbol = ? AND asset_type = ? AND interval = ? AND ts < ?
+               ORDER BY ts DESC LIMIT 1''',
+            (provider, symbol, asset_type, interval, int(start_ts))
+        ).fetchall()
+    # Record reads at most hourly; the check is a plain read, so chart loads
+    # only take the write lock once an hour per series
+    now = int(time.time())
+    read = cursor.execute(
+        '''SELECT last_read_ts FROM market_bar_coverage
+           WHERE provider = ? AND symbol = ? AND asset_type = ? AND interval = ?''',
+        (provider, symbol, asset_type, interval)
+    ).fetchone()
+    if read is not None and read[0] < now - BAR_READ_TOUCH_SECONDS:
+        conn.execute(
+            '''UPDATE market_bar_coverage SET last_read_ts = ?
+               WHERE provider = ? AND symbol = ? AND asset_type = ? AND interval = ? AND last_read_ts < ?''',
+            (now, provider, symbol, asset_type, interval, now - BAR_READ_TOUCH_SECONDS)
+        )
+        conn.commit()
+    return rows
+
+@traced('db')
+def compact_bars(now=None):
+    """
+    Drop expired intraday bars and idle series, then let SQLite refresh its
+    statistics. Returns the number of bars deleted.
+    """
+    now = int(now or time.time())
+    conn = get_db_connection()
+    deleted = 0
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        idle_cutoff = now - int(BAR_IDLE_DAYS * 86400)
+        idle = conn.execute(
+            'SELECT provider, symbol, asset_type, interval FROM market_bar_coverage WHERE last_read_ts < ?',
+            (idle_cutoff,)
+        ).fetchall()
+        for row in idle:
+            key = (row['provider'], row['symbol'], row['asset_type'], row['interval'])
+            deleted += conn.execute(
+                'DELETE FROM market_bars WHERE provider = ? AND symbol = ? AND asset_type = ? AND interval = ?', key
+            ).rowcount
+            conn.execute(
+                'DELETE FROM market_bar_coverage WHERE provider = ? AND symbol = ? AND asset_type = ? AND interval = ?', key
+            )
+
+        intraday_cutoff = now - int(BAR_INTRADAY_RETENTION_DAYS * 86400)
+        intraday = conn.execute(
+            f'''SELECT provider, symbol, asset_type, interval FROM market_bar_coverage
+                WHERE interval NOT IN ({','.join('?' * len(DAILY_INTERVALS))})
+                AND start_ts < ?''',
+            DAILY_INTERVALS + (intraday_cutoff,)
+        ).fetchall()
+        for row in intraday:
+            key = (row['provider'], row['symbol'], row['asset_type'], row['interval'])
+            deleted += conn.execute(
+                '''DELETE FROM market_bars
+                   WHERE provider = ? AND symbol = ? AND asset_type = ? AND interval = ? AND ts < ?''',
+                key + (intraday_cutoff,)
+            ).rowcount
+            conn.execute(
+                '''UPDATE market_bar_coverage SET start_ts = ?
+                   WHERE provider = ? AND symbol = ? AND asset_type = ? AND interval = ?''',
+                (intraday_cutoff,) + key
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    conn.execute('PRAGMA optimize')
+    return deleted
@@ -2,15 +2,113 @@ import sqlite3
 from datetime import datetime
 import hashlib
 import os
+import threading
+import weakref
+import time
+import calendar
+
+from backend.models import ledger
+from backend.utils.metrics import traced
 
 DATABASE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'celesta.db')
 
-def get_db_connection():
-    """Create a database connection."""
-    conn = sqlite3.connect(DATABASE_PATH)
+# Connection tuning
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_CACHE_KB = int(os.environ.get('SQLITE_CACHE_KB', 16384))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+SQLITE_STATEMENT_CACHE = int(os.environ.get('SQLITE_STATEMENT_CACHE', 256))
+SQLITE_POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', 16))
+
+class _PooledConnection(sqlite3.Connection):
+    """sqlite3 connection that can be tracked with weak references."""
+
+_local = threading.local()
+_idle = []
+_open = weakref.WeakSet()
+_pool_lock = threading.Lock()
+_generation = 0
+
+def _connect():
+    """Open a tuned connection to DATABASE_PATH."""
+    conn = sqlite3.connect(
+        DATABASE_PATH,
+        timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        cached_statements=SQLITE_STATEMENT_CACHE,
+        factory=_PooledConnection
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_KB}')
+    conn.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store=MEMORY')
     return conn
 
+def get_db_connection():
+    """
+    Get this thread's database connection.
+
+    The connection is bound to the thread until release_db_connection hands
+    it back to the pool, so every call inside one request shares it. Pooled
+    connections keep their pragmas and prepared-statement cache.
+    """
+    key = (DATABASE_PATH, _generation)
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.key == key:
+        return conn
+
+    conn = None
+    with _pool_lock:
+        while _idle:
+            idle_key, idle_conn = _idle.pop()
+            if idle_key == key:
+                conn = idle_conn
+                break
+            idle_conn.close()
+    if conn is None:
+        conn = _connect()
+        with _pool_lock:
+            _open.add(conn)
+
+    _local.conn = conn
+    _local.key = key
+    return conn
+
+def release_db_connection(exception=None):
+    """Roll back anything left uncommitted and return this thread's connection to the pool."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        return
+    key = _local.key
+    _local.conn = None
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+    except sqlite3.Error:
+        conn.close()
+        return
+    with _pool_lock:
+        if key == (DATABASE_PATH, _generation) and len(_idle) < SQLITE_POOL_SIZE:
+            _idle.append((key, conn))
+            return
+    conn.close()
+
+def close_db_connections():
+    """Close every open connection. Threads reconnect on their next call."""
+    global _generation
+    with _pool_lock:
+        connections = list(_open)
+        _open.clear()
+        _idle.clear()
+        _generation += 1
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
 def init_db():
     """Initialize the database with required tables."""
     conn = get_db_connection()
@@ -68,9 +166,216 @@ def init_db():
     ''')
     
     conn.commit()
-    conn.close()
+    apply_migrations(conn)
     print(f"Database initialized at {DATABASE_PATH}")
 
+def _backfill_tax_lots(conn):
+    """Build tax lots and realized P&L from the existing transaction history."""
+    print(f"Backfilled tax lots: {ledger.backfill_ledger(conn)}")
+
+# Schema migrations, applied in order on top of the base tables above.
+# Each entry is (version, description, statements); a statement may also be a
+# callable taking the connection, for data migrations. The applied version is
+# stored in PRAGMA user_version. Append new migrations, never edit old ones.
+MIGRATIONS = [
+    (1, 'Index transactions and snapshots by user and time', [
+        '''CREATE INDEX IF NOT EXISTS idx_transactions_user_time
+           ON transactions (user_id, timestamp)''',
+        '''CREATE INDEX IF NOT EXISTS idx_snapshots_user_time
+           ON portfolio_snapshots (user_id, timestamp, total_value)''',
+    ]),
+    (2, 'Add portfolio value rollups', [
+        '''CREATE TABLE IF NOT EXISTS portfolio_rollups (
+            user_id INTEGER NOT NULL,
+            resolution INTEGER NOT NULL,
+            bucket TIMESTAMP NOT NULL,
+            open REAL NOT NULL,
+            high REAL NOT NULL,
+            low REAL NOT NULL,
+            close REAL NOT NULL,
+            samples INTEGER NOT NULL,
+            PRIMARY KEY (user_id, resolution, bucket)
+        ) WITHOUT ROWID''',
+    ]),
+    (3, 'Add local OHLCV bar store', [
+        '''CREATE TABLE IF NOT EXISTS market_bars (
+            symbol TEXT NOT NULL,
+            asset_type TEXT NOT NULL,
+            interval TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            open REAL NOT NULL,
+            high REAL NOT NULL,
+            low REAL NOT NULL,
+            close REAL NOT NULL,
+            volume REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (symbol, asset_type, interval, ts)
+        ) WITHOUT ROWID''',
+        '''CREATE TABLE IF NOT EXISTS market_bar_coverage (
+            symbol TEXT NOT NULL,
+            asset_type TEXT NOT NULL,
+            interval TEXT NOT NULL,
+            start_ts INTEGER NOT NULL,
+            end_ts INTEGER NOT NULL,
+            last_read_ts INTEGER NOT NULL,
+            PRIMARY KEY (symbol, asset_type, interval)
+        ) WITHOUT ROWID''',
+    ]),
+    (4, 'Add asset metadata cache', [
+        '''CREATE TABLE IF NOT EXISTS asset_metadata (
+            symbol TEXT NOT NULL,
+            asset_type TEXT NOT NULL,
+            data TEXT NOT NULL,
+            fetched_at INTEGER NOT NULL,
+            PRIMARY KEY (symbol, asset_type)
+        ) WITHOUT ROWID''',
+    ]),
+    (5, 'Version each user\'s holdings for in-memory valuations', [
+        'ALTER TABLE users ADD COLUMN portfolio_version INTEGER NOT NULL DEFAULT 0',
+    ]),
+    (6, 'Add tax lots and realized P&L, backfilled from transactions', [
+        '''CREATE TABLE IF NOT EXISTS tax_lots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            ticker TEXT NOT NULL,
+            asset_type TEXT NOT NULL,
+            transaction_id INTEGER,
+            quantity REAL NOT NULL,
+            original_quantity REAL NOT NULL,
+            cost_price REAL NOT NULL,
+            opened_at TIMESTAMP NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )''',
+        '''CREATE INDEX IF NOT EXISTS idx_tax_lots_user_ticker
+           ON tax_lots (user_id, ticker, id)''',
+        '''CREATE TABLE IF NOT EXISTS realized_pnl (
+            user_id INTEGER NOT NULL,
+            ticker TEXT NOT NULL,
+            asset_type TEXT NOT NULL,
+            quantity_sold REAL NOT NULL,
+            proceeds REAL NOT NULL,
+            cost_basis REAL NOT NULL,
+            realized_pnl REAL NOT NULL,
+            sells INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, ticker)
+        ) WITHOUT ROWID''',
+        _backfill_tax_lots,
+    ]),
+    (7, 'Add resting limit, stop and stop-limit orders', [
+        '''CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            ticker TEXT NOT NULL,
+            asset_type TEXT NOT NULL,
+            side TEXT NOT NULL,
+            order_type TEXT NOT NULL,
+            quantity REAL NOT NULL,
+            limit_price REAL,
+            stop_price REAL,
+            status TEXT NOT NULL DEFAULT 'open',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            triggered_at TIMESTAMP,
+            closed_at TIMESTAMP,
+            fill_price REAL,
+            transaction_id INTEGER,
+            error TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )''',
+        '''CREATE INDEX IF NOT EXISTS idx_orders_user_status
+           ON orders (user_id, status, id)''',
+        # Only open orders are indexed, so the poller's ticker scan stays small
+        """CREATE INDEX IF NOT EXISTS idx_orders_open_assets
+           ON orders (ticker, asset_type) WHERE status = 'open'""",
+    ]),
+    # Both stores are caches of upstream data, so they are rebuilt empty rather
+    # than copied: rows from before this version cannot be told apart by source
+    (8, 'Key stored bars and asset metadata by market data provider', [
+        'DROP TABLE IF EXISTS market_bars',
+        'DROP TABLE IF EXISTS market_bar_coverage',
+        'DROP TABLE IF EXISTS asset_metadata',
+        '''CREATE TABLE market_bars (
+            provider TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            asset_type TEXT NOT NULL,
+            interval TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            open REAL NOT NULL,
+            high REAL NOT NULL,
+            low REAL NOT NULL,
+            close REAL NOT NULL,
+            volume REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (provider, symbol, asset_type, interval, ts)
+        ) WITHOUT ROWID''',
+        '''CREATE TABLE market_bar_coverage (
+            provider TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            asset_type TEXT NOT NULL,
+            interval TEXT NOT NULL,
+            start_ts INTEGER NOT NULL,
+            end_ts INTEGER NOT NULL,
+            last_read_ts INTEGER NOT NULL,
+            PRIMARY KEY (provider, symbol, asset_type, interval)
+        ) WITHOUT ROWID''',
+        '''CREATE TABLE asset_metadata (
+            provider TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            asset_type TEXT NOT NULL,
+            data TEXT NOT NULL,
+            fetched_at INTEGER NOT NULL,
+            PRIMARY KEY (provider, symbol, asset_type)
+        ) WITHOUT ROWID''',
+    ]),
+    (9, 'Share polled quotes and requested symbols between worker processes', [
+        '''CREATE TABLE IF NOT EXISTS shared_quotes (
+            ticker TEXT NOT NULL,
+            asset_type TEXT NOT NULL,
+            data TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (ticker, asset_type)
+        ) WITHOUT ROWID''',
+        '''CREATE TABLE IF NOT EXISTS quote_interest (
+            ticker TEXT NOT NULL,
+            asset_type TEXT NOT NULL,
+            requested_at REAL NOT NULL,
+            PRIMARY KEY (ticker, asset_type)
+        ) WITHOUT ROWID''',
+    ]),
+]
+
+def get_schema_version(conn=None):
+    """Get the schema version recorded in the database."""
+    conn = conn or get_db_connection()
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def apply_migrations(conn=None):
+    """Apply every migration newer than the database's schema version."""
+    conn = conn or get_db_connection()
+    current = get_schema_version(conn)
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"Applied migration {version}: {description}")
+        current = version
+    conn.execute('PRAGMA optimize')
+    return current
+
+def explain_query_plan(sql, params=()):
+    """Return the EXPLAIN QUERY PLAN detail lines for a query."""
+    conn = get_db_connection()
+    return [row['detail'] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+
 def hash_password(password):
     """Simple password hashing using SHA-256."""
     return hashlib.sha256(password.encode()).hexdigest()
@@ -80,6 +385,7 @@ def verify_password(password, password_hash):
     return hash_password(password) == password_hash
 
 # Database operations for users
+@traced('db')
 def create_user(username, email, password):
     """Create a new user."""
     conn = get_db_connection()
@@ -93,21 +399,32 @@ def create_user(username, email, password):
         )
         conn.commit()
         user_id = cursor.lastrowid
-        conn.close()
         return {'success': True, 'user_id': user_id}
     except sqlite3.IntegrityError as e:
-        conn.close()
+        conn.rollback()
         return {'success': False, 'error': 'Username or email already exists'}
 
+@traced('db')
 def get_user_by_username(username):
     """Get user by username."""
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
     user = cursor.fetchone()
-    conn.close()
     return dict(user) if user else None
 
+@traced('db')
+def get_usernames(user_ids):
+    """Get {user_id: username} for the given ids."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    conn = get_db_connection()
+    placeholders = ','.join('?' * len(user_ids))
+    rows = conn.execute(f'SELECT id, username FROM users WHERE id IN ({placeholders})', user_ids).fetchall()
+    return {row['id']: row['username'] for row in rows}
+
+@traced('db')
 def authenticate_user(username, password):
     """Authenticate a user."""
     user = get_user_by_username(username)
@@ -116,6 +433,14 @@ def authenticate_user(username, password):
     return {'success': False, 'error': 'Invalid credentials'}
 
 # Database operations for portfolio
+
+# Every change to a user's holdings bumps this counter in the same transaction,
+# so in-memory valuations can tell whether they are current (see utils/valuation.py)
+BUMP_PORTFOLIO_VERSION_SQL = (
+    'UPDATE users SET portfolio_version = portfolio_version + 1 WHERE id = ? RETURNING portfolio_version'
+)
+
+@traced('db')
 def add_to_portfolio(user_id, ticker, asset_type, quantity, price):
     """Add or update portfolio holding."""
     conn = get_db_connection()
@@ -145,10 +470,11 @@ def add_to_portfolio(user_id, ticker, asset_type, quantity, price):
             (user_id, ticker, asset_type, quantity, price)
         )
     
+    cursor.execute(BUMP_PORTFOLIO_VERSION_SQL, (user_id,)).fetchall()
     conn.commit()
-    conn.close()
     return {'success': True}
 
+@traced('db')
 def remove_from_portfolio(user_id, ticker, quantity):
     """Remove from portfolio holding."""
     conn = get_db_connection()
@@ -161,11 +487,9 @@ def remove_from_portfolio(user_id, ticker, quantity):
     holding = cursor.fetchone()
     
     if not holding:
-        conn.close()
         return {'success': False, 'error': 'Holding not found'}
     
     if holding['quantity'] < quantity:
-        conn.close()
         return {'success': False, 'error': 'Insufficient quantity'}
     
     new_quantity = holding['quantity'] - quantity
@@ -178,20 +502,176 @@ def remove_from_portfolio(user_id, ticker, quantity):
             (new_quantity, user_id, ticker)
         )
     
+    cursor.execute(BUMP_PORTFOLIO_VERSION_SQL, (user_id,)).fetchall()
     conn.commit()
-    conn.close()
     return {'success': True}
 
+@traced('db')
 def get_user_portfolio(user_id):
     """Get all holdings for a user."""
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM portfolio WHERE user_id = ?', (user_id,))
     holdings = cursor.fetchall()
-    conn.close()
     return [dict(row) for row in holdings]
 
+@traced('db')
+def get_portfolio_version(user_id):
+    """Get the user's holdings version (0 if the user does not exist)."""
+    conn = get_db_connection()
+    row = conn.execute('SELECT portfolio_version FROM users WHERE id = ?', (user_id,)).fetchone()
+    return row[0] if row else 0
+
+@traced('db')
+def get_portfolio_versions(user_ids):
+    """Get {user_id: holdings version} for the given ids."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    conn = get_db_connection()
+    placeholders = ','.join('?' * len(user_ids))
+    rows = conn.execute(f'SELECT id, portfolio_version FROM users WHERE id IN ({placeholders})', user_ids).fetchall()
+    return {row['id']: row['portfolio_version'] for row in rows}
+
+@traced('db')
+def get_portfolio_state(user_id):
+    """Get (version, holdings) for a user from one consistent read."""
+    conn = get_db_connection()
+    conn.execute('BEGIN')
+    try:
+        row = conn.execute('SELECT portfolio_version FROM users WHERE id = ?', (user_id,)).fetchone()
+        holdings = conn.execute('SELECT * FROM portfolio WHERE user_id = ?', (user_id,)).fetchall()
+    finally:
+        conn.commit()
+    return (row[0] if row else 0), [dict(holding) for holding in holdings]
+
+# Quantities at or below this are treated as a closed position
+QUANTITY_EPSILON = 1e-9
+
+def _apply_trade(conn, user_id, ticker, asset_type, transaction_type, quantity, price):
+    """
+    Apply a buy or sell inside the caller's IMMEDIATE transaction.
+
+    The holding is updated with a single upsert (buy) or a guarded UPDATE
+    (sell), so concurrent sells cannot both pass the quantity check. Buys
+    open a tax lot and sells consume lots in ledger.LOT_METHOD order, which
+    also resets the holding's average price to the cost of what is left.
+    A rejected sell writes nothing.
+    """
+    realized = None
+    if transaction_type == 'buy':
+        position = conn.execute(
+            '''INSERT INTO portfolio (user_id, ticker, asset_type, quantity, avg_buy_price)
+               VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(user_id, ticker) DO UPDATE SET
+                   quantity = portfolio.quantity + excluded.quantity,
+                   avg_buy_price = (portfolio.avg_buy_price * portfolio.quantity +
+                                    excluded.avg_buy_price * excluded.quantity) /
+                                   (portfolio.quantity + excluded.quantity)
+               RETURNING id, quantity, avg_buy_price''',
+            (user_id, ticker, asset_type, quantity, price)
+        ).fetchone()
+    else:
+        position = conn.execute(
+            '''UPDATE portfolio SET quantity = quantity - ?
+               WHERE user_id = ? AND ticker = ? AND quantity >= ? - ?
+               RETURNING id, quantity, avg_buy_price''',
+            (quantity, user_id, ticker, quantity, QUANTITY_EPSILON)
+        ).fetchone()
+        if position is None:
+            exists = conn.execute(
+                'SELECT 1 FROM portfolio WHERE user_id = ? AND ticker = ?',
+                (user_id, ticker)
+            ).fetchone()
+            error = 'Insufficient quantity' if exists else 'Holding not found'
+            return {'success': False, 'error': error}
+        avg_buy_price = position['avg_buy_price']
+        realized, _ = ledger.close_lots(conn, user_id, ticker, asset_type, quantity, price, avg_buy_price)
+        if position['quantity'] <= QUANTITY_EPSILON:
+            conn.execute(
+                'DELETE FROM portfolio WHERE user_id = ? AND ticker = ?',
+                (user_id, ticker)
+            )
+            ledger.drop_lots(conn, user_id, ticker)
+        else:
+            lot_quantity, lot_cost = ledger.open_cost(conn, user_id, ticker)
+            if abs(lot_quantity - position['quantity']) <= QUANTITY_EPSILON:
+                avg_buy_price = lot_cost / lot_quantity
+                conn.execute(
+                    'UPDATE portfolio SET avg_buy_price = ? WHERE user_id = ? AND ticker = ?',
+                    (avg_buy_price, user_id, ticker)
+                )
+
+    transaction_id = conn.execute(
+        'INSERT INTO transactions (user_id, ticker, asset_type, transaction_type, quantity, price) VALUES (?, ?, ?, ?, ?, ?)',
+        (user_id, ticker, asset_type, transaction_type, quantity, price)
+    ).lastrowid
+    if transaction_type == 'buy':
+        avg_buy_price = position['avg_buy_price']
+        ledger.open_lot(conn, user_id, ticker, asset_type, transaction_id, quantity, price)
+    version = conn.execute(BUMP_PORTFOLIO_VERSION_SQL, (user_id,)).fetchone()
+
+    new_quantity = float(position['quantity']) if position['quantity'] > QUANTITY_EPSILON else 0.0
+    result = {
+        'success': True,
+        'version': version[0] if version else 0,
+        'transaction_id': transaction_id,
+        'position': {
+            'id': position['id'],
+            'ticker': ticker,
+            'asset_type': asset_type,
+            'quantity': new_quantity,
+            'avg_buy_price': float(avg_buy_price) if new_quantity else 0.0
+        }
+    }
+    if realized is not None:
+        result['realized_pnl'] = realized
+    return result
+
+@traced('db')
+def execute_trade(user_id, ticker, asset_type, transaction_type, quantity, price):
+    """
+    Apply a buy or sell and record its transaction in one IMMEDIATE transaction.
+
+    Returns the resulting position, the user's new holdings version and,
+    for sells, the realized P&L (see _apply_trade).
+    """
+    conn = get_db_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        result = _apply_trade(conn, user_id, ticker, asset_type, transaction_type, quantity, price)
+        if result['success']:
+            conn.commit()
+        else:
+            conn.rollback()
+    except Exception:
+        conn.rollback()
+        raise
+    return result
+
+@traced('db')
+def get_held_assets():
+    """Get every distinct (ticker, asset_type) held by any user."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT DISTINCT ticker, asset_type FROM portfolio')
+    assets = cursor.fetchall()
+    return [(row['ticker'], row['asset_type']) for row in assets]
+
+def iter_all_holdings():
+    """Yield (user_id, ticker, asset_type, quantity) for every holding, grouped by user."""
+    conn = get_db_connection()
+    # Plain tuples: this walks every holding for snapshots and leaderboard re-ranks
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    yield from cursor.execute(
+        'SELECT user_id, ticker, asset_type, quantity FROM portfolio ORDER BY user_id'
+    )
+
 # Database operations for transactions
+USER_TRANSACTIONS_SQL = 'SELECT * FROM transactions WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?'
+
+@traced('db')
 def add_transaction(user_id, ticker, asset_type, transaction_type, quantity, price):
     """Record a transaction."""
     conn = get_db_connection()
@@ -201,47 +681,330 @@ def add_transaction(user_id, ticker, asset_type, transaction_type, quantity, pri
         (user_id, ticker, asset_type, transaction_type, quantity, price)
     )
     conn.commit()
-    conn.close()
     return {'success': True}
 
+@traced('db')
 def get_user_transactions(user_id, limit=50):
     """Get transaction history for a user."""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute(
-        'SELECT * FROM transactions WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?',
-        (user_id, limit)
-    )
+    cursor.execute(USER_TRANSACTIONS_SQL, (user_id, limit))
     transactions = cursor.fetchall()
-    conn.close()
     return [dict(row) for row in transactions]
 
+# Tax-lot ledger reads (lots and realized_pnl are maintained by execute_trade)
+USER_LOTS_SQL = '''SELECT id, ticker, asset_type, transaction_id, quantity, original_quantity, cost_price, opened_at
+           FROM tax_lots WHERE user_id = ? ORDER BY ticker, id'''
+
+USER_TICKER_LOTS_SQL = '''SELECT id, ticker, asset_type, transaction_id, quantity, original_quantity, cost_price, opened_at
+           FROM tax_lots WHERE user_id = ? AND ticker = ? ORDER BY id'''
+
+USER_REALIZED_SQL = '''SELECT ticker, asset_type, quantity_sold, proceeds, cost_basis, realized_pnl, sells, updated_at
+           FROM realized_pnl WHERE user_id = ? ORDER BY ticker'''
+
+@traced('db')
+def get_user_lots(user_id, ticker=None):
+    """Get a user's open tax lots, oldest first within each ticker."""
+    conn = get_db_connection()
+    if ticker:
+        rows = conn.execute(USER_TICKER_LOTS_SQL, (user_id, ticker)).fetchall()
+    else:
+        rows = conn.execute(USER_LOTS_SQL, (user_id,)).fetchall()
+    return [dict(row) for row in rows]
+
+@traced('db')
+def get_realized_pnl(user_id):
+    """Get a user's cumulative realized P&L per ticker."""
+    conn = get_db_connection()
+    rows = conn.execute(USER_REALIZED_SQL, (user_id,)).fetchall()
+    return [dict(row) for row in rows]
+
+# Resting orders (triggered and filled by the order engine)
+ORDER_TYPES = ('limit', 'stop', 'stop_limit')
+ORDER_STATUSES = ('open', 'filled', 'cancelled', 'rejected')
+
+USER_ORDERS_SQL = 'SELECT * FROM orders WHERE user_id = ? ORDER BY id DESC LIMIT ?'
+
+USER_ORDERS_BY_STATUS_SQL = 'SELECT * FROM orders WHERE user_id = ? AND status = ? ORDER BY id DESC LIMIT ?'
+
+# Rowid range scan: the engine only ever asks for orders newer than its last sync
+OPEN_ORDERS_SQL = '''SELECT id, ticker, asset_type, side, order_type, limit_price, stop_price, triggered_at
+           FROM orders WHERE id > ? AND status = 'open' ORDER BY id'''
+
+OPEN_ORDER_ASSETS_SQL = "SELECT DISTINCT ticker, asset_type FROM orders WHERE status = 'open'"
+
+@traced('db')
+def create_order(user_id, ticker, asset_type, side, order_type, quantity, limit_price=None, stop_price=None):
+    """Place a resting order; sells must be covered by the current holding."""
+    conn = get_db_connection()
+    if side == 'sell':
+        holding = conn.execute(
+            'SELECT quantity FROM portfolio WHERE user_id = ? AND ticker = ?',
+            (user_id, ticker)
+        ).fetchone()
+        if not holding:
+            return {'success': False, 'error': 'Holding not found'}
+        if holding['quantity'] < quantity - QUANTITY_EPSILON:
+            return {'success': False, 'error': 'Insufficient quantity'}
+    order = conn.execute(
+        '''INSERT INTO orders (user_id, ticker, asset_type, side, order_type, quantity, limit_price, stop_price)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?) RETURNING *''',
+        (user_id, ticker, asset_type, side, order_type, quantity, limit_price, stop_price)
+    ).fetchone()
+    conn.commit()
+    return {'success': True, 'order': dict(order)}
+
+@traced('db')
+def cancel_order(user_id, order_id):
+    """Cancel one of a user's open orders."""
+    conn = get_db_connection()
+    order = conn.execute(
+        '''UPDATE orders SET status = 'cancelled', closed_at = CURRENT_TIMESTAMP
+           WHERE id = ? AND user_id = ? AND status = 'open' RETURNING *''',
+        (order_id, user_id)
+    ).fetchone()
+    conn.commit()
+    if order:
+        return {'success': True, 'order': dict(order)}
+    exists = conn.execute(
+        'SELECT status FROM orders WHERE id = ? AND user_id = ?', (order_id, user_id)
+    ).fetchone()
+    if not exists:
+        return {'success': False, 'error': 'Order not found'}
+    return {'success': False, 'error': f"Order is already {exists['status']}"}
+
+@traced('db')
+def get_user_orders(user_id, status=None, limit=100):
+    """Get a user's orders, newest first, optionally only those with one status."""
+    conn = get_db_connection()
+    if status:
+        rows = conn.execute(USER_ORDERS_BY_STATUS_SQL, (user_id, status, limit)).fetchall()
+    else:
+        rows = conn.execute(USER_ORDERS_SQL, (user_id, limit)).fetchall()
+    return [dict(row) for row in rows]
+
+@traced('db')
+def get_open_order_assets():
+    """Get every distinct (ticker, asset_type) with an open order."""
+    conn = get_db_connection()
+    return [(row['ticker'], row['asset_type']) for row in conn.execute(OPEN_ORDER_ASSETS_SQL)]
+
+def iter_open_orders(after_id=0):
+    """Yield open orders newer than after_id as plain tuples (see OPEN_ORDERS_SQL), oldest first."""
+    conn = get_db_connection()
+    # Plain tuples: the order engine loads every resting order at startup
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    yield from cursor.execute(OPEN_ORDERS_SQL, (after_id,))
+
+@traced('db')
+def mark_orders_triggered(order_ids):
+    """Record that stop-limit orders hit their stop and now rest as limit orders."""
+    conn = get_db_connection()
+    conn.executemany(
+        "UPDATE orders SET triggered_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'open'",
+        [(order_id,) for order_id in order_ids]
+    )
+    conn.commit()
+
+@traced('db')
+def fill_orders(fills):
+    """
+    Execute triggered orders, given as [(order_id, price)], in one IMMEDIATE transaction.
+
+    Each order is claimed only if it is still open, so orders cancelled
+    since they triggered are skipped. Every trade goes through _apply_trade,
+    the same writes as a market trade; an order the holding can no longer
+    cover is marked rejected. Returns one trade result per order claimed,
+    with the order's fields added.
+    """
+    conn = get_db_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    results = []
+    try:
+        for order_id, price in fills:
+            order = conn.execute(
+                "SELECT user_id, ticker, asset_type, side, quantity FROM orders WHERE id = ? AND status = 'open'",
+                (order_id,)
+            ).fetchone()
+            if order is None:
+                continue
+            result = _apply_trade(conn, order['user_id'], order['ticker'], order['asset_type'],
+                                  order['side'], order['quantity'], price)
+            if result['success']:
+                conn.execute(
+                    '''UPDATE orders SET status = 'filled', fill_price = ?, transaction_id = ?,
+                           closed_at = CURRENT_TIMESTAMP WHERE id = ?''',
+                    (price, result['transaction_id'], order_id)
+                )
+            else:
+                conn.execute(
+                    "UPDATE orders SET status = 'rejected', error = ?, closed_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (result['error'], order_id)
+                )
+            result.update(order_id=order_id, price=price, **dict(order))
+            results.append(result)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return results
+
+# Buys put money into the portfolio and sells take it out
+USER_CASH_FLOWS_SQL = '''SELECT timestamp,
+               CASE transaction_type WHEN 'buy' THEN quantity * price ELSE -quantity * price END AS amount
+           FROM transactions
+           WHERE user_id = ?
+           AND timestamp > datetime('now', '-' || ? || ' hours')
+           ORDER BY timestamp ASC'''
+
+@traced('db')
+def get_user_cash_flows(user_id, hours=24):
+    """Get (timestamp, signed amount) for every trade in a time period, oldest first."""
+    conn = get_db_connection()
+    rows = conn.execute(USER_CASH_FLOWS_SQL, (user_id, hours)).fetchall()
+    return [(row['timestamp'], row['amount']) for row in rows]
+
 # Database operations for portfolio snapshots
+USER_SNAPSHOTS_SQL = '''SELECT * FROM portfolio_snapshots 
+           WHERE user_id = ? 
+           AND timestamp > datetime('now', '-' || ? || ' hours')
+           ORDER BY timestamp ASC'''
+
+# Rollup resolutions in seconds and how long each is kept (0 = forever)
+ROLLUP_RESOLUTIONS = (300, 3600, 86400)
+SNAPSHOT_RETENTION_DAYS = {
+    'raw': float(os.environ.get('SNAPSHOT_RAW_RETENTION_DAYS', 7)),
+    300: float(os.environ.get('ROLLUP_5M_RETENTION_DAYS', 7)),
+    3600: float(os.environ.get('ROLLUP_1H_RETENTION_DAYS', 180)),
+    86400: float(os.environ.get('ROLLUP_1D_RETENTION_DAYS', 0)),
+}
+
+def _bucket_start(timestamp, resolution):
+    """Floor a 'YYYY-MM-DD HH:MM:SS' UTC timestamp to the start of its bucket."""
+    epoch = calendar.timegm(time.strptime(timestamp, '%Y-%m-%d %H:%M:%S'))
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(epoch - epoch % resolution))
+
 def add_portfolio_snapshot(user_id, total_value):
     """Add a portfolio value snapshot."""
+    return add_portfolio_snapshots([(user_id, total_value)])
+
+@traced('db')
+def add_portfolio_snapshots(snapshots, timestamp=None):
+    """
+    Add many portfolio value snapshots and update their rollups in one transaction.
+
+    snapshots: iterable of (user_id, total_value) pairs
+    timestamp: 'YYYY-MM-DD HH:MM:SS' UTC shared by every row, defaults to now
+    """
+    timestamp = timestamp or datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    snapshots = list(snapshots)
+    conn = get_db_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        cursor = conn.executemany(
+            'INSERT INTO portfolio_snapshots (user_id, total_value, timestamp) VALUES (?, ?, ?)',
+            ((user_id, total_value, timestamp) for user_id, total_value in snapshots)
+        )
+        count = cursor.rowcount
+        for resolution in ROLLUP_RESOLUTIONS:
+            bucket = _bucket_start(timestamp, resolution)
+            conn.executemany(
+                '''INSERT INTO portfolio_rollups
+                       (user_id, resolution, bucket, open, high, low, close, samples)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+                   ON CONFLICT(user_id, resolution, bucket) DO UPDATE SET
+                       high = max(high, excluded.high),
+                       low = min(low, excluded.low),
+                       close = excluded.close,
+                       samples = samples + 1''',
+                ((user_id, resolution, bucket, value, value, value, value)
+                 for user_id, value in snapshots)
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {'success': True, 'count': count}
+
+@traced('db')
+def prune_snapshots(now=None):
+    """Delete raw snapshots and rollups older than their retention. Returns rows deleted."""
+    now = now or time.time()
+    conn = get_db_connection()
+    deleted = 0
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        days = SNAPSHOT_RETENTION_DAYS['raw']
+        if days > 0:
+            cutoff = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(now - days * 86400))
+            # Snapshots can be written with an older explicit timestamp, so ids are not in time order
+            cursor = conn.execute('DELETE FROM portfolio_snapshots WHERE timestamp < ?', (cutoff,))
+            deleted += cursor.rowcount
+
+        for resolution in ROLLUP_RESOLUTIONS:
+            days = SNAPSHOT_RETENTION_DAYS[resolution]
+            if days <= 0:
+                continue
+            cutoff = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(now - days * 86400))
+            cursor = conn.execute(
+                'DELETE FROM portfolio_rollups WHERE resolution = ? AND bucket < ?',
+                (resolution, cutoff)
+            )
+            deleted += cursor.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return deleted
+
+def pick_snapshot_resolution(hours, points):
+    """
+    Pick the coarsest resolution that still gives about `points` points over
+    `hours`, among those whose retention covers the range. Returns a rollup
+    resolution in seconds, or 'raw'.
+    """
+    span = hours * 3600
+    candidates = [
+        resolution for resolution in reversed(ROLLUP_RESOLUTIONS)
+        if SNAPSHOT_RETENTION_DAYS[resolution] <= 0 or SNAPSHOT_RETENTION_DAYS[resolution] * 86400 >= span
+    ]
+    for resolution in candidates:
+        # Accept a resolution that lands within 25% under the target
+        if span / resolution >= points * 0.75:
+            return resolution
+    raw_days = SNAPSHOT_RETENTION_DAYS['raw']
+    if raw_days <= 0 or raw_days * 86400 >= span or not candidates:
+        return 'raw'
+    return candidates[-1]
+
+USER_ROLLUPS_SQL = '''SELECT bucket AS timestamp, open, high, low, close, close AS total_value, samples
+           FROM portfolio_rollups
+           WHERE user_id = ? AND resolution = ?
+           AND bucket > datetime('now', '-' || ? || ' hours', '-' || ? || ' seconds')
+           ORDER BY bucket ASC'''
+
+@traced('db')
+def get_portfolio_value_history(user_id, hours=24, points=200):
+    """Get portfolio value points at the coarsest resolution giving about `points` points."""
+    resolution = pick_snapshot_resolution(hours, points)
+    if resolution == 'raw':
+        return {'resolution': 'raw', 'snapshots': get_portfolio_snapshots(user_id, hours)}
+
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute(
-        'INSERT INTO portfolio_snapshots (user_id, total_value) VALUES (?, ?)',
-        (user_id, total_value)
-    )
-    conn.commit()
-    conn.close()
-    return {'success': True}
+    cursor.execute(USER_ROLLUPS_SQL, (user_id, resolution, hours, resolution))
+    rows = cursor.fetchall()
+    return {'resolution': resolution, 'snapshots': [dict(row) for row in rows]}
 
+@traced('db')
 def get_portfolio_snapshots(user_id, hours=24):
     """Get portfolio snapshots for a time period."""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute(
-        '''SELECT * FROM portfolio_snapshots 
-           WHERE user_id = ? 
-           AND timestamp > datetime('now', '-' || ? || ' hours')
-           ORDER BY timestamp ASC''',
-        (user_id, hours)
-    )
+    cursor.execute(USER_SNAPSHOTS_SQL, (user_id, hours))
     snapshots = cursor.fetchall()
-    conn.close()
     return [dict(row) for row in snapshots]
 
 if __name__ == '__main__':
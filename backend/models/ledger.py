@@ -0,0 +1,279 @@
+"""
+Tax-lot ledger engine.
+
+Every buy opens a lot and every sell consumes open lots in LOT_METHOD
+order, adding the gain over the consumed cost to realized_pnl. The
+functions here run inside the caller's transaction (see execute_trade), so
+lots, holdings and transactions always change together.
+"""
+
+import os
+import time
+
+# Order in which sells consume open lots: fifo, lifo or hifo (highest cost first)
+LOT_METHOD = os.environ.get('LOT_METHOD', 'fifo').strip().lower()
+
+LOT_ORDER_SQL = {
+    'fifo': 'id ASC',
+    'lifo': 'id DESC',
+    'hifo': 'cost_price DESC, id ASC',
+}
+
+if LOT_METHOD not in LOT_ORDER_SQL:
+    raise ValueError(f"Unknown LOT_METHOD '{LOT_METHOD}', expected one of {', '.join(LOT_ORDER_SQL)}")
+
+# Lot remainders at or below this are treated as fully consumed
+LOT_EPSILON = 1e-9
+
+# Rows buffered by the backfill before each executemany
+BACKFILL_BATCH_SIZE = 5000
+
+REALIZED_UPSERT_SQL = '''INSERT INTO realized_pnl
+           (user_id, ticker, asset_type, quantity_sold, proceeds, cost_basis, realized_pnl, sells)
+       VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+       ON CONFLICT(user_id, ticker) DO UPDATE SET
+           quantity_sold = quantity_sold + excluded.quantity_sold,
+           proceeds = proceeds + excluded.proceeds,
+           cost_basis = cost_basis + excluded.cost_basis,
+           realized_pnl = realized_pnl + excluded.realized_pnl,
+           sells = sells + excluded.sells,
+           updated_at = CURRENT_TIMESTAMP'''
+
+# Read in index order, so the backfill streams without a temp sort
+BACKFILL_TRANSACTIONS_SQL = '''SELECT id, user_id, ticker, asset_type, transaction_type, quantity, price, timestamp
+           FROM transactions ORDER BY user_id, timestamp, id'''
+
+LOT_INSERT_SQL = '''INSERT INTO tax_lots
+           (user_id, ticker, asset_type, transaction_id, quantity, original_quantity, cost_price, opened_at)
+       VALUES (?, ?, ?, ?, ?, ?, ?, ?)'''
+
+
+def order_lots(lots, method=None):
+    """Return in-memory lots ([id, quantity, cost_price, ...], oldest first) in consumption order."""
+    method = method or LOT_METHOD
+    if method == 'lifo':
+        return lots[::-1]
+    if method == 'hifo':
+        return sorted(lots, key=lambda lot: -lot[2])
+    return lots
+
+
+def consume_lots(lots, quantity):
+    """
+    Take quantity from lots in the order given.
+
+    Returns ([(lot, taken)], consumed cost, unmatched quantity), where the
+    unmatched quantity is what the lots could not cover.
+    """
+    taken = []
+    cost = 0.0
+    remaining = quantity
+    for lot in lots:
+        if remaining <= LOT_EPSILON:
+            break
+        take = min(lot[1], remaining)
+        taken.append((lot, take))
+        cost += take * lot[2]
+        remaining -= take
+    return taken, cost, remaining if remaining > LOT_EPSILON else 0.0
+
+
+def open_lot(conn, user_id, ticker, asset_type, transaction_id, quantity, price):
+    """Open a lot for a buy."""
+    conn.execute(
+        LOT_INSERT_SQL,
+        (user_id, ticker, asset_type, transaction_id, quantity, quantity, price,
+         time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()))
+    )
+
+
+def close_lots(conn, user_id, ticker, asset_type, quantity, price, fallback_cost, method=None):
+    """
+    Consume lots for a sell and add the result to realized_pnl.
+
+    Quantity the lots cannot cover is costed at fallback_cost (the holding's
+    average price). Returns (realized P&L, consumed cost).
+    """
+    rows = conn.execute(
+        f'''SELECT id, quantity, cost_price FROM tax_lots
+            WHERE user_id = ? AND ticker = ? ORDER BY {LOT_ORDER_SQL[method or LOT_METHOD]}''',
+        (user_id, ticker)
+    ).fetchall()
+    taken, cost, unmatched = consume_lots([list(row) for row in rows], quantity)
+    cost += unmatched * fallback_cost
+
+    emptied = [(lot[0],) for lot, take in taken if lot[1] - take <= LOT_EPSILON]
+    reduced = [(lot[1] - take, lot[0]) for lot, take in taken if lot[1] - take > LOT_EPSILON]
+    if emptied:
+        conn.executemany('DELETE FROM tax_lots WHERE id = ?', emptied)
+    if reduced:
+        conn.executemany('UPDATE tax_lots SET quantity = ? WHERE id = ?', reduced)
+
+    proceeds = quantity * price
+    realized = proceeds - cost
+    conn.execute(REALIZED_UPSERT_SQL, (user_id, ticker, asset_type, quantity, proceeds, cost, realized, 1))
+    return realized, cost
+
+
+def open_cost(conn, user_id, ticker):
+    """Return (quantity, cost) still held in open lots."""
+    row = conn.execute(
+        'SELECT COALESCE(SUM(quantity), 0), COALESCE(SUM(quantity * cost_price), 0) FROM tax_lots WHERE user_id = ? AND ticker = ?',
+        (user_id, ticker)
+    ).fetchone()
+    return row[0], row[1]
+
+
+def drop_lots(conn, user_id, ticker):
+    """Delete any lot remainders left after a position is closed."""
+    conn.execute('DELETE FROM tax_lots WHERE user_id = ? AND ticker = ?', (user_id, ticker))
+
+
+def _reconcile(conn, user_id, open_lots, now, method):
+    """
+    Match a user's replayed lots to their portfolio rows.
+
+    History that no longer adds up to the current holding (positions from
+    before transactions were recorded, float dust) is fixed by trimming
+    lots or adding one lot at the holding's average price. Returns
+    (lot rows, avg price updates, lots adjusted).
+    """
+    holdings = {
+        row[0]: row for row in conn.execute(
+            'SELECT ticker, asset_type, quantity, avg_buy_price FROM portfolio WHERE user_id = ?', (user_id,)
+        )
+    }
+    lot_rows = []
+    avg_updates = []
+    adjusted = 0
+    for (ticker, asset_type), lots in open_lots.items():
+        holding = holdings.pop(ticker, None)
+        target = holding[2] if holding else 0.0
+        held = sum(lot[1] for lot in lots)
+        if held > target + LOT_EPSILON:
+            for lot, take in consume_lots(order_lots(lots, method), held - target)[0]:
+                lot[1] -= take
+            adjusted += 1
+        elif target > held + LOT_EPSILON:
+            lots.append([None, target - held, holding[3], now, None])
+            adjusted += 1
+        lots = [lot for lot in lots if lot[1] > LOT_EPSILON]
+        for lot in lots:
+            lot_rows.append((user_id, ticker, asset_type, lot[0], lot[1], lot[4] or lot[1], lot[2], lot[3]))
+        if holding and lots:
+            avg_updates.append((sum(lot[1] * lot[2] for lot in lots) / sum(lot[1] for lot in lots), user_id, ticker))
+    for ticker, asset_type, quantity, avg_buy_price in holdings.values():
+        lot_rows.append((user_id, ticker, asset_type, None, quantity, quantity, avg_buy_price, now))
+        adjusted += 1
+    return lot_rows, avg_updates, adjusted
+
+
+def backfill_ledger(conn, method=None):
+    """
+    Rebuild tax_lots and realized_pnl from the transactions table.
+
+    Transactions are streamed in (user_id, timestamp) order straight off
+    idx_transactions_user_time, so only the current user's open lots are
+    held in memory and the table is read once. Runs inside the caller's
+    transaction. Holding averages are reset to the cost of the open lots.
+    Returns a report dict.
+    """
+    method = method or LOT_METHOD
+    conn.execute('DELETE FROM tax_lots')
+    conn.execute('DELETE FROM realized_pnl')
+    now = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+    report = {'method': method, 'transactions': 0, 'users': 0, 'lots': 0,
+              'realized_rows': 0, 'unmatched_quantity': 0.0, 'adjusted': 0}
+    lot_rows = []
+    realized_rows = []
+    avg_updates = []
+
+    def flush(force=False):
+        if lot_rows and (force or len(lot_rows) >= BACKFILL_BATCH_SIZE):
+            conn.executemany(LOT_INSERT_SQL, lot_rows)
+            report['lots'] += len(lot_rows)
+            lot_rows.clear()
+        if realized_rows and (force or len(realized_rows) >= BACKFILL_BATCH_SIZE):
+            conn.executemany(REALIZED_UPSERT_SQL, realized_rows)
+            report['realized_rows'] += len(realized_rows)
+            realized_rows.clear()
+        if avg_updates and (force or len(avg_updates) >= BACKFILL_BATCH_SIZE):
+            conn.executemany('UPDATE portfolio SET avg_buy_price = ? WHERE user_id = ? AND ticker = ?', avg_updates)
+            # Let in-memory valuations of a running server reload these users
+            conn.executemany('UPDATE users SET portfolio_version = portfolio_version + 1 WHERE id = ?',
+                             [(user_id,) for user_id in {update[1] for update in avg_updates}])
+            avg_updates.clear()
+
+    def finish_user(user_id, open_lots, realized):
+        rows, updates, adjusted = _reconcile(conn, user_id, open_lots, now, method)
+        lot_rows.extend(rows)
+        avg_updates.extend(updates)
+        report['adjusted'] += adjusted
+        for (ticker, asset_type), (sold, proceeds, cost, sells) in realized.items():
+            realized_rows.append((user_id, ticker, asset_type, sold, proceeds, cost, proceeds - cost, sells))
+        report['users'] += 1
+        flush()
+
+    current_user = None
+    open_lots = {}
+    realized = {}
+    cursor = conn.execute(BACKFILL_TRANSACTIONS_SQL)
+    for tx_id, user_id, ticker, asset_type, tx_type, quantity, price, timestamp in cursor:
+        if user_id != current_user:
+            if current_user is not None:
+                finish_user(current_user, open_lots, realized)
+            current_user, open_lots, realized = user_id, {}, {}
+        report['transactions'] += 1
+        key = (ticker, asset_type)
+        lots = open_lots.setdefault(key, [])
+        if tx_type == 'buy':
+            # [transaction id, remaining, cost price, opened at, original quantity]
+            lots.append([tx_id, quantity, price, timestamp, quantity])
+            continue
+        taken, cost, unmatched = consume_lots(order_lots(lots, method), quantity)
+        for lot, take in taken:
+            lot[1] -= take
+        open_lots[key] = [lot for lot in lots if lot[1] > LOT_EPSILON]
+        # Sells with no recorded buys behind them realize nothing
+        cost += unmatched * price
+        report['unmatched_quantity'] += unmatched
+        totals = realized.setdefault(key, [0.0, 0.0, 0.0, 0])
+        totals[0] += quantity
+        totals[1] += quantity * price
+        totals[2] += cost
+        totals[3] += 1
+    if current_user is not None:
+        finish_user(current_user, open_lots, realized)
+
+    # Holdings of users who have no transactions at all
+    orphans = conn.execute(
+        '''SELECT user_id, ticker, asset_type, quantity, avg_buy_price FROM portfolio p
+           WHERE NOT EXISTS (SELECT 1 FROM transactions t WHERE t.user_id = p.user_id)'''
+    ).fetchall()
+    for user_id, ticker, asset_type, quantity, avg_buy_price in orphans:
+        lot_rows.append((user_id, ticker, asset_type, None, quantity, quantity, avg_buy_price, now))
+        report['adjusted'] += 1
+    flush(force=True)
+    report['unmatched_quantity'] = round(report['unmatched_quantity'], 9)
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+    from backend.models.database import get_db_connection, init_db
+
+    parser = argparse.ArgumentParser(description='Rebuild tax lots and realized P&L from transaction history.')
+    parser.add_argument('--method', default=LOT_METHOD, choices=sorted(LOT_ORDER_SQL))
+    args = parser.parse_args()
+
+    init_db()
+    conn = get_db_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        started = time.perf_counter()
+        result = backfill_ledger(conn, args.method)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    print(f"Backfilled in {time.perf_counter() - started:.2f}s: {result}")
@@ -0,0 +1,28 @@
+import json
+import time
+
+from backend.models.database import get_db_connection
+from backend.utils.metrics import traced
+
+@traced('db')
+def get_metadata(provider, symbol, asset_type):
+    """Get (data, fetched_at) for an asset cached from provider, or (None, None)."""
+    conn = get_db_connection()
+    row = conn.execute(
+        'SELECT data, fetched_at FROM asset_metadata WHERE provider = ? AND symbol = ? AND asset_type = ?',
+        (provider, symbol, asset_type)
+    ).fetchone()
+    if row is None:
+        return None, None
+    return json.loads(row['data']), row['fetched_at']
+
+@traced('db')
+def save_metadata(provider, symbol, asset_type, data, fetched_at=None):
+    """Insert or replace the metadata cached from provider for an asset."""
+    conn = get_db_connection()
+    conn.execute(
+        '''INSERT OR REPLACE INTO asset_metadata (provider, symbol, asset_type, data, fetched_at)
+           VALUES (?, ?, ?, ?, ?)''',
+        (provider, symbol, asset_type, json.dumps(data), int(fetched_at or time.time()))
+    )
+    conn.commit()
@@ -0,0 +1,51 @@
+import json
+import time
+
+from backend.models.database import get_db_connection
+from backend.utils.metrics import traced
+
+@traced('db')
+def save_shared_quotes(results, updated_at=None):
+    """Publish polled quotes, keyed by (ticker, asset_type), to the other worker processes."""
+    updated_at = updated_at or time.time()
+    conn = get_db_connection()
+    conn.executemany(
+        '''INSERT OR REPLACE INTO shared_quotes (ticker, asset_type, data, updated_at)
+           VALUES (?, ?, ?, ?)''',
+        ((ticker, asset_type, json.dumps(result), updated_at) for (ticker, asset_type), result in results.items())
+    )
+    conn.commit()
+
+@traced('db')
+def get_shared_quotes(since):
+    """Get quotes published after since as ({(ticker, asset_type): result}, newest updated_at)."""
+    conn = get_db_connection()
+    rows = conn.execute(
+        'SELECT ticker, asset_type, data, updated_at FROM shared_quotes WHERE updated_at > ?', (since,)
+    ).fetchall()
+    newest = max((row['updated_at'] for row in rows), default=since)
+    return {(row['ticker'], row['asset_type']): json.loads(row['data']) for row in rows}, newest
+
+@traced('db')
+def record_quote_interest(requested):
+    """Record when this process last read each symbol, as {(ticker, asset_type): epoch seconds}."""
+    conn = get_db_connection()
+    conn.executemany(
+        '''INSERT INTO quote_interest (ticker, asset_type, requested_at) VALUES (?, ?, ?)
+           ON CONFLICT(ticker, asset_type) DO UPDATE SET
+               requested_at = max(requested_at, excluded.requested_at)''',
+        ((ticker, asset_type, at) for (ticker, asset_type), at in requested.items())
+    )
+    conn.commit()
+
+@traced('db')
+def get_quote_interest(idle_seconds, limit):
+    """Get the symbols any process read within idle_seconds, most recent first, and forget older ones."""
+    cutoff = time.time() - idle_seconds
+    conn = get_db_connection()
+    conn.execute('DELETE FROM quote_interest WHERE requested_at < ?', (cutoff,))
+    rows = conn.execute(
+        'SELECT ticker, asset_type FROM quote_interest ORDER BY requested_at DESC LIMIT ?', (limit,)
+    ).fetchall()
+    conn.commit()
+    return [(row['ticker'], row['asset_type']) for row in rows]
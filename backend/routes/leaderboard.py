@@ -0,0 +1,55 @@
+from flask import Blueprint, request, jsonify, session
+from backend.models.database import get_user_by_username, get_usernames
+from backend.routes.portfolio import require_auth
+from backend.utils.leaderboard import leaderboard
+
+leaderboard_bp = Blueprint('leaderboard', __name__)
+
+def with_usernames(entries):
+    """Add usernames to ranking entries with one query."""
+    names = get_usernames(entry['user_id'] for entry in entries)
+    for entry in entries:
+        entry['username'] = names.get(entry['user_id'])
+    return entries
+
+def rank_response(user_id):
+    """Build the rank response for one user, with an optional window around them."""
+    window = max(request.args.get('window', 0, type=int), 0)
+    result = leaderboard.rank(user_id, window)
+    if result is None:
+        return jsonify({'success': True, 'ranked': False, 'total_users': leaderboard.size()}), 200
+    if 'window' in result:
+        with_usernames(result['window'])
+    return jsonify({'success': True, 'ranked': True, **result}), 200
+
+@leaderboard_bp.route('', methods=['GET'])
+@require_auth
+def get_leaderboard():
+    """
+    Get the top users by portfolio value.
+
+    limit: number of users to return (default 10, at most 100)
+    """
+    limit = max(request.args.get('limit', 10, type=int), 1)
+
+    leaders = with_usernames(leaderboard.top(limit))
+    return jsonify({'success': True, 'leaders': leaders, 'total_users': leaderboard.size()}), 200
+
+@leaderboard_bp.route('/me', methods=['GET'])
+@require_auth
+def get_my_rank():
+    """
+    Get the logged-in user's rank.
+
+    window: also return this many users above and below (at most 100)
+    """
+    return rank_response(session['user_id'])
+
+@leaderboard_bp.route('/users/<username>', methods=['GET'])
+@require_auth
+def get_user_rank(username):
+    """Get a user's rank by username; accepts the same window parameter as /me."""
+    user = get_user_by_username(username)
+    if not user:
+        return jsonify({'success': False, 'error': 'User not found'}), 404
+    return rank_response(user['id'])
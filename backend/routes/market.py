@@ -1,21 +1,42 @@
+import os
 from flask import Blueprint, request, jsonify
 from backend.utils.data_fetcher import (
-    get_current_price,
+    get_cached_price,
+    get_cached_batch_prices,
+    get_quote_cache_stats,
+    get_price_store_stats,
+    get_metadata_cache_stats,
+    get_upstream_stats,
+    get_provider_names,
     get_historical_data,
     get_asset_info,
-    search_stocks,
-    search_crypto,
-    is_crypto
+    search_symbols,
+    get_symbol_index_stats,
+    is_crypto,
+    TRENDING_STOCKS,
+    TRENDING_CRYPTOS,
+    SEARCH_LIMIT
 )
+from backend.utils.market_poller import market_poller
+from backend.utils.valuation import valuation_book
+from backend.utils.leaderboard import leaderboard
+from backend.utils.order_engine import order_engine
+from backend.utils.analytics import analytics_cache
+from backend.utils.response_cache import cached_response, response_cache
 
 market_bp = Blueprint('market', __name__)
 
+# Seconds each rarely-changing market response is cached for
+HISTORY_TTL = float(os.environ.get('RESPONSE_TTL_HISTORY', 300))
+INFO_TTL = float(os.environ.get('RESPONSE_TTL_INFO', 3600))
+SEARCH_TTL = float(os.environ.get('RESPONSE_TTL_SEARCH', 300))
+
 @market_bp.route('/price/<ticker>', methods=['GET'])
 def get_price(ticker):
     """Get current price for an asset."""
     asset_type = request.args.get('type', 'stock')  # 'stock' or 'crypto'
     
-    result = get_current_price(ticker.upper(), asset_type)
+    result = get_cached_price(ticker.upper(), asset_type)
     
     if result['success']:
         return jsonify(result), 200
@@ -23,12 +44,14 @@ def get_price(ticker):
         return jsonify(result), 404
 
 @market_bp.route('/history/<ticker>', methods=['GET'])
+@cached_response(HISTORY_TTL)
 def get_history(ticker):
     """Get historical data for an asset."""
     asset_type = request.args.get('type', 'stock')
     period = request.args.get('period', '1mo')  # 1d, 1w, 1mo, 3mo, 1y
+    fmt = request.args.get('format', 'records')  # 'records' or 'columns'
     
-    result = get_historical_data(ticker.upper(), asset_type, period)
+    result = get_historical_data(ticker.upper(), asset_type, period, 'columns' if fmt == 'columns' else 'records')
     
     if result['success']:
         return jsonify(result), 200
@@ -36,6 +59,7 @@ def get_history(ticker):
         return jsonify(result), 404
 
 @market_bp.route('/info/<ticker>', methods=['GET'])
+@cached_response(INFO_TTL)
 def get_info(ticker):
     """Get detailed information about an asset."""
     asset_type = request.args.get('type', 'stock')
@@ -48,6 +72,7 @@ def get_info(ticker):
         return jsonify(result), 404
 
 @market_bp.route('/search', methods=['GET'])
+@cached_response(SEARCH_TTL)
 def search():
     """Search for stocks and cryptocurrencies."""
     query = request.args.get('q', '')
@@ -56,20 +81,15 @@ def search():
     if not query:
         return jsonify({'success': False, 'error': 'Query parameter required'}), 400
     
-    results = []
-    
-    if search_type in ['stock', 'all']:
-        stock_results = search_stocks(query)
-        if stock_results['success']:
-            results.extend(stock_results['results'])
+    try:
+        limit = min(max(int(request.args.get('limit', SEARCH_LIMIT)), 1), 50)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid limit'}), 400
     
-    if search_type in ['crypto', 'all']:
-        crypto_results = search_crypto(query)
-        if crypto_results['success']:
-            results.extend(crypto_results['results'])
+    result = search_symbols(query, None if search_type == 'all' else search_type, limit)
     
-    if results:
-        return jsonify({'success': True, 'results': results}), 200
+    if result['success']:
+        return jsonify({'success': True, 'results': result['results']}), 200
     else:
         return jsonify({'success': False, 'error': 'No results found'}), 404
 
@@ -77,26 +97,28 @@ def search():
 def get_trending():
     """Get trending/popular assets."""
     # Predefined list of popular stocks and cryptos
-    popular_stocks = ['AAPL', 'MSFT', 'GOOGL', 'AMZN', 'TSLA', 'NVDA', 'META']
-    popular_cryptos = ['BTC', 'ETH', 'BNB', 'SOL', 'XRP']
+    popular_stocks = TRENDING_STOCKS
+    popular_cryptos = TRENDING_CRYPTOS
     
     trending = {
         'stocks': [],
         'crypto': []
     }
     
-    # Get current prices for popular stocks
+    items = [(ticker, 'stock') for ticker in popular_stocks]
+    items += [(ticker, 'crypto') for ticker in popular_cryptos]
+    prices = get_cached_batch_prices(items)
+    
     for ticker in popular_stocks:
-        price_data = get_current_price(ticker, 'stock')
+        price_data = prices[(ticker, 'stock')]
         if price_data['success']:
             trending['stocks'].append({
                 'ticker': ticker,
                 'price': price_data['price']
             })
     
-    # Get current prices for popular cryptos
     for ticker in popular_cryptos:
-        price_data = get_current_price(ticker, 'crypto')
+        price_data = prices[(ticker, 'crypto')]
         if price_data['success']:
             trending['crypto'].append({
                 'ticker': ticker,
@@ -115,13 +137,20 @@ def get_batch_prices():
     if not tickers:
         return jsonify({'success': False, 'error': 'No tickers provided'}), 400
     
-    results = []
-    
+    items = []
     for item in tickers:
         ticker = item.get('ticker', '').upper()
-        asset_type = item.get('type', 'stock')
-        
-        price_data = get_current_price(ticker, asset_type)
+        asset_type = 'crypto' if item.get('type', 'stock') == 'crypto' else 'stock'
+        if ticker:
+            items.append((ticker, asset_type))
+    
+    prices = get_cached_batch_prices(items)
+    
+    results = []
+    errors = []
+    
+    for ticker, asset_type in items:
+        price_data = prices[(ticker, asset_type)]
         if price_data['success']:
             results.append({
                 'ticker': ticker,
@@ -129,6 +158,30 @@ def get_batch_prices():
                 'price': price_data['price'],
                 'timestamp': price_data['timestamp']
             })
+        else:
+            errors.append({
+                'ticker': ticker,
+                'type': asset_type,
+                'error': price_data.get('error', 'No data available')
+            })
     
-    return jsonify({'success': True, 'prices': results}), 200
+    return jsonify({'success': True, 'prices': results, 'errors': errors}), 200
 
+@market_bp.route('/cache-stats', methods=['GET'])
+def get_cache_stats():
+    """Get quote cache hit/miss/age counters."""
+    return jsonify({
+        'success': True,
+        'quote_cache': get_quote_cache_stats(),
+        'price_store': get_price_store_stats(),
+        'poller': market_poller.stats(),
+        'valuation': valuation_book.stats(),
+        'leaderboard': leaderboard.stats(),
+        'order_engine': order_engine.stats(),
+        'analytics_cache': analytics_cache.stats(),
+        'response_cache': response_cache.stats(),
+        'metadata_cache': get_metadata_cache_stats(),
+        'symbol_index': get_symbol_index_stats(),
+        'upstream': get_upstream_stats(),
+        'providers': get_provider_names()
+    }), 200
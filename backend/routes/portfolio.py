@@ -1,13 +1,29 @@
+import math
 from flask import Blueprint, request, jsonify, session
 from backend.models.database import (
-    get_user_portfolio, 
-    add_to_portfolio, 
-    remove_from_portfolio,
-    add_transaction,
+    execute_trade,
+    create_order,
+    cancel_order,
+    get_user_orders,
     get_user_transactions,
-    get_portfolio_snapshots
+    ORDER_TYPES,
+    ORDER_STATUSES,
+    get_user_lots,
+    get_realized_pnl,
+    get_portfolio_value_history
 )
-from backend.utils.data_fetcher import get_current_price
+from backend.models.ledger import LOT_METHOD
+from backend.utils.data_fetcher import get_current_price, is_listed_symbol
+from backend.utils.valuation import valuation_book
+from backend.utils.leaderboard import leaderboard
+from backend.utils.analytics import (
+    analytics_cache,
+    get_portfolio_analytics,
+    ANALYTICS_WINDOWS,
+    ANALYTICS_BENCHMARK
+)
+from backend.utils.stream_hub import stream_hub
+from backend.utils.order_engine import order_engine
 
 portfolio_bp = Blueprint('portfolio', __name__)
 
@@ -25,22 +41,7 @@ def require_auth(f):
 def get_holdings():
     """Get user's portfolio holdings."""
     user_id = session['user_id']
-    holdings = get_user_portfolio(user_id)
-    
-    # Enrich with current prices
-    for holding in holdings:
-        price_data = get_current_price(holding['ticker'], holding['asset_type'])
-        if price_data['success']:
-            holding['current_price'] = price_data['price']
-            holding['total_value'] = price_data['price'] * holding['quantity']
-            holding['profit_loss'] = (price_data['price'] - holding['avg_buy_price']) * holding['quantity']
-            holding['profit_loss_percent'] = ((price_data['price'] / holding['avg_buy_price']) - 1) * 100
-        else:
-            holding['current_price'] = 0
-            holding['total_value'] = 0
-            holding['profit_loss'] = 0
-            holding['profit_loss_percent'] = 0
-    
+    holdings = valuation_book.holdings(user_id)
     return jsonify({'success': True, 'holdings': holdings}), 200
 
 @portfolio_bp.route('/buy', methods=['POST'])
@@ -71,16 +72,19 @@ def buy_asset():
     
     price = price_data['price']
     
-    # Add to portfolio
-    result = add_to_portfolio(user_id, ticker, asset_type, quantity, price)
+    # Update holding and record transaction atomically
+    result = execute_trade(user_id, ticker, asset_type, 'buy', quantity, price)
     
     if result['success']:
-        # Record transaction
-        add_transaction(user_id, ticker, asset_type, 'buy', quantity, price)
+        valuation_book.apply_trade(user_id, result['version'], result['position'], price)
+        leaderboard.apply_trade(user_id, result['position'], price)
+        analytics_cache.invalidate(user_id)
+        stream_hub.holdings_changed(user_id)
         return jsonify({
             'success': True, 
             'message': f'Bought {quantity} {ticker} at ${price}',
-            'total_cost': quantity * price
+            'total_cost': quantity * price,
+            'position': result['position']
         }), 200
     else:
         return jsonify(result), 400
@@ -113,20 +117,112 @@ def sell_asset():
     
     price = price_data['price']
     
-    # Remove from portfolio
-    result = remove_from_portfolio(user_id, ticker, quantity)
+    # Update holding and record transaction atomically
+    result = execute_trade(user_id, ticker, asset_type, 'sell', quantity, price)
     
     if result['success']:
-        # Record transaction
-        add_transaction(user_id, ticker, asset_type, 'sell', quantity, price)
+        valuation_book.apply_trade(user_id, result['version'], result['position'], price)
+        leaderboard.apply_trade(user_id, result['position'], price)
+        analytics_cache.invalidate(user_id)
+        stream_hub.holdings_changed(user_id)
         return jsonify({
             'success': True,
             'message': f'Sold {quantity} {ticker} at ${price}',
-            'total_revenue': quantity * price
+            'total_revenue': quantity * price,
+            'realized_pnl': round(result['realized_pnl'], 2),
+            'position': result['position']
         }), 200
     else:
         return jsonify(result), 400
 
+@portfolio_bp.route('/orders', methods=['POST'])
+@require_auth
+def place_order():
+    """
+    Place a resting order, filled when a quote crosses its price.
+
+    order_type: limit (limit_price), stop (stop_price) or stop_limit (both)
+    side: buy or sell
+    """
+    user_id = session['user_id']
+    data = request.get_json()
+    
+    ticker = data.get('ticker', '').upper()
+    asset_type = data.get('asset_type')
+    side = data.get('side')
+    order_type = data.get('order_type')
+    quantity = data.get('quantity')
+    
+    if not ticker or not asset_type or not side or not order_type or not quantity:
+        return jsonify({'success': False, 'error': 'Missing required fields'}), 400
+    if asset_type not in ('stock', 'crypto'):
+        return jsonify({'success': False, 'error': 'asset_type must be stock or crypto'}), 400
+    if side not in ('buy', 'sell'):
+        return jsonify({'success': False, 'error': 'side must be buy or sell'}), 400
+    if order_type not in ORDER_TYPES:
+        return jsonify({'success': False, 'error': f"order_type must be one of {', '.join(ORDER_TYPES)}"}), 400
+    
+    fields = ('limit_price', 'stop_price') if order_type == 'stop_limit' else (f'{order_type}_price',)
+    prices = {}
+    try:
+        quantity = float(quantity)
+        # NaN compares false with everything and would corrupt the engine's trigger heaps
+        if not math.isfinite(quantity):
+            return jsonify({'success': False, 'error': 'Invalid quantity or price'}), 400
+        if quantity <= 0:
+            return jsonify({'success': False, 'error': 'Quantity must be positive'}), 400
+        for field in fields:
+            if data.get(field) is None:
+                return jsonify({'success': False, 'error': f'{field} is required for {order_type} orders'}), 400
+            prices[field] = float(data[field])
+            if not math.isfinite(prices[field]):
+                return jsonify({'success': False, 'error': 'Invalid quantity or price'}), 400
+            if prices[field] <= 0:
+                return jsonify({'success': False, 'error': f'{field} must be positive'}), 400
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Invalid quantity or price'}), 400
+    
+    # Only accept symbols the market data can quote
+    price_data = get_current_price(ticker, asset_type)
+    if not price_data['success']:
+        return jsonify({'success': False, 'error': 'Could not fetch price'}), 400
+    
+    result = create_order(user_id, ticker, asset_type, side, order_type, quantity, **prices)
+    if not result['success']:
+        return jsonify(result), 400
+    order_engine.notify()
+    return jsonify(result), 201
+
+@portfolio_bp.route('/orders', methods=['GET'])
+@require_auth
+def get_orders():
+    """
+    Get orders, newest first.
+
+    status: open (default), filled, cancelled, rejected or all
+    limit: number of orders to return (default 100)
+    """
+    user_id = session['user_id']
+    status = request.args.get('status', 'open')
+    if status != 'all' and status not in ORDER_STATUSES:
+        return jsonify({'success': False, 'error': f"status must be one of {', '.join(ORDER_STATUSES)} or all"}), 400
+    limit = max(request.args.get('limit', 100, type=int), 1)
+    
+    orders = get_user_orders(user_id, None if status == 'all' else status, limit)
+    return jsonify({'success': True, 'orders': orders}), 200
+
+@portfolio_bp.route('/orders/<int:order_id>', methods=['DELETE'])
+@require_auth
+def delete_order(order_id):
+    """Cancel an open order."""
+    user_id = session['user_id']
+    
+    result = cancel_order(user_id, order_id)
+    if not result['success']:
+        return jsonify(result), 404 if result['error'] == 'Order not found' else 409
+    order_engine.cancel(order_id)
+    return jsonify(result), 200
+
 @portfolio_bp.route('/transactions', methods=['GET'])
 @require_auth
 def get_transactions():
@@ -137,45 +233,70 @@ def get_transactions():
     transactions = get_user_transactions(user_id, limit)
     return jsonify({'success': True, 'transactions': transactions}), 200
 
+@portfolio_bp.route('/realized', methods=['GET'])
+@require_auth
+def get_realized():
+    """Get cumulative realized P&L per ticker from the tax-lot ledger."""
+    user_id = session['user_id']
+    
+    realized = get_realized_pnl(user_id)
+    totals = {
+        'proceeds': round(sum(row['proceeds'] for row in realized), 2),
+        'cost_basis': round(sum(row['cost_basis'] for row in realized), 2),
+        'realized_pnl': round(sum(row['realized_pnl'] for row in realized), 2)
+    }
+    return jsonify({'success': True, 'method': LOT_METHOD, 'realized': realized, 'totals': totals}), 200
+
+@portfolio_bp.route('/lots', methods=['GET'])
+@require_auth
+def get_lots():
+    """
+    Get open tax lots, oldest first within each ticker.
+
+    ticker: only return lots for this symbol
+    """
+    user_id = session['user_id']
+    ticker = request.args.get('ticker', '').upper() or None
+    
+    return jsonify({'success': True, 'method': LOT_METHOD, 'lots': get_user_lots(user_id, ticker)}), 200
+
 @portfolio_bp.route('/value-history', methods=['GET'])
 @require_auth
 def get_value_history():
     """Get portfolio value history."""
     user_id = session['user_id']
     hours = request.args.get('hours', 24, type=int)
+    points = request.args.get('points', 200, type=int)
     
-    snapshots = get_portfolio_snapshots(user_id, hours)
-    return jsonify({'success': True, 'snapshots': snapshots}), 200
+    history = get_portfolio_value_history(user_id, hours, max(points, 1))
+    return jsonify({
+        'success': True,
+        'resolution': history['resolution'],
+        'snapshots': history['snapshots']
+    }), 200
 
 @portfolio_bp.route('/summary', methods=['GET'])
 @require_auth
 def get_portfolio_summary():
     """Get portfolio summary statistics."""
     user_id = session['user_id']
-    holdings = get_user_portfolio(user_id)
-    
-    total_value = 0
-    total_cost = 0
-    
-    for holding in holdings:
-        price_data = get_current_price(holding['ticker'], holding['asset_type'])
-        if price_data['success']:
-            current_value = price_data['price'] * holding['quantity']
-            cost = holding['avg_buy_price'] * holding['quantity']
-            total_value += current_value
-            total_cost += cost
-    
-    profit_loss = total_value - total_cost
-    profit_loss_percent = ((total_value / total_cost) - 1) * 100 if total_cost > 0 else 0
-    
-    return jsonify({
-        'success': True,
-        'summary': {
-            'total_value': round(total_value, 2),
-            'total_cost': round(total_cost, 2),
-            'profit_loss': round(profit_loss, 2),
-            'profit_loss_percent': round(profit_loss_percent, 2),
-            'holdings_count': len(holdings)
-        }
-    }), 200
+    return jsonify({'success': True, 'summary': valuation_book.summary(user_id)}), 200
 
+@portfolio_bp.route('/analytics', methods=['GET'])
+@require_auth
+def get_analytics():
+    """
+    Get return, risk and attribution statistics for the portfolio.
+
+    window: 1mo, 3mo, 6mo, 1y (default) or 2y
+    benchmark: listed stock symbol beta is measured against (default SPY)
+    """
+    user_id = session['user_id']
+    window = request.args.get('window', '1y')
+    if window not in ANALYTICS_WINDOWS:
+        return jsonify({'success': False, 'error': f"window must be one of {', '.join(ANALYTICS_WINDOWS)}"}), 400
+    benchmark = request.args.get('benchmark', ANALYTICS_BENCHMARK).strip().upper()
+    if benchmark != ANALYTICS_BENCHMARK and not is_listed_symbol(benchmark, 'stock'):
+        return jsonify({'success': False, 'error': f"Unknown benchmark symbol: {benchmark[:16]}"}), 400
+    
+    return jsonify(get_portfolio_analytics(user_id, window, benchmark)), 200
@@ -0,0 +1,69 @@
+import json
+from flask import Blueprint, request, jsonify, session, Response, stream_with_context
+from backend.utils.stream_hub import stream_hub, STREAM_HEARTBEAT
+
+stream_bp = Blueprint('stream', __name__)
+
+def parse_items(raw):
+    """Parse 'AAPL,BTC:crypto' into [('AAPL', 'stock'), ('BTC', 'crypto')]."""
+    items = []
+    for part in raw.split(','):
+        ticker, _, asset_type = part.strip().partition(':')
+        if ticker:
+            items.append((ticker.upper(), 'crypto' if asset_type == 'crypto' else 'stock'))
+    return items
+
+def format_event(event, payload):
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+@stream_bp.route('', methods=['GET'])
+def stream():
+    """
+    Stream live price and portfolio deltas as Server-Sent Events.
+
+    tickers: comma separated symbols, with ':crypto' for cryptocurrencies
+    portfolio: '1' to also stream the logged-in user's portfolio value
+    """
+    items = parse_items(request.args.get('tickers', ''))
+    want_portfolio = request.args.get('portfolio', '0') == '1'
+    
+    user_id = None
+    if want_portfolio:
+        if 'user_id' not in session:
+            return jsonify({'success': False, 'error': 'Authentication required'}), 401
+        user_id = session['user_id']
+    
+    if not items and user_id is None:
+        return jsonify({'success': False, 'error': 'No tickers or portfolio requested'}), 400
+    
+    subscriber = stream_hub.subscribe(items, user_id)
+    if subscriber is None:
+        # Every stream holds a server thread; past the cap clients poll the REST endpoints
+        response = jsonify({'success': False, 'error': 'Too many open streams', 'fallback': 'poll'})
+        response.headers['Retry-After'] = '60'
+        return response, 503
+    
+    def generate():
+        try:
+            yield format_event('ready', {'tickers': [ticker for ticker, _ in items], 'portfolio': want_portfolio})
+            # Ends when the hub shuts down; EventSource clients reconnect on their own
+            while not subscriber.closed:
+                events = subscriber.drain(STREAM_HEARTBEAT)
+                if not events:
+                    yield ': keep-alive\n\n'
+                for event, payload in events:
+                    yield format_event(event, payload)
+        finally:
+            stream_hub.unsubscribe(subscriber)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@stream_bp.route('/stats', methods=['GET'])
+def stream_stats():
+    """Get stream subscriber and fan-out counters."""
+    return jsonify({'success': True, 'stream': stream_hub.stats()}), 200
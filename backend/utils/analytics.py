@@ -0,0 +1,373 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+from backend.models.database import (
+    get_portfolio_state,
+    get_portfolio_version,
+    get_portfolio_value_history,
+    get_user_cash_flows,
+    release_db_connection
+)
+from backend.utils.data_fetcher import get_historical_data, PERIOD_DAYS
+
+# Lookback windows accepted by the analytics endpoint
+ANALYTICS_WINDOWS = ('1mo', '3mo', '6mo', '1y', '2y')
+
+# Symbol beta is measured against when the request does not name one
+ANALYTICS_BENCHMARK = os.environ.get('ANALYTICS_BENCHMARK', 'SPY')
+
+# Annual risk-free rate subtracted in the Sharpe ratio
+ANALYTICS_RISK_FREE_RATE = float(os.environ.get('ANALYTICS_RISK_FREE_RATE', 0.0))
+
+# Seconds a computed result is served before it is recomputed
+ANALYTICS_CACHE_TTL = float(os.environ.get('ANALYTICS_CACHE_TTL', 300))
+
+# Maximum cached (user, window, benchmark) results
+ANALYTICS_CACHE_SIZE = int(os.environ.get('ANALYTICS_CACHE_SIZE', 1024))
+
+# Seconds a loaded daily close series is shared between computations
+ANALYTICS_SERIES_TTL = float(os.environ.get('ANALYTICS_SERIES_TTL', 300))
+
+# Maximum cached (ticker, asset_type, window) close series
+ANALYTICS_SERIES_CACHE_SIZE = int(os.environ.get('ANALYTICS_SERIES_CACHE_SIZE', 2048))
+
+# Threads loading price histories for one computation
+ANALYTICS_WORKERS = int(os.environ.get('ANALYTICS_WORKERS', 8))
+
+_executor = ThreadPoolExecutor(max_workers=ANALYTICS_WORKERS, thread_name_prefix='analytics')
+
+
+def _number(value, digits=6):
+    """Round a float for JSON, mapping NaN and infinities to None."""
+    if value is None or not np.isfinite(value):
+        return None
+    return round(float(value), digits)
+
+
+def _day(day_number):
+    return datetime.fromtimestamp(int(day_number) * 86400, tz=timezone.utc).strftime('%Y-%m-%d')
+
+
+def align_closes(series):
+    """
+    Align daily close series on one calendar.
+
+    series: list of (timestamps, closes) array pairs, one per asset
+    Returns (days, prices): the union of UTC day numbers and a days x assets
+    matrix, forward-filled and trimmed to the first day every asset has a price.
+    """
+    columns = []
+    for timestamps, closes in series:
+        days = np.asarray(timestamps, dtype='int64') // 86400
+        closes = np.asarray(closes, dtype=float)
+        # Keep the last bar of each day
+        last = np.append(days[1:] != days[:-1], True)
+        columns.append((days[last], closes[last]))
+
+    calendar = np.unique(np.concatenate([days for days, _ in columns]))
+    prices = np.full((len(calendar), len(columns)), np.nan)
+    for j, (days, closes) in enumerate(columns):
+        prices[np.searchsorted(calendar, days), j] = closes
+
+    valid = ~np.isnan(prices)
+    rows = np.where(valid, np.arange(len(calendar))[:, None], 0)
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    prices = prices[rows, np.arange(len(columns))]
+
+    start = valid.argmax(axis=0).max()
+    return calendar[start:], prices[start:]
+
+
+def portfolio_metrics(days, prices, quantities, benchmark=None, risk_free_rate=0.0):
+    """
+    Return, risk and attribution statistics for a buy-and-hold portfolio.
+
+    days: day numbers; prices: days x assets matrix; quantities: per asset
+    benchmark: optional benchmark closes on the same days
+    Returns a dict of floats (NaN where undefined) plus per-asset arrays.
+    """
+    values = prices @ quantities
+    returns = values[1:] / values[:-1] - 1
+    asset_returns = prices[1:] / prices[:-1] - 1
+    weights = prices[:-1] * quantities / values[:-1, None]
+
+    years = (days[-1] - days[0]) / 365.25
+    periods_per_year = len(returns) / years if years > 0 else np.nan
+    cumulative = values[-1] / values[0] - 1
+    volatility = returns.std(ddof=1) * np.sqrt(periods_per_year) if len(returns) > 1 else np.nan
+    mean_annual = returns.mean() * periods_per_year if len(returns) else np.nan
+
+    peaks = np.maximum.accumulate(values)
+    drawdowns = values / peaks - 1
+    trough = int(drawdowns.argmin())
+    peak = int(values[:trough + 1].argmax())
+
+    beta = np.nan
+    if benchmark is not None and len(returns) > 1:
+        benchmark_returns = benchmark[1:] / benchmark[:-1] - 1
+        covariance = np.cov(returns, benchmark_returns)
+        if covariance[1, 1] > 0:
+            beta = covariance[0, 1] / covariance[1, 1]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        correlation = np.atleast_2d(np.corrcoef(asset_returns, rowvar=False))
+
+    return {
+        'cumulative_return': cumulative,
+        'annualized_return': (1 + cumulative) ** (1 / years) - 1 if years > 0 else np.nan,
+        'annualized_volatility': volatility,
+        'sharpe_ratio': (mean_annual - risk_free_rate) / volatility if volatility > 0 else np.nan,
+        'max_drawdown': drawdowns[trough],
+        'max_drawdown_peak': days[peak],
+        'max_drawdown_trough': days[trough],
+        'beta': beta,
+        'asset_returns': prices[-1] / prices[0] - 1,
+        'contributions': (weights * asset_returns).sum(axis=0),
+        'weights': prices[-1] * quantities / values[-1],
+        'correlation': correlation
+    }
+
+
+def time_weighted_return(times, values, flow_times, flows):
+    """
+    Chain sub-period returns between value points, net of trade cash flows.
+
+    times, values: value points, oldest first
+    flow_times, flows: trade times and signed amounts (buys positive)
+    A flow belongs to the first value point at or after it. Periods that
+    start from an empty portfolio are skipped.
+    """
+    if len(values) < 2:
+        return None
+    per_point = np.bincount(
+        np.searchsorted(times, flow_times, side='left'),
+        weights=flows, minlength=len(values) + 1
+    )[:len(values)]
+    start = values[:-1]
+    end = values[1:] - per_point[1:]
+    valid = start > 0
+    growth = np.where(valid, end / np.where(valid, start, 1), 1.0)
+    return float(np.prod(growth) - 1)
+
+
+class AnalyticsCache:
+    """
+    TTL + LRU cache for computed analytics keyed by (user_id, window, benchmark).
+
+    Entries expire after their TTL and are dropped when the user trades in
+    this process. Each entry also records the user's holdings version, so a
+    trade made by another worker is noticed on the next read. The same class
+    holds the shared close series, with version None.
+    """
+
+    def __init__(self, ttl=ANALYTICS_CACHE_TTL, max_size=ANALYTICS_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key, version=None):
+        """Return a cached result computed at this holdings version, or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version and now - entry[1] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+        return None
+
+    def put(self, key, version, result):
+        """Store a result computed at a holdings version."""
+        with self._lock:
+            self._entries[key] = (version, time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate(self, user_id):
+        """Drop every cached result for a user."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+            self.invalidations += 1
+
+    def stats(self):
+        """Return size and hit/miss counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0
+            }
+
+
+# Daily closes shared by every user's computation
+series_cache = AnalyticsCache(ttl=ANALYTICS_SERIES_TTL, max_size=ANALYTICS_SERIES_CACHE_SIZE)
+
+
+def _load_closes(ticker, asset_type, window):
+    """Get (timestamps, closes) for an asset's daily bars over a window, or None."""
+    key = (ticker, asset_type, window)
+    closes = series_cache.get(key)
+    if closes is not None:
+        return closes
+    try:
+        result = get_historical_data(ticker, asset_type, window, fmt='bars')
+        if not result['success']:
+            return None
+        bars = np.asarray(result['data'], dtype=float).reshape(-1, 6)
+        closes = (bars[:, 0], bars[:, 4])
+        series_cache.put(key, None, closes)
+        return closes
+    finally:
+        release_db_connection()
+
+
+def _snapshot_return(user_id, window):
+    """Time-weighted return from the stored portfolio value history."""
+    hours = PERIOD_DAYS[window] * 24
+    history = get_portfolio_value_history(user_id, hours, PERIOD_DAYS[window])
+    snapshots = history['snapshots']
+    if len(snapshots) < 2:
+        return None
+    times = np.array([s['timestamp'] for s in snapshots], dtype='datetime64[s]')
+    if history['resolution'] != 'raw':
+        # A rollup's close is the last snapshot in its bucket
+        times = times + np.timedelta64(history['resolution'], 's')
+    values = np.array([s['total_value'] for s in snapshots], dtype=float)
+    flows = get_user_cash_flows(user_id, hours)
+    flow_times = np.array([t for t, _ in flows], dtype='datetime64[s]')
+    amounts = np.array([amount for _, amount in flows], dtype=float)
+    return time_weighted_return(times, values, flow_times, amounts)
+
+
+def compute_analytics(user_id, window='1y', benchmark=ANALYTICS_BENCHMARK, holdings=None):
+    """
+    Compute portfolio analytics for one user and window.
+
+    Return and risk figures value the current holdings over the window's
+    daily bars. time_weighted_return comes from the stored value history
+    and reflects the trades actually made.
+    """
+    if holdings is None:
+        _, holdings = get_portfolio_state(user_id)
+    result = {
+        'success': True,
+        'window': window,
+        'benchmark': benchmark,
+        'holdings_count': len(holdings),
+        'time_weighted_return': _number(_snapshot_return(user_id, window)),
+        'start': None,
+        'end': None,
+        'periods': 0,
+        'cumulative_return': None,
+        'annualized_return': None,
+        'annualized_volatility': None,
+        'sharpe_ratio': None,
+        'max_drawdown': None,
+        'max_drawdown_peak': None,
+        'max_drawdown_trough': None,
+        'beta': None,
+        'contributions': [],
+        'correlation': {'tickers': [], 'matrix': []},
+        'missing': []
+    }
+    if not holdings:
+        return result
+
+    futures = [_executor.submit(_load_closes, h['ticker'], h['asset_type'], window) for h in holdings]
+    benchmark_future = _executor.submit(_load_closes, benchmark, 'stock', window) if benchmark else None
+
+    priced = []
+    series = []
+    for holding, future in zip(holdings, futures):
+        closes = future.result()
+        if closes is None or len(closes[0]) == 0:
+            result['missing'].append(holding['ticker'])
+        else:
+            priced.append(holding)
+            series.append(closes)
+    benchmark_closes = benchmark_future.result() if benchmark_future else None
+    has_benchmark = benchmark_closes is not None and len(benchmark_closes[0]) > 0
+    if has_benchmark:
+        series.append(benchmark_closes)
+    if not priced:
+        return result
+
+    days, prices = align_closes(series)
+    if len(days) < 2:
+        return result
+    quantities = np.array([h['quantity'] for h in priced], dtype=float)
+    metrics = portfolio_metrics(
+        days, prices[:, :len(priced)], quantities,
+        benchmark=prices[:, -1] if has_benchmark else None,
+        risk_free_rate=ANALYTICS_RISK_FREE_RATE
+    )
+
+    tickers = [h['ticker'] for h in priced]
+    result.update({
+        'start': _day(days[0]),
+        'end': _day(days[-1]),
+        'periods': len(days) - 1,
+        'cumulative_return': _number(metrics['cumulative_return']),
+        'annualized_return': _number(metrics['annualized_return']),
+        'annualized_volatility': _number(metrics['annualized_volatility']),
+        'sharpe_ratio': _number(metrics['sharpe_ratio'], 4),
+        'max_drawdown': _number(metrics['max_drawdown']),
+        'max_drawdown_peak': _day(metrics['max_drawdown_peak']),
+        'max_drawdown_trough': _day(metrics['max_drawdown_trough']),
+        'beta': _number(metrics['beta'], 4),
+        'contributions': sorted((
+            {
+                'ticker': ticker,
+                'asset_type': holding['asset_type'],
+                'weight': _number(weight),
+                'return': _number(asset_return),
+                'contribution': _number(contribution)
+            }
+            for ticker, holding, weight, asset_return, contribution in zip(
+                tickers, priced, metrics['weights'], metrics['asset_returns'], metrics['contributions'])
+        ), key=lambda c: -(c['contribution'] or 0)),
+        'correlation': {
+            'tickers': tickers,
+            'matrix': [[_number(value, 4) for value in row] for row in metrics['correlation']]
+        }
+    })
+    return result
+
+
+# Shared instance used by the portfolio routes
+analytics_cache = AnalyticsCache()
+
+
+def get_portfolio_analytics(user_id, window='1y', benchmark=ANALYTICS_BENCHMARK):
+    """Get portfolio analytics from the cache, computing them on a miss."""
+    key = (user_id, window, benchmark)
+    cached = analytics_cache.get(key, get_portfolio_version(user_id))
+    if cached is not None:
+        return dict(cached, cached=True)
+    version, holdings = get_portfolio_state(user_id)
+    result = compute_analytics(user_id, window, benchmark, holdings)
+    result['computed_at'] = datetime.now(timezone.utc).isoformat()
+    analytics_cache.put(key, version, result)
+    return dict(result, cached=False)
@@ -1,277 +1,359 @@
-import yfinance as yf
-import requests
-from datetime import datetime, timedelta
-import pandas as pd
-
-# CoinGecko API base URL (free, no API key needed)
-COINGECKO_BASE_URL = "https://api.coingecko.com/api/v3"
-
-# Mapping common crypto symbols to CoinGecko IDs
-CRYPTO_ID_MAP = {
-    'BTC': 'bitcoin',
-    'ETH': 'ethereum',
-    'USDT': 'tether',
-    'BNB': 'binancecoin',
-    'SOL': 'solana',
-    'XRP': 'ripple',
-    'ADA': 'cardano',
-    'DOGE': 'dogecoin',
-    'AVAX': 'avalanche-2',
-    'DOT': 'polkadot',
-    'MATIC': 'matic-network',
-    'LINK': 'chainlink',
-    'UNI': 'uniswap',
-    'ATOM': 'cosmos',
-    'LTC': 'litecoin',
+import os
+import time
+from datetime import datetime, timezone
+import numpy as np
+from backend.models import bar_store
+from backend.utils.quote_cache import quote_cache
+from backend.utils.price_store import price_store
+from backend.utils.metadata_cache import metadata_cache
+from backend.utils.symbol_index import symbol_index
+from backend.utils.upstream import upstream_stats
+from backend.utils.providers import (
+    get_provider,
+    selected_providers,
+    CRYPTO_ID_MAP,
+    INTERVAL_SECONDS
+)
+
+# Popular assets shown on the market page and always kept fresh by the poller
+TRENDING_STOCKS = ['AAPL', 'MSFT', 'GOOGL', 'AMZN', 'TSLA', 'NVDA', 'META']
+TRENDING_CRYPTOS = ['BTC', 'ETH', 'BNB', 'SOL', 'XRP']
+
+# Lookback in days for each history period ('ytd' and 'max' are special-cased)
+PERIOD_DAYS = {
+    '1d': 1, '5d': 5, '1w': 7, '1mo': 30, '3mo': 90, '6mo': 182,
+    '1y': 365, '2y': 730, '5y': 1826, '10y': 3652
 }
 
+# Seconds before the newest part of a stored bar series is refreshed upstream
+BAR_REFRESH_SECONDS = float(os.environ.get('BAR_REFRESH_SECONDS', 300))
+
+# Default number of symbol search results
+SEARCH_LIMIT = 10
+
+# Fall back to an exact upstream symbol lookup when the local index has no match
+SEARCH_UPSTREAM_FALLBACK = os.environ.get('SEARCH_UPSTREAM_FALLBACK', '1') == '1'
+
 def is_crypto(ticker):
     """Check if ticker is a known cryptocurrency."""
     return ticker.upper() in CRYPTO_ID_MAP
 
 def get_stock_current_price(ticker):
-    """Get current price for a stock using yfinance."""
-    try:
-        stock = yf.Ticker(ticker)
-        data = stock.history(period='1d', interval='1m')
-        if len(data) > 0:
-            current_price = data['Close'].iloc[-1]
-            return {
-                'success': True,
-                'ticker': ticker,
-                'price': round(float(current_price), 2),
-                'timestamp': datetime.now().isoformat()
-            }
-        return {'success': False, 'error': 'No data available'}
-    except Exception as e:
-        return {'success': False, 'error': str(e)}
+    """Get current price for a stock from the configured stock provider."""
+    return get_provider('stock').quote(ticker)
 
 def get_crypto_current_price(ticker):
-    """Get current price for a cryptocurrency using CoinGecko."""
-    try:
-        crypto_id = CRYPTO_ID_MAP.get(ticker.upper())
-        if not crypto_id:
-            return {'success': False, 'error': 'Cryptocurrency not found'}
-        
-        url = f"{COINGECKO_BASE_URL}/simple/price"
-        params = {
-            'ids': crypto_id,
-            'vs_currencies': 'usd',
-            'include_24hr_change': 'true',
-            'include_market_cap': 'true',
-            'include_24hr_vol': 'true'
-        }
-        
-        response = requests.get(url, params=params)
-        data = response.json()
-        
-        if crypto_id in data:
-            return {
-                'success': True,
-                'ticker': ticker.upper(),
-                'price': data[crypto_id]['usd'],
-                'change_24h': data[crypto_id].get('usd_24h_change', 0),
-                'market_cap': data[crypto_id].get('usd_market_cap', 0),
-                'volume_24h': data[crypto_id].get('usd_24h_vol', 0),
-                'timestamp': datetime.now().isoformat()
-            }
-        return {'success': False, 'error': 'No data available'}
-    except Exception as e:
-        return {'success': False, 'error': str(e)}
+    """Get current price for a cryptocurrency from the configured crypto provider."""
+    return get_provider('crypto').quote(ticker)
 
 def get_current_price(ticker, asset_type):
     """Get current price for any asset (stock or crypto)."""
-    if asset_type == 'crypto':
-        return get_crypto_current_price(ticker)
-    else:
-        return get_stock_current_price(ticker)
+    return get_provider(asset_type).quote(ticker)
+
+def get_stock_batch_prices(tickers):
+    """Get current prices for many stocks in as few provider calls as possible."""
+    return get_provider('stock').batch_quotes(tickers)
+
+def get_crypto_batch_prices(tickers):
+    """Get current prices for many cryptocurrencies in as few provider calls as possible."""
+    return get_provider('crypto').batch_quotes(tickers)
+
+def get_batch_current_prices(items):
+    """
+    Get current prices for many assets at once.
+
+    items: iterable of (ticker, asset_type) pairs
+    Returns a dict keyed by (ticker, asset_type) with one result per pair.
+    """
+    stocks = []
+    cryptos = []
+    for ticker, asset_type in items:
+        target = cryptos if asset_type == 'crypto' else stocks
+        if ticker not in target:
+            target.append(ticker)
+
+    results = {}
+    if stocks:
+        for ticker, result in get_stock_batch_prices(stocks).items():
+            results[(ticker, 'stock')] = result
+    if cryptos:
+        for ticker, result in get_crypto_batch_prices(cryptos).items():
+            results[(ticker, 'crypto')] = result
+    return results
+
+def peek_price(ticker, asset_type):
+    """Get a polled or cached price without any network I/O, or None."""
+    return price_store.get(ticker, asset_type) or quote_cache.peek(ticker, asset_type)
+
+def _stale_fallback(ticker, asset_type, result):
+    """Replace a failed quote with the last known one, marked stale, if there is one."""
+    if result.get('success'):
+        return result
+    stale, age = quote_cache.get_stale(ticker, asset_type)
+    if stale is None:
+        return result
+    return dict(stale, stale=True, age=round(age, 1))
+
+def get_cached_price(ticker, asset_type):
+    """Get current price from the polled price store or the shared quote cache."""
+    result = price_store.get(ticker, asset_type)
+    if result:
+        return result
+    result = quote_cache.get(ticker, asset_type, get_current_price)
+    if result.get('success'):
+        # A real symbol: let the poller keep it fresh from now on
+        price_store.track(ticker, asset_type)
+    return _stale_fallback(ticker, asset_type, result)
+
+def get_cached_batch_prices(items):
+    """Get current prices for many assets, fetching only cache misses upstream."""
+    results = {}
+    missing = []
+    for ticker, asset_type in items:
+        asset_type = 'crypto' if asset_type == 'crypto' else 'stock'
+        cached = peek_price(ticker, asset_type)
+        if cached:
+            results[(ticker, asset_type)] = cached
+        else:
+            missing.append((ticker, asset_type))
+
+    for key, result in get_batch_current_prices(missing).items():
+        quote_cache.put(key[0], key[1], result)
+        results[key] = _stale_fallback(key[0], key[1], result)
+    return results
+
+def get_quote_cache_stats():
+    """Get hit/miss/age counters for the shared quote cache."""
+    return quote_cache.stats()
+
+def get_upstream_stats():
+    """Get rate-limit, retry and circuit breaker counters per provider."""
+    return upstream_stats()
+
+def get_provider_names():
+    """Get the market data provider selected for each asset class."""
+    return selected_providers()
+
+def get_price_store_stats():
+    """Get size and hit/miss counters for the polled price store."""
+    return price_store.stats()
+
+def _period_start(period, now):
+    """Get the epoch second a history period starts at."""
+    if period == 'ytd':
+        year_start = datetime(datetime.utcfromtimestamp(now).year, 1, 1, tzinfo=timezone.utc)
+        return int(year_start.timestamp())
+    return now - PERIOD_DAYS.get(period, 30) * 86400
+
+def _missing_ranges(coverage, start_ts, now, step):
+    """
+    Get the (start_ts, end_ts) ranges that must be fetched upstream to answer
+    [start_ts, now] from the bar store. end_ts None means up to now.
+    """
+    if coverage is None:
+        return [(start_ts, None)]
+    covered_start, covered_end = coverage
+    ranges = []
+    if start_ts < covered_start - step:
+        ranges.append((start_ts, covered_start))
+    if now - covered_end > BAR_REFRESH_SECONDS:
+        # Re-fetch the newest stored bar too, it may have been incomplete
+        ranges.append((covered_end - step, None))
+    return ranges
+
+def bars_to_columns(bars):
+    """
+    Convert bar tuples to a columnar dict with prices rounded to cents and
+    ISO-8601 UTC timestamps, using whole-column NumPy operations.
+    """
+    array = np.asarray(bars, dtype=float).reshape(-1, 6)
+    seconds = array[:, 0].astype('int64').astype('datetime64[s]')
+    prices = np.round(array[:, 1:5], 2)
+    return {
+        'timestamps': np.char.add(np.datetime_as_string(seconds, unit='s'), '+00:00').tolist(),
+        'open': prices[:, 0].tolist(),
+        'high': prices[:, 1].tolist(),
+        'low': prices[:, 2].tolist(),
+        'close': prices[:, 3].tolist(),
+        'volume': array[:, 5].astype('int64').tolist()
+    }
+
+def bars_to_records(bars):
+    """Convert bar tuples to the list-of-dicts history format."""
+    columns = bars_to_columns(bars)
+    return [
+        {'timestamp': ts, 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v}
+        for ts, o, h, l, c, v in zip(
+            columns['timestamps'], columns['open'], columns['high'],
+            columns['low'], columns['close'], columns['volume']
+        )
+    ]
 
-def get_stock_historical_data(ticker, period='1mo', interval='1d'):
+def get_stock_historical_data(ticker, period='1mo', interval='1d', fmt='records'):
     """
     Get historical data for a stock.
     
-    period: 1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max
+    period: 1d, 5d, 1w, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max
     interval: 1m, 2m, 5m, 15m, 30m, 60m, 90m, 1h, 1d, 5d, 1wk, 1mo, 3mo
+    
+    fmt: 'records' for a list of bar dicts, 'columns' for
+         {timestamps: [...], open: [...], ...}, 'bars' for the raw
+         (ts, open, high, low, close, volume) tuples
+    
+    Bars are served from the local bar store; only the ranges it is missing
+    are downloaded. 'max' always goes upstream.
     """
     try:
-        stock = yf.Ticker(ticker)
-        data = stock.history(period=period, interval=interval)
+        fetch_error = None
+        if period == 'max':
+            bars = get_provider('stock').bars(ticker, interval, 0)
+        else:
+            now = int(time.time())
+            start_ts = _period_start(period, now)
+            step = INTERVAL_SECONDS.get(interval, 86400)
+            # Bars are stored per provider, so switching providers never serves the other's history
+            provider = get_provider('stock')
+            coverage = bar_store.get_coverage(provider.name, ticker, 'stock', interval)
+            for range_start, range_end in _missing_ranges(coverage, start_ts, now, step):
+                try:
+                    bars = provider.bars(ticker, interval, range_start, range_end)
+                    bar_store.store_bars(provider.name, ticker, 'stock', interval, bars, range_start, range_end or now)
+                except Exception as e:
+                    fetch_error = str(e)
+            bars = bar_store.get_bars(provider.name, ticker, 'stock', interval, start_ts)
         
-        if len(data) > 0:
-            # Convert to list of dictionaries
-            historical_data = []
-            for index, row in data.iterrows():
-                historical_data.append({
-                    'timestamp': index.isoformat(),
-                    'open': round(float(row['Open']), 2),
-                    'high': round(float(row['High']), 2),
-                    'low': round(float(row['Low']), 2),
-                    'close': round(float(row['Close']), 2),
-                    'volume': int(row['Volume'])
-                })
-            
+        if len(bars) > 0:
+            if fmt == 'bars':
+                historical_data = bars
+            elif fmt == 'columns':
+                historical_data = bars_to_columns(bars)
+            else:
+                historical_data = bars_to_records(bars)
             return {
                 'success': True,
                 'ticker': ticker,
                 'period': period,
+                'format': fmt,
                 'data': historical_data
             }
-        return {'success': False, 'error': 'No data available'}
+        return {'success': False, 'error': fetch_error or 'No data available'}
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
-def get_crypto_historical_data(ticker, days=30):
-    """Get historical data for a cryptocurrency."""
+def get_crypto_historical_data(ticker, days=30, fmt='records'):
+    """Get historical data for a cryptocurrency, served from the local bar store."""
     try:
-        crypto_id = CRYPTO_ID_MAP.get(ticker.upper())
-        if not crypto_id:
-            return {'success': False, 'error': 'Cryptocurrency not found'}
-        
-        url = f"{COINGECKO_BASE_URL}/coins/{crypto_id}/market_chart"
-        params = {
-            'vs_currency': 'usd',
-            'days': days,
-            'interval': 'daily' if days > 1 else 'hourly'
-        }
+        ticker = ticker.upper()
+        interval = '1d' if days > 1 else '1h'
+        step = INTERVAL_SECONDS[interval]
+        now = int(time.time())
+        start_ts = now - days * 86400
         
-        response = requests.get(url, params=params)
-        data = response.json()
+        # One fetch up to now covers every gap
+        fetch_error = None
+        provider = get_provider('crypto')
+        ranges = _missing_ranges(bar_store.get_coverage(provider.name, ticker, 'crypto', interval), start_ts, now, step)
+        if ranges:
+            fetch_from = min(range_start for range_start, _ in ranges)
+            try:
+                bars = provider.bars(ticker, interval, fetch_from)
+                bar_store.store_bars(provider.name, ticker, 'crypto', interval, bars, fetch_from, now)
+            except Exception as e:
+                fetch_error = str(e)
         
-        if 'prices' in data:
-            historical_data = []
-            for price_point in data['prices']:
-                timestamp = datetime.fromtimestamp(price_point[0] / 1000)
-                historical_data.append({
-                    'timestamp': timestamp.isoformat(),
-                    'price': round(price_point[1], 2)
-                })
-            
+        bars = bar_store.get_bars(provider.name, ticker, 'crypto', interval, start_ts)
+        if bars:
+            if fmt == 'bars':
+                historical_data = bars
+            elif fmt == 'columns':
+                columns = bars_to_columns(bars)
+                historical_data = {'timestamps': columns['timestamps'], 'price': columns['close']}
+            else:
+                columns = bars_to_columns(bars)
+                historical_data = [
+                    {'timestamp': ts, 'price': price}
+                    for ts, price in zip(columns['timestamps'], columns['close'])
+                ]
             return {
                 'success': True,
-                'ticker': ticker.upper(),
+                'ticker': ticker,
                 'days': days,
+                'format': fmt,
                 'data': historical_data
             }
-        return {'success': False, 'error': 'No data available'}
+        return {'success': False, 'error': fetch_error or 'No data available'}
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
-def get_historical_data(ticker, asset_type, period='1mo'):
+def get_historical_data(ticker, asset_type, period='1mo', fmt='records'):
     """Get historical data for any asset."""
     if asset_type == 'crypto':
         # Convert period to days for crypto
-        days_map = {
-            '1d': 1,
-            '1w': 7,
-            '1mo': 30,
-            '3mo': 90,
-            '1y': 365
-        }
-        days = days_map.get(period, 30)
-        return get_crypto_historical_data(ticker, days)
+        days = PERIOD_DAYS.get(period, 30)
+        return get_crypto_historical_data(ticker, days, fmt=fmt)
     else:
-        return get_stock_historical_data(ticker, period)
+        return get_stock_historical_data(ticker, period, fmt=fmt)
 
 def get_stock_info(ticker):
     """Get detailed information about a stock."""
-    try:
-        stock = yf.Ticker(ticker)
-        info = stock.info
-        
-        return {
-            'success': True,
-            'ticker': ticker,
-            'name': info.get('longName', ticker),
-            'sector': info.get('sector', 'N/A'),
-            'market_cap': info.get('marketCap', 0),
-            'pe_ratio': info.get('trailingPE', 0),
-            'volume': info.get('volume', 0),
-            'avg_volume': info.get('averageVolume', 0),
-            '52w_high': info.get('fiftyTwoWeekHigh', 0),
-            '52w_low': info.get('fiftyTwoWeekLow', 0),
-            'description': info.get('longBusinessSummary', 'No description available')
-        }
-    except Exception as e:
-        return {'success': False, 'error': str(e)}
+    return get_provider('stock').info(ticker)
 
 def get_crypto_info(ticker):
     """Get detailed information about a cryptocurrency."""
-    try:
-        crypto_id = CRYPTO_ID_MAP.get(ticker.upper())
-        if not crypto_id:
-            return {'success': False, 'error': 'Cryptocurrency not found'}
-        
-        url = f"{COINGECKO_BASE_URL}/coins/{crypto_id}"
-        params = {
-            'localization': 'false',
-            'tickers': 'false',
-            'community_data': 'false',
-            'developer_data': 'false'
-        }
-        
-        response = requests.get(url, params=params)
-        data = response.json()
-        
-        market_data = data.get('market_data', {})
-        
+    return get_provider('crypto').info(ticker)
+
+def fetch_asset_info(ticker, asset_type):
+    """Get detailed information about any asset straight from its provider."""
+    return get_provider(asset_type).info(ticker)
+
+def get_asset_info(ticker, asset_type):
+    """Get detailed information about any asset, served from the metadata cache."""
+    return metadata_cache.get(get_provider(asset_type).name, ticker, asset_type, fetch_asset_info)
+
+def get_metadata_cache_stats():
+    """Return metadata cache counters."""
+    return metadata_cache.stats()
+
+def lookup_stock_symbol(query):
+    """Resolve an exact stock symbol upstream, through the metadata cache."""
+    # Invalid symbols come back without a 'symbol' and are cached too,
+    # so repeated misses stay local
+    info = get_asset_info(query.upper(), 'stock')
+    if not info.get('success'):
+        return {'success': False, 'error': info.get('error')}
+    if info.get('symbol'):
         return {
             'success': True,
-            'ticker': ticker.upper(),
-            'name': data.get('name', ticker),
-            'symbol': data.get('symbol', ticker).upper(),
-            'market_cap': market_data.get('market_cap', {}).get('usd', 0),
-            'total_volume': market_data.get('total_volume', {}).get('usd', 0),
-            'high_24h': market_data.get('high_24h', {}).get('usd', 0),
-            'low_24h': market_data.get('low_24h', {}).get('usd', 0),
-            'price_change_24h': market_data.get('price_change_percentage_24h', 0),
-            'circulating_supply': market_data.get('circulating_supply', 0),
-            'description': data.get('description', {}).get('en', 'No description available')
+            'results': [{
+                'symbol': info['symbol'],
+                'name': info.get('name', query.upper()),
+                'type': 'stock'
+            }]
         }
-    except Exception as e:
-        return {'success': False, 'error': str(e)}
+    return {'success': False, 'error': 'No results found'}
 
-def get_asset_info(ticker, asset_type):
-    """Get detailed information about any asset."""
-    if asset_type == 'crypto':
-        return get_crypto_info(ticker)
-    else:
-        return get_stock_info(ticker)
+def search_symbols(query, asset_type=None, limit=SEARCH_LIMIT):
+    """Search the local symbol index, optionally restricted to one asset class."""
+    results = symbol_index.search(query, asset_type, limit)
+    if not results and asset_type != 'crypto' and SEARCH_UPSTREAM_FALLBACK:
+        return lookup_stock_symbol(query)
+    if results:
+        return {'success': True, 'results': results}
+    return {'success': False, 'error': 'No results found'}
 
 def search_stocks(query):
     """Search for stocks by query."""
-    try:
-        # Using yfinance search functionality
-        # This is a simple implementation - you might want to use a better search API
-        ticker = yf.Ticker(query.upper())
-        info = ticker.info
-        
-        if 'symbol' in info:
-            return {
-                'success': True,
-                'results': [{
-                    'symbol': info.get('symbol', query.upper()),
-                    'name': info.get('longName', query.upper()),
-                    'type': 'stock'
-                }]
-            }
-        return {'success': False, 'error': 'No results found'}
-    except Exception as e:
-        return {'success': False, 'error': str(e)}
+    return search_symbols(query, 'stock')
 
 def search_crypto(query):
     """Search for cryptocurrencies by query."""
-    query_upper = query.upper()
-    results = []
-    
-    for symbol, crypto_id in CRYPTO_ID_MAP.items():
-        if query_upper in symbol or query.lower() in crypto_id:
-            results.append({
-                'symbol': symbol,
-                'name': crypto_id.replace('-', ' ').title(),
-                'type': 'crypto'
-            })
-    
-    if results:
-        return {'success': True, 'results': results}
-    return {'success': False, 'error': 'No results found'}
+    return search_symbols(query, 'crypto')
+
+def is_listed_symbol(ticker, asset_type=None):
+    """Check whether a symbol is in the local symbol index."""
+    return symbol_index.contains(ticker, asset_type)
+
+def get_symbol_index_stats():
+    """Return symbol index size and load counters."""
+    return symbol_index.stats()
 
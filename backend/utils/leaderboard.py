@@ -0,0 +1,464 @@
+import os
+import threading
+import time
+from array import array
+
+import numpy as np
+
+from backend.models.database import iter_all_holdings, release_db_connection
+from backend.utils.data_fetcher import get_cached_batch_prices
+from backend.utils.price_store import price_store
+from backend.utils.quote_cache import quote_cache
+
+# Seconds between full re-ranks from the portfolio table
+LEADERBOARD_RERANK_INTERVAL = float(os.environ.get('LEADERBOARD_RERANK_INTERVAL', 300))
+
+# Rebuild the ranking with a full sort when more than 1/N of the ranked users moved
+LEADERBOARD_REBUILD_RATIO = int(os.environ.get('LEADERBOARD_REBUILD_RATIO', 4))
+
+# Moved users re-placed one at a time by shifting the ranking; more are merged in one pass
+LEADERBOARD_SHIFT_LIMIT = 16
+
+# Largest top-N and rank window served
+LEADERBOARD_MAX_LIMIT = 100
+
+# Value difference in dollars tolerated between the running and recomputed totals
+LEADERBOARD_TOLERANCE = 0.01
+
+
+class Leaderboard:
+    """
+    Every user ranked by portfolio market value.
+
+    Users get a dense slot in NumPy arrays of values and position counts,
+    and each held ticker keeps (slots, quantities) arrays of its holders, so
+    a quote change is one vectorized add over that ticker's holders and a
+    trade adjusts one position, without valuing anyone from scratch.
+
+    The ranking is a sorted array of -value with the matching slots, ties
+    broken by user id. Rank lookups and the start of a top-N or rank
+    window are binary searches. Quotes and trades only mark users as moved;
+    the next read re-places them: a few moved users (a trade) are shifted
+    to their new place, more are taken out and merged back in one pass and
+    a full sort is used when most users moved, so a burst of ticks costs
+    one re-placement.
+
+    Trades made in other processes are only seen by the periodic full
+    re-rank, which reloads holdings from the portfolio table, recomputes
+    every value and reports how far the running ranking had drifted.
+    """
+
+    def __init__(self, rerank_interval=LEADERBOARD_RERANK_INTERVAL, rebuild_ratio=LEADERBOARD_REBUILD_RATIO,
+                 fetch_prices=get_cached_batch_prices, holdings=iter_all_holdings):
+        self.rerank_interval = rerank_interval
+        self.rebuild_ratio = rebuild_ratio
+        self.fetch_prices = fetch_prices
+        self.holdings = holdings
+        self._slots = {}
+        self._user_ids = np.zeros(0, dtype=np.int64)
+        self._values = np.zeros(0)
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._moved = np.zeros(0, dtype=bool)
+        self._placed = np.zeros(0)
+        self._holders = {}
+        self._prices = {}
+        self._ranked_values = np.zeros(0)
+        self._ranked_slots = np.zeros(0, dtype=np.int64)
+        self._pending = False
+        self._journal = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._rerank_lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.price_updates = 0
+        self.trades_applied = 0
+        self.placements = 0
+        self.rebuilds = 0
+        self.reranks = 0
+        self.last_rerank = None
+
+    def _slot(self, user_id):
+        """Return the user's slot, growing the arrays for a new user. Caller holds the lock."""
+        slot = self._slots.get(user_id)
+        if slot is None:
+            slot = self._slots[user_id] = len(self._slots)
+            if slot >= len(self._values):
+                size = max(2 * len(self._values), 1024)
+                self._user_ids = np.resize(self._user_ids, size)
+                self._values = np.concatenate([self._values, np.zeros(size - len(self._values))])
+                self._counts = np.concatenate([self._counts, np.zeros(size - len(self._counts), dtype=np.int64)])
+                self._moved = np.concatenate([self._moved, np.zeros(size - len(self._moved), dtype=bool)])
+                self._placed = np.concatenate([self._placed, np.full(size - len(self._placed), np.nan)])
+            self._user_ids[slot] = user_id
+        return slot
+
+    def _set_price(self, key, price):
+        """Record a price and move every holder's value. Caller holds the lock."""
+        old = self._prices.get(key)
+        self._prices[key] = price
+        holders = self._holders.get(key)
+        if old == price or holders is None:
+            return
+        slots, quantities = holders
+        self._values[slots] += quantities * (price - (old or 0.0))
+        self._moved[slots] = True
+        self._pending = True
+        self.price_updates += 1
+
+    def apply_quotes(self, results):
+        """Apply quote results keyed by (ticker, asset_type); tickers nobody holds are ignored."""
+        with self._lock:
+            for (ticker, asset_type), result in results.items():
+                key = (ticker.upper(), asset_type)
+                if key in self._holders and result and result.get('success'):
+                    self._set_price(key, result['price'])
+
+    def _set_position(self, user_id, key, quantity):
+        """Set a user's quantity of one asset at the current price. Caller holds the lock."""
+        slot = self._slot(user_id)
+        holders = self._holders.get(key)
+        found = np.flatnonzero(holders[0] == slot) if holders else ()
+        old = float(holders[1][found[0]]) if len(found) else 0.0
+        if len(found) and quantity > 0:
+            holders[1][found[0]] = quantity
+        elif len(found):
+            holders[0] = np.delete(holders[0], found[0])
+            holders[1] = np.delete(holders[1], found[0])
+            self._counts[slot] -= 1
+        elif quantity > 0:
+            if holders is None:
+                holders = self._holders[key] = [np.zeros(0, dtype=np.int64), np.zeros(0)]
+            holders[0] = np.append(holders[0], slot)
+            holders[1] = np.append(holders[1], quantity)
+            self._counts[slot] += 1
+        self._values[slot] += (quantity - old) * self._prices.get(key, 0.0)
+        if holders is not None and not len(holders[0]):
+            del self._holders[key]
+            self._prices.pop(key, None)
+        if not self._counts[slot]:
+            self._values[slot] = 0.0
+        self._moved[slot] = True
+        self._pending = True
+
+    def apply_trade(self, user_id, position, price):
+        """Apply a committed trade's resulting position (from execute_trade); the price counts as a quote."""
+        key = (position['ticker'], position['asset_type'])
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((user_id, key, position['quantity']))
+            self._set_position(user_id, key, position['quantity'])
+            if position['quantity'] > 0:
+                self._set_price(key, price)
+            self.trades_applied += 1
+
+    def _sorted(self, slots):
+        """Return slots ordered by value descending, then user id. Caller holds the lock."""
+        return slots[np.lexsort((self._user_ids[slots], -self._values[slots]))]
+
+    def _find(self, value, user_id):
+        """Return where (-value, user_id) is or would go in the ranking. Caller holds the lock."""
+        start = np.searchsorted(self._ranked_values, value, side='left')
+        end = np.searchsorted(self._ranked_values, value, side='right')
+        return int(start + np.searchsorted(self._user_ids[self._ranked_slots[start:end]], user_id))
+
+    def _shift(self, slot):
+        """Move one user to their new place, shifting only the entries in between. Caller holds the lock."""
+        user_id = self._user_ids[slot]
+        old = None if np.isnan(self._placed[slot]) else self._find(-self._placed[slot], user_id)
+        if not self._counts[slot]:
+            if old is not None:
+                self._ranked_slots = np.delete(self._ranked_slots, old)
+                self._ranked_values = np.delete(self._ranked_values, old)
+                self._placed[slot] = np.nan
+            return
+        value = -self._values[slot]
+        new = self._find(value, user_id)
+        if old is None:
+            self._ranked_slots = np.insert(self._ranked_slots, new, slot)
+            self._ranked_values = np.insert(self._ranked_values, new, value)
+        else:
+            if new > old:
+                new -= 1
+                self._ranked_slots[old:new] = self._ranked_slots[old + 1:new + 1]
+                self._ranked_values[old:new] = self._ranked_values[old + 1:new + 1]
+            elif new < old:
+                self._ranked_slots[new + 1:old + 1] = self._ranked_slots[new:old]
+                self._ranked_values[new + 1:old + 1] = self._ranked_values[new:old]
+            self._ranked_slots[new] = slot
+            self._ranked_values[new] = value
+        self._placed[slot] = self._values[slot]
+
+    def _rebuild(self):
+        """Sort every user with holdings into a new ranking. Caller holds the lock."""
+        ranked = self._sorted(np.flatnonzero(self._counts > 0))
+        self._ranked_slots = ranked
+        self._ranked_values = -self._values[ranked]
+        self._placed[:] = np.nan
+        self._placed[ranked] = self._values[ranked]
+
+    def _settle(self):
+        """Re-place moved users in the ranking. Caller holds the lock."""
+        if not self._pending:
+            return
+        moved = np.flatnonzero(self._moved)
+        self._moved[moved] = False
+        self._pending = False
+        if len(moved) <= LEADERBOARD_SHIFT_LIMIT:
+            for slot in moved:
+                self._shift(slot)
+            self.placements += len(moved)
+            return
+        if len(moved) * self.rebuild_ratio > len(self._ranked_slots):
+            self._rebuild()
+            self.rebuilds += 1
+            return
+
+        keep = np.ones(len(self._moved), dtype=bool)
+        keep[moved] = False
+        keep = keep[self._ranked_slots]
+        slots = self._ranked_slots[keep]
+        values = self._ranked_values[keep]
+        added = self._sorted(moved[self._counts[moved] > 0])
+        added_values = -self._values[added]
+        places = np.searchsorted(values, added_values, side='left')
+        # Equal values are ordered by user id
+        ties = np.flatnonzero(places < len(values))
+        ties = ties[values[places[ties]] == added_values[ties]]
+        for i in ties:
+            end = np.searchsorted(values, added_values[i], side='right')
+            run = self._user_ids[slots[places[i]:end]]
+            places[i] += np.searchsorted(run, self._user_ids[added[i]])
+        self._ranked_slots = np.insert(slots, places, added)
+        self._ranked_values = np.insert(values, places, added_values)
+        self._placed[moved] = np.nan
+        self._placed[added] = self._values[added]
+        self.placements += len(moved)
+
+    def _entries(self, start, stop):
+        """Return ranking entries for 0-based positions [start, stop). Caller holds the lock."""
+        start = max(start, 0)
+        slots = self._ranked_slots[start:stop]
+        return [
+            {'rank': start + offset + 1, 'user_id': int(user_id), 'total_value': round(-float(value), 2)}
+            for offset, (user_id, value) in enumerate(zip(self._user_ids[slots], self._ranked_values[start:stop]))
+        ]
+
+    def _ready(self):
+        """Load the ranking on first use, or wait for the re-rank thread's first load."""
+        if not self._loaded:
+            with self._rerank_lock:
+                if not self._loaded:
+                    self.rerank()
+
+    def top(self, limit=10):
+        """Return the first `limit` ranking entries."""
+        self._ready()
+        with self._lock:
+            self._settle()
+            return self._entries(0, min(limit, LEADERBOARD_MAX_LIMIT))
+
+    def rank(self, user_id, window=0):
+        """
+        Return a user's rank and value, or None if they hold nothing.
+
+        window > 0 adds the entries up to `window` places above and below.
+        """
+        self._ready()
+        with self._lock:
+            self._settle()
+            slot = self._slots.get(user_id)
+            if slot is None or not self._counts[slot]:
+                return None
+            value = -self._values[slot]
+            position = self._find(value, user_id)
+            result = {'rank': position + 1, 'total_value': round(-float(value), 2),
+                      'total_users': len(self._ranked_slots)}
+            if window > 0:
+                window = min(window, LEADERBOARD_MAX_LIMIT)
+                result['window'] = self._entries(position - window, position + window + 1)
+            return result
+
+    def size(self):
+        """Return the number of ranked users."""
+        self._ready()
+        with self._lock:
+            self._settle()
+            return len(self._ranked_slots)
+
+    def _quote(self, assets):
+        """Return {key: price} for assets with no price yet, falling back to stale quotes."""
+        results = self.fetch_prices(assets)
+        prices = {}
+        for key in assets:
+            result = results.get(key)
+            if not (result and result.get('success')):
+                result, _ = quote_cache.get_stale(*key)
+            if result:
+                prices[key] = result['price']
+        return prices
+
+    def _load(self, prices):
+        """Read the portfolio table into fresh ranking state; no lock held."""
+        keys = {}
+        key_column = array('q')
+        user_column = array('q')
+        quantity_column = array('d')
+        for user_id, ticker, asset_type, quantity in self.holdings():
+            index = keys.get((ticker, asset_type))
+            if index is None:
+                index = keys[(ticker, asset_type)] = len(keys)
+            key_column.append(index)
+            user_column.append(user_id)
+            quantity_column.append(quantity)
+        key_column = np.frombuffer(key_column, dtype=np.int64)
+        quantity_column = np.frombuffer(quantity_column, dtype=np.float64)
+        user_ids, slot_column = np.unique(np.frombuffer(user_column, dtype=np.int64), return_inverse=True)
+
+        missing = [key for key in keys if key not in prices]
+        if missing:
+            prices.update(self._quote(missing))
+        key_prices = np.array([prices.get(key, 0.0) for key in keys])
+        values = np.bincount(slot_column, weights=quantity_column * key_prices[key_column],
+                             minlength=len(user_ids)) if len(keys) else np.zeros(0)
+        counts = np.bincount(slot_column, minlength=len(user_ids)).astype(np.int64)
+
+        order = np.argsort(key_column, kind='stable')
+        bounds = np.cumsum(np.bincount(key_column, minlength=len(keys)))
+        holders = {}
+        start = 0
+        for key, end in zip(keys, bounds):
+            rows = order[start:end]
+            holders[key] = [slot_column[rows].astype(np.int64), quantity_column[rows].copy()]
+            start = end
+        return {
+            'slots': dict(zip(user_ids.tolist(), range(len(user_ids)))),
+            'user_ids': user_ids,
+            'values': values,
+            'counts': counts,
+            'holders': holders,
+            'prices': {key: price for key, price in prices.items() if key in holders},
+        }
+
+    def rerank(self):
+        """
+        Reload holdings, recompute every value and rebuild the ranking.
+
+        The portfolio table is read outside the lock. Quotes and trades
+        that arrive meanwhile are applied on top of the reloaded state
+        before it replaces the running one. Returns a report of how far
+        the running ranking had drifted from the recompute.
+        """
+        with self._rerank_lock:
+            started = time.perf_counter()
+            with self._lock:
+                self._journal = []
+                prices = dict(self._prices)
+            try:
+                state = self._load(prices)
+            except Exception:
+                with self._lock:
+                    self._journal = None
+                raise
+            loaded = time.perf_counter()
+
+            with self._lock:
+                self._settle()
+                old_users = self._user_ids[self._ranked_slots]
+                old_values = {user_id: -value for user_id, value in
+                              zip(old_users.tolist(), self._ranked_values.tolist())}
+                journal, self._journal = self._journal, None
+                running = self._prices
+
+                self._slots = state['slots']
+                self._user_ids = state['user_ids']
+                self._values = state['values']
+                self._counts = state['counts']
+                self._moved = np.zeros(len(self._values), dtype=bool)
+                self._placed = np.full(len(self._values), np.nan)
+                self._holders = state['holders']
+                self._prices = state['prices']
+                self._rebuild()
+                self._pending = False
+
+                new_users = self._user_ids[self._ranked_slots]
+                same = min(len(old_users), len(new_users))
+                moved = int(np.count_nonzero(old_users[:same] != new_users[:same])) + abs(len(old_users) - len(new_users))
+                drift = [abs(old_values[user_id] - value) for user_id, value in
+                         zip(new_users.tolist(), (-self._ranked_values).tolist()) if user_id in old_values]
+
+                # Prices and trades that arrived while the table was being read
+                for key in self._holders:
+                    if key in running and running[key] != self._prices.get(key):
+                        self._set_price(key, running[key])
+                for user_id, key, quantity in journal:
+                    self._set_position(user_id, key, quantity)
+                self._settle()
+
+                self._loaded = True
+                self.reranks += 1
+                self.last_rerank = {
+                    'users': len(self._ranked_slots),
+                    'positions': int(self._counts.sum()),
+                    'moved': moved,
+                    'max_drift': round(max(drift, default=0.0), 6),
+                    'drifted': sum(1 for d in drift if d > LEADERBOARD_TOLERANCE),
+                    'replayed_trades': len(journal),
+                    'load_seconds': round(loaded - started, 3),
+                    'total_seconds': round(time.perf_counter() - started, 3),
+                }
+            return self.last_rerank
+
+    def _run(self):
+        # The first pass loads the board right away, so no request pays for it
+        wait = 0
+        while not self._stop.wait(wait):
+            wait = self.rerank_interval
+            try:
+                warming = not self._loaded
+                report = self.rerank()
+                if warming:
+                    print(f"Leaderboard loaded {report['users']} users in {report['total_seconds']}s")
+                elif report['drifted'] or report['moved']:
+                    print(f"Leaderboard re-rank: {report['moved']} places moved, {report['drifted']} values drifted")
+            except Exception as e:
+                print(f"Leaderboard re-rank error: {e}")
+            finally:
+                release_db_connection()
+
+    def start(self):
+        """Start the re-rank thread, which loads the ranking immediately, if it is not already running."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='leaderboard-rerank', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """Stop the re-rank thread."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def stats(self):
+        """Return sizes, update counters and the last re-rank report."""
+        with self._lock:
+            return {
+                'running': bool(self._thread and self._thread.is_alive()),
+                'loaded': self._loaded,
+                'users': int(np.count_nonzero(self._counts)),
+                'tickers': len(self._holders),
+                'pending': int(np.count_nonzero(self._moved)),
+                'price_updates': self.price_updates,
+                'trades_applied': self.trades_applied,
+                'placements': self.placements,
+                'rebuilds': self.rebuilds,
+                'reranks': self.reranks,
+                'rerank_interval': self.rerank_interval,
+                'last_rerank': self.last_rerank,
+            }
+
+
+# Shared instance kept current by the portfolio routes and the market poller
+leaderboard = Leaderboard()
+price_store.add_listener(leaderboard.apply_quotes)
@@ -0,0 +1,216 @@
+import os
+import random
+import threading
+import time
+
+from backend.models.database import get_held_assets, get_open_order_assets, release_db_connection
+from backend.models.quote_store import (
+    save_shared_quotes,
+    get_shared_quotes,
+    record_quote_interest,
+    get_quote_interest
+)
+from backend.utils.data_fetcher import (
+    get_batch_current_prices,
+    TRENDING_STOCKS,
+    TRENDING_CRYPTOS
+)
+from backend.utils.price_store import price_store
+from backend.utils.quote_cache import quote_cache
+
+# Seconds between refreshes, per asset class
+POLL_INTERVALS = {
+    'stock': float(os.environ.get('POLL_INTERVAL_STOCK', 10)),
+    'crypto': float(os.environ.get('POLL_INTERVAL_CRYPTO', 8)),
+}
+
+# Fraction of the interval added or removed at random to spread upstream load
+POLL_JITTER = float(os.environ.get('POLL_JITTER', 0.1))
+
+# Upper bound for the exponential backoff after failed refreshes
+POLL_MAX_BACKOFF = float(os.environ.get('POLL_MAX_BACKOFF', 300))
+
+# Seconds a requested symbol stays in the universe without being read again
+POLL_IDLE_TIMEOUT = float(os.environ.get('POLL_IDLE_TIMEOUT', 600))
+
+# Seconds between re-reading the held and open-order tickers from the database
+POLL_HELD_REFRESH = float(os.environ.get('POLL_HELD_REFRESH', 60))
+
+
+class MarketPoller:
+    """
+    Background thread that keeps the price store fresh.
+
+    The universe is every held ticker, every ticker with an open order,
+    the trending lists and any symbol read from the price store within
+    POLL_IDLE_TIMEOUT. Each asset class is refreshed with one batched
+    upstream call per interval.
+
+    Only one process polls upstream (the leader, see start). It publishes
+    every refresh to the shared_quotes table; the other processes follow,
+    loading new rows into their own price store, and report the symbols
+    their users read so the leader polls those too. Upstream traffic and
+    rate limits are then the same for one worker or many.
+    """
+
+    def __init__(self, store=price_store, intervals=None, fetch=get_batch_current_prices):
+        self.store = store
+        self.intervals = dict(POLL_INTERVALS)
+        if intervals:
+            self.intervals.update(intervals)
+        self.fetch = fetch
+        self._failures = {asset_type: 0 for asset_type in self.intervals}
+        self._next_due = {asset_type: 0.0 for asset_type in self.intervals}
+        self._held = []
+        self._held_loaded_at = None
+        self._quotes_seen = 0.0
+        self._interest_sent_at = None
+        self.leader = True
+        self._stop = threading.Event()
+        self._thread = None
+        self.cycles = 0
+        self.errors = 0
+        self.last_cycle_seconds = 0.0
+
+    def _pinned(self):
+        """Return the symbols that stay in the universe regardless of reads."""
+        now = time.monotonic()
+        if self._held_loaded_at is None or now - self._held_loaded_at >= POLL_HELD_REFRESH:
+            try:
+                # Tickers with resting orders must keep being quoted for them to trigger
+                self._held = get_held_assets() + get_open_order_assets()
+            except Exception as e:
+                print(f"Market poller could not load held assets: {e}")
+            self._held_loaded_at = now
+        pinned = {(ticker.upper(), asset_type) for ticker, asset_type in self._held}
+        pinned.update((ticker, 'stock') for ticker in TRENDING_STOCKS)
+        pinned.update((ticker, 'crypto') for ticker in TRENDING_CRYPTOS)
+        return pinned
+
+    def universe(self):
+        """Return every (ticker, asset_type) that should be kept fresh."""
+        pinned = self._pinned()
+        self.store.prune(POLL_IDLE_TIMEOUT, keep=pinned)
+        universe = pinned | set(self.store.requested_since(POLL_IDLE_TIMEOUT))
+        try:
+            universe.update(get_quote_interest(POLL_IDLE_TIMEOUT, self.store.max_tracked))
+        except Exception as e:
+            print(f"Market poller could not load requested symbols: {e}")
+        return universe
+
+    def _delay(self, asset_type):
+        interval = self.intervals[asset_type]
+        delay = interval * (1 + random.uniform(-POLL_JITTER, POLL_JITTER))
+        failures = self._failures[asset_type]
+        if failures:
+            delay = min(POLL_MAX_BACKOFF, interval * (2 ** failures)) * random.uniform(0.5, 1.0)
+        return delay
+
+    def refresh(self, asset_type):
+        """Refresh one asset class now. Returns True if the upstream answered."""
+        items = [key for key in self.universe() if key[1] == asset_type]
+        if not items:
+            return True
+
+        try:
+            results = self.fetch(items)
+        except Exception as e:
+            print(f"Market poller {asset_type} refresh failed: {e}")
+            results = {}
+
+        ok = {key: result for key, result in results.items() if result.get('success')}
+        self.store.update(ok)
+        for (ticker, kind), result in ok.items():
+            quote_cache.put(ticker, kind, result)
+        if ok:
+            save_shared_quotes(ok)
+        return bool(ok)
+
+    def follow_once(self):
+        """
+        Load quotes the leader published since the last call and report the
+        symbols read here since the last report. Returns the number of quotes loaded.
+        """
+        now = time.time()
+        if not self._quotes_seen:
+            # Start from quotes still fresh enough to serve
+            self._quotes_seen = now - self.store.max_age
+        quotes, self._quotes_seen = get_shared_quotes(self._quotes_seen)
+        if quotes:
+            self.store.update(quotes)
+            for (ticker, kind), result in quotes.items():
+                quote_cache.put(ticker, kind, result)
+
+        since = now - self._interest_sent_at if self._interest_sent_at else POLL_IDLE_TIMEOUT
+        requested = self.store.read_times(since + 1)
+        if requested:
+            record_quote_interest(requested)
+        self._interest_sent_at = now
+        self.cycles += 1
+        return len(quotes)
+
+    def run_once(self):
+        """Refresh every asset class that is due. Returns seconds until the next one."""
+        now = time.monotonic()
+        for asset_type, due in self._next_due.items():
+            if due > now:
+                continue
+            started = time.monotonic()
+            if self.refresh(asset_type):
+                self._failures[asset_type] = 0
+            else:
+                self._failures[asset_type] += 1
+                self.errors += 1
+            self.cycles += 1
+            self.last_cycle_seconds = time.monotonic() - started
+            self._next_due[asset_type] = time.monotonic() + self._delay(asset_type)
+        return max(0.0, min(self._next_due.values()) - time.monotonic())
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.leader:
+                    wait = self.run_once()
+                else:
+                    self.follow_once()
+                    wait = min(self.intervals.values())
+            except Exception as e:
+                print(f"Market poller error: {e}")
+                self.errors += 1
+                wait = min(self.intervals.values())
+            finally:
+                release_db_connection()
+            self._stop.wait(wait)
+
+    def start(self, leader=True):
+        """
+        Start the poller thread if it is not already running. leader=False
+        follows the quotes another process polls instead of calling upstream.
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self.leader = leader
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='market-poller', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """Stop the poller thread."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def stats(self):
+        """Return cycle and backoff counters."""
+        return {
+            'running': bool(self._thread and self._thread.is_alive()),
+            'leader': self.leader,
+            'cycles': self.cycles,
+            'errors': self.errors,
+            'failures': dict(self._failures),
+            'last_cycle_seconds': round(self.last_cycle_seconds, 3),
+        }
+
+
+# Shared instance started by create_app
+market_poller = MarketPoller()
@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.models.database import release_db_connection
+from backend.models.metadata_store import get_metadata, save_metadata
+
+# Seconds cached metadata is served without a refresh, per asset class
+METADATA_TTLS = {
+    'stock': float(os.environ.get('METADATA_TTL_STOCK', 86400)),
+    'crypto': float(os.environ.get('METADATA_TTL_CRYPTO', 3600)),
+}
+
+# Entries older than this are treated as missing and fetched synchronously
+METADATA_MAX_STALE = float(os.environ.get('METADATA_MAX_STALE', 30 * 86400))
+
+# Threads used for background revalidation
+METADATA_REFRESH_WORKERS = int(os.environ.get('METADATA_REFRESH_WORKERS', 2))
+
+
+class MetadataCache:
+    """
+    Stale-while-revalidate cache for slow asset metadata lookups, persisted
+    in SQLite so it survives restarts.
+
+    Fresh entries are returned as-is. Stale entries are returned immediately
+    and refreshed in the background. Cold misses are fetched synchronously,
+    with concurrent misses for the same symbol merged into one fetch.
+    """
+
+    def __init__(self, ttls=None, max_stale=METADATA_MAX_STALE):
+        self.ttls = dict(METADATA_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.max_stale = max_stale
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._refreshing = set()
+        self._executor = ThreadPoolExecutor(max_workers=METADATA_REFRESH_WORKERS,
+                                            thread_name_prefix='metadata')
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def _fetch(self, key, fetch):
+        """Fetch and persist one entry, merging concurrent callers."""
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = {'event': threading.Event(), 'result': None}
+                self._inflight[key] = flight
+
+        if not leader:
+            flight['event'].wait()
+            return flight['result']
+
+        result = {'success': False, 'error': 'Metadata fetch failed'}
+        try:
+            result = fetch(*key[1:])
+            if result.get('success'):
+                save_metadata(*key, result)
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight['result'] = result
+            flight['event'].set()
+        return result
+
+    def _refresh(self, key, fetch):
+        try:
+            self._fetch(key, fetch)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+            release_db_connection()
+
+    def get(self, provider, ticker, asset_type, fetch):
+        """
+        Return metadata for ticker from the named provider, calling
+        fetch(ticker, asset_type) when needed.
+        """
+        key = (provider, ticker.upper(), asset_type)
+        data, fetched_at = get_metadata(*key)
+        age = time.time() - fetched_at if data is not None else None
+
+        if data is not None and age <= self.ttls.get(asset_type, self.ttls['stock']):
+            self.hits += 1
+            return data
+
+        if data is not None and age <= self.max_stale:
+            self.stale_hits += 1
+            with self._lock:
+                schedule = key not in self._refreshing and key not in self._inflight
+                if schedule:
+                    self._refreshing.add(key)
+            if schedule:
+                self.refreshes += 1
+                self._executor.submit(self._refresh, key, fetch)
+            return data
+
+        self.misses += 1
+        result = self._fetch(key, fetch)
+        if not result.get('success') and data is not None:
+            # Upstream is failing (or its breaker is open); an old answer beats none
+            return data
+        return result
+
+    def stats(self):
+        """Return hit/stale/miss counters."""
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'background_refreshes': self.refreshes,
+            'in_flight': len(self._inflight),
+        }
+
+
+# Shared instance used by data_fetcher
+metadata_cache = MetadataCache()
@@ -0,0 +1,285 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Requests slower than this many milliseconds are logged with their span breakdown (0 = off)
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 0))
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram keyed by a fixed tuple of label names."""
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0, 0.0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((k, [list(v[0]), v[1], v[2]]) for k, v in self._series.items())
+        for label_values, (counts, count, total) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels + ('le',), label_values + (repr(float(bound)),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labels + ('le',), label_values + ('+Inf',))
+            lines.append(f'{self.name}_bucket{labels} {count}')
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {total:.6f}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Gauge:
+    """Single up/down value such as the number of in-flight requests."""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def render(self):
+        return [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} gauge',
+                f'{self.name} {self.value}']
+
+
+request_latency = Histogram(
+    'celesta_http_request_duration_seconds', 'HTTP request latency by endpoint.',
+    ('method', 'endpoint', 'status')
+)
+span_latency = Histogram(
+    'celesta_span_duration_seconds', 'Time spent in database and upstream calls.',
+    ('kind', 'name')
+)
+requests_in_flight = Gauge('celesta_http_requests_in_flight', 'HTTP requests being served.')
+
+_local = threading.local()
+_collectors = []
+
+
+@contextmanager
+def span(kind, name):
+    """
+    Time a block as a `kind` span (e.g. 'db', 'upstream') named `name`.
+
+    Spans nested inside a span of the same kind are not recorded, so a
+    database helper calling another one is only counted once. Spans inside
+    a request are also kept for that request's slow-request log line.
+    """
+    active = getattr(_local, 'active', None)
+    if active is None:
+        active = _local.active = set()
+    if kind in active:
+        yield
+        return
+    active.add(kind)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        active.discard(kind)
+        span_latency.observe(elapsed, kind, name)
+        spans = getattr(_local, 'spans', None)
+        if spans is not None:
+            spans.append((kind, name, elapsed))
+
+
+def carry_spans(fn):
+    """Wrap fn so spans it records on another thread count toward the current request."""
+    spans = getattr(_local, 'spans', None)
+    if spans is None:
+        return fn
+
+    def wrapper(*args, **kwargs):
+        _local.spans = spans
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.spans = None
+    return wrapper
+
+
+def traced(kind):
+    """Decorator recording every call of the function as a `kind` span named after it."""
+    def decorator(f):
+        def wrapper(*args, **kwargs):
+            with span(kind, f.__name__):
+                return f(*args, **kwargs)
+        wrapper.__name__ = f.__name__
+        wrapper.__doc__ = f.__doc__
+        return wrapper
+    return decorator
+
+
+def register_collector(collect):
+    """Register a callable returning extra Prometheus text lines at scrape time."""
+    _collectors.append(collect)
+
+
+def _before_request():
+    from flask import g
+    requests_in_flight.inc()
+    _local.spans = []
+    g.metrics_started = time.perf_counter()
+
+
+def _after_request(response):
+    from flask import g, request
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    request_latency.observe(elapsed, request.method, endpoint, response.status_code)
+
+    if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+        totals = {}
+        for kind, name, seconds in getattr(_local, 'spans', None) or ():
+            key = f'{kind}:{name}'
+            total, count = totals.get(key, (0.0, 0))
+            totals[key] = (total + seconds, count + 1)
+        accounted = sum(total for total, _ in totals.values())
+        parts = [f'{key} {total * 1000:.1f}ms x{count}'
+                 for key, (total, count) in sorted(totals.items(), key=lambda item: -item[1][0])]
+        # Spans from parallel workers can add up to more than the wall time
+        parts.append(f'other {max(elapsed - accounted, 0) * 1000:.1f}ms')
+        print(f"Slow request: {request.method} {request.full_path.rstrip('?')} "
+              f"{response.status_code} in {elapsed * 1000:.1f}ms ({', '.join(parts)})")
+    return response
+
+
+def _teardown_request(exception=None):
+    requests_in_flight.dec()
+    _local.spans = None
+
+
+def init_app(app):
+    """Install request timing hooks on a Flask app."""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+
+def _with_worker(line, worker):
+    """Add the worker label to one sample line; comments pass through."""
+    if not line or line.startswith('#'):
+        return line
+    name, brace, rest = line.partition('{')
+    if brace:
+        return f'{name}{{{worker},{rest}'
+    name, _, value = line.partition(' ')
+    return f'{name}{{{worker}}} {value}'
+
+
+def render_metrics():
+    """
+    Render every metric in the Prometheus text exposition format.
+
+    Every sample carries a worker label with this process's pid. Under
+    gunicorn each scrape reaches one worker, so without it counters from
+    different workers would look like one series jumping and resetting;
+    sum over the label to get the deployment's totals.
+    """
+    lines = []
+    for metric in (request_latency, requests_in_flight, span_latency):
+        lines.extend(metric.render())
+    for collect in _collectors:
+        try:
+            lines.extend(collect())
+        except Exception as e:
+            lines.append(f'# collector {getattr(collect, "__name__", collect)} failed: {e}')
+    worker = _format_labels(('worker',), (os.getpid(),))[1:-1]
+    return '\n'.join(_with_worker(line, worker) for line in lines) + '\n'
+
+
+def gauge_lines(name, help_text, samples, labels=()):
+    """Render a gauge family from (label_values, value) pairs."""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+    for label_values, value in samples:
+        lines.append(f'{name}{_format_labels(labels, label_values)} {value}')
+    return lines
+
+
+def collect_cache_metrics():
+    """Cache hit ratios and sizes, plus upstream throttling and breaker state."""
+    from backend.utils.quote_cache import quote_cache
+    from backend.utils.price_store import price_store
+    from backend.utils.response_cache import response_cache
+    from backend.utils.metadata_cache import metadata_cache
+    from backend.utils.upstream import upstream_stats
+
+    caches = {
+        'quote': quote_cache.stats(),
+        'price_store': price_store.stats(),
+        'response': response_cache.stats(),
+    }
+    metadata = metadata_cache.stats()
+    lookups = metadata['hits'] + metadata['stale_hits'] + metadata['misses']
+    caches['metadata'] = {
+        'hit_ratio': round((metadata['hits'] + metadata['stale_hits']) / lookups, 4) if lookups else 0
+    }
+
+    lines = gauge_lines('celesta_cache_hit_ratio', 'Cache hits over lookups since start.',
+                        [((name,), stats['hit_ratio']) for name, stats in caches.items()], ('cache',))
+    lines += gauge_lines('celesta_cache_entries', 'Entries currently held by each cache.',
+                         [((name,), stats['size']) for name, stats in caches.items() if 'size' in stats],
+                         ('cache',))
+
+    upstream = upstream_stats()
+    lines += ['# HELP celesta_upstream_events_total Upstream calls, retries, throttles and failures.',
+              '# TYPE celesta_upstream_events_total counter']
+    for provider, stats in sorted(upstream.items()):
+        for event, value in sorted(stats.items()):
+            if isinstance(value, int) and not isinstance(value, bool):
+                lines.append(f'celesta_upstream_events_total{_format_labels(("provider", "event"), (provider, event))} {value}')
+    lines += gauge_lines('celesta_upstream_breaker_state', 'Circuit breaker state per provider (1 = current).',
+                         [((provider, state), int(stats['breaker_state'] == state))
+                          for provider, stats in sorted(upstream.items())
+                          for state in ('closed', 'half_open', 'open')],
+                         ('provider', 'state'))
+    return lines
+
+
+register_collector(collect_cache_metrics)
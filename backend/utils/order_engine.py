@@ -0,0 +1,296 @@
+import heapq
+import os
+import threading
+import time
+from collections import deque
+
+from backend.models.database import (
+    fill_orders,
+    iter_open_orders,
+    mark_orders_triggered,
+    release_db_connection
+)
+from backend.utils.price_store import price_store
+from backend.utils.valuation import valuation_book
+from backend.utils.leaderboard import leaderboard
+from backend.utils.analytics import analytics_cache
+from backend.utils.stream_hub import stream_hub
+
+# Triggered orders executed per database transaction
+ORDER_BATCH_SIZE = int(os.environ.get('ORDER_BATCH_SIZE', 500))
+
+# Seconds between checks for orders placed or cancelled by other processes
+ORDER_SYNC_INTERVAL = float(os.environ.get('ORDER_SYNC_INTERVAL', 1))
+
+
+class _Book:
+    """
+    Trigger heaps for one ticker.
+
+    below holds (-level, order_id) and fires once the price is at or below
+    the level (buy limits, sell stops); above holds (level, order_id) and
+    fires at or above it (sell limits, buy stops).
+    """
+
+    __slots__ = ('below', 'above')
+
+    def __init__(self):
+        self.below = []
+        self.above = []
+
+
+class OrderEngine:
+    """
+    Resting limit, stop and stop-limit orders indexed by trigger price.
+
+    Each ticker keeps two heaps keyed by the price at which an order fires,
+    so a quote only pops the orders it crosses and never looks at the rest:
+    a quote that crosses nothing costs two heap peeks. A stop-limit order
+    rests on its stop; when that fires it moves to the other heap as a
+    limit order, which may fire on the same quote.
+
+    Fired orders are queued and executed by the engine thread in batches,
+    one database transaction per batch (see fill_orders), at the price of
+    the quote that crossed them. Cancelled orders are dropped lazily when
+    they reach the top of a heap. Orders placed in other processes are
+    picked up by the periodic sync; ones cancelled there fire as usual and
+    are skipped, since a fill only claims orders that are still open. Only
+    ids still resting are remembered as cancelled, so the cancelled set
+    never outgrows the heaps.
+    """
+
+    def __init__(self, batch_size=ORDER_BATCH_SIZE, sync_interval=ORDER_SYNC_INTERVAL,
+                 load=iter_open_orders, fill=fill_orders, mark_triggered=mark_orders_triggered, publish=None):
+        self.batch_size = batch_size
+        self.sync_interval = sync_interval
+        self.load = load
+        self.fill = fill
+        self.mark_triggered = mark_triggered
+        self.publish = publish if publish is not None else _publish_fill
+        self._books = {}
+        self._stop_limits = {}
+        self._resting = set()
+        self._cancelled = set()
+        self._high_water = 0
+        self._queue = deque()
+        self._triggered = []
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.quotes_checked = 0
+        self.orders_fired = 0
+        self.orders_filled = 0
+        self.orders_rejected = 0
+        self.batches = 0
+        self.last_sync = None
+
+    def _index(self, order, initial=False):
+        """Put one order from iter_open_orders on its trigger heap (lock held)."""
+        order_id, ticker, asset_type, side, order_type, limit_price, stop_price, triggered_at = order
+        book = self._books.get((ticker, asset_type))
+        if book is None:
+            book = self._books[(ticker, asset_type)] = _Book()
+        if order_type == 'stop_limit' and not triggered_at:
+            self._stop_limits[order_id] = limit_price
+            level = stop_price
+            fires_below = side == 'sell'
+        elif order_type == 'stop':
+            level = stop_price
+            fires_below = side == 'sell'
+        else:
+            level = limit_price
+            fires_below = side == 'buy'
+        heap, entry = (book.below, (-level, order_id)) if fires_below else (book.above, (level, order_id))
+        # The initial load appends and heapifies each heap once
+        if initial:
+            heap.append(entry)
+        else:
+            heapq.heappush(heap, entry)
+        self._resting.add(order_id)
+
+    def sync(self):
+        """Index open orders placed since the last sync. Returns how many were added."""
+        started = time.perf_counter()
+        initial = not self._loaded
+        added = 0
+        batch = []
+        for order in self.load(self._high_water):
+            batch.append(order)
+            if len(batch) >= 10000:
+                added += self._add(batch, initial)
+                batch = []
+        added += self._add(batch, initial)
+        if initial:
+            with self._lock:
+                for book in self._books.values():
+                    heapq.heapify(book.below)
+                    heapq.heapify(book.above)
+                self._loaded = True
+        self.last_sync = {'added': added, 'seconds': round(time.perf_counter() - started, 3)}
+        return added
+
+    def _add(self, orders, initial):
+        if not orders:
+            return 0
+        with self._lock:
+            for order in orders:
+                self._index(order, initial)
+            self._high_water = max(self._high_water, orders[-1][0])
+        return len(orders)
+
+    def cancel(self, order_id):
+        """Forget a cancelled order; its heap entry is discarded when it reaches the top."""
+        with self._lock:
+            # Orders already popped (fired or cancelled) have no heap entry left to skip
+            if order_id in self._resting:
+                self._resting.discard(order_id)
+                self._cancelled.add(order_id)
+                self._stop_limits.pop(order_id, None)
+
+    def notify(self):
+        """Wake the engine thread to sync newly placed orders."""
+        self._wake.set()
+
+    def _pop_crossed(self, heap, key, other, other_sign, fired):
+        """
+        Pop every entry on heap at or below key, adding fired order ids to
+        fired. Stop-limit orders move to the other heap instead. Returns the
+        number moved.
+        """
+        converted = 0
+        while heap and heap[0][0] <= key:
+            order_id = heapq.heappop(heap)[1]
+            if order_id in self._cancelled:
+                self._cancelled.discard(order_id)
+                continue
+            limit_price = self._stop_limits.pop(order_id, None)
+            if limit_price is None:
+                self._resting.discard(order_id)
+                fired.append(order_id)
+                continue
+            # A sell stop fires below and rests as a sell limit above, and vice versa
+            heapq.heappush(other, (other_sign * limit_price, order_id))
+            self._triggered.append(order_id)
+            converted += 1
+        return converted
+
+    def apply_quotes(self, results):
+        """Fire resting orders crossed by new quotes and queue them for execution."""
+        queued = 0
+        with self._lock:
+            for key, data in results.items():
+                book = self._books.get(key)
+                if book is None or not data.get('success'):
+                    continue
+                self.quotes_checked += 1
+                price = data['price']
+                fired = []
+                # Repeat while stop-limits move heaps: their limit may already be crossed
+                while (self._pop_crossed(book.below, -price, book.above, 1, fired) +
+                       self._pop_crossed(book.above, price, book.below, -1, fired)):
+                    pass
+                if fired:
+                    self._queue.extend((order_id, price) for order_id in fired)
+                    queued += len(fired)
+            self.orders_fired += queued
+        if queued or self._triggered:
+            self._wake.set()
+
+    def run_once(self):
+        """
+        Sync new orders, then execute everything queued in batches. Returns
+        trade results. A batch whose fill raises is put back at the front of
+        the queue before the error propagates.
+        """
+        self.sync()
+        with self._lock:
+            triggered, self._triggered = self._triggered, []
+        if triggered:
+            self.mark_triggered(triggered)
+        results = []
+        while True:
+            with self._lock:
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            if not batch:
+                break
+            try:
+                filled = self.fill(batch)
+            except Exception:
+                # The batch's transaction rolled back; keep it at the front for the next pass
+                with self._lock:
+                    self._queue.extendleft(reversed(batch))
+                raise
+            self.batches += 1
+            for result in filled:
+                if result['success']:
+                    self.orders_filled += 1
+                    self.publish(result)
+                else:
+                    self.orders_rejected += 1
+            results.extend(filled)
+        return results
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Order engine error: {e}")
+            finally:
+                release_db_connection()
+            self._wake.wait(self.sync_interval)
+            self._wake.clear()
+
+    def start(self):
+        """Start the engine thread if it is not already running."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='order-engine', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """Stop the engine thread."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def watched_assets(self):
+        """Return the tickers with resting orders, which the market poller keeps quoted."""
+        with self._lock:
+            return [key for key, book in self._books.items() if book.below or book.above]
+
+    def stats(self):
+        """Return index sizes and fill counters."""
+        with self._lock:
+            return {
+                'running': bool(self._thread and self._thread.is_alive()),
+                'loaded': self._loaded,
+                'resting': len(self._resting),
+                'cancelled_pending': len(self._cancelled),
+                'tickers': len(self._books),
+                'queued': len(self._queue),
+                'quotes_checked': self.quotes_checked,
+                'orders_fired': self.orders_fired,
+                'orders_filled': self.orders_filled,
+                'orders_rejected': self.orders_rejected,
+                'batches': self.batches,
+                'last_sync': self.last_sync,
+            }
+
+
+def _publish_fill(result):
+    """Apply a filled order to the in-memory views, as the buy and sell routes do."""
+    user_id = result['user_id']
+    valuation_book.apply_trade(user_id, result['version'], result['position'], result['price'])
+    leaderboard.apply_trade(user_id, result['position'], result['price'])
+    analytics_cache.invalidate(user_id)
+    stream_hub.holdings_changed(user_id)
+
+
+# Shared instance fired by the market poller's quotes and filled by its own thread
+order_engine = OrderEngine()
+price_store.add_listener(order_engine.apply_quotes)
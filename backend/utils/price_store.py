@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+
+# Seconds a polled quote may be served before request handlers fall back
+# to fetching it themselves
+PRICE_STORE_MAX_AGE = float(os.environ.get('PRICE_STORE_MAX_AGE', 30))
+
+# Most requested symbols tracked for polling; the least recently read are dropped first
+PRICE_STORE_MAX_TRACKED = int(os.environ.get('PRICE_STORE_MAX_TRACKED', 2000))
+
+
+class PriceStore:
+    """
+    In-memory latest-quote store filled by the background market poller.
+
+    Reads are O(1) dict lookups and also record when each symbol was last
+    asked for, which is how the poller learns which symbols to keep fresh.
+    Only symbols that have quoted successfully are recorded (see track),
+    so made-up tickers from request URLs never reach the poller, and at
+    most max_tracked symbols are kept.
+    """
+
+    def __init__(self, max_age=PRICE_STORE_MAX_AGE, max_tracked=PRICE_STORE_MAX_TRACKED):
+        self.max_age = max_age
+        self.max_tracked = max_tracked
+        self._quotes = {}
+        self._requested = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, ticker, asset_type):
+        """Return the stored quote if it is fresh enough, else None."""
+        key = (ticker.upper(), asset_type)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._quotes.get(key)
+            if entry:
+                self._record(key, now)
+            if entry and now - entry[1] <= self.max_age:
+                self._hits += 1
+                return dict(entry[0])
+            self._misses += 1
+        return None
+
+    def _record(self, key, now):
+        """Mark key as just read, dropping the least recently read key past the cap (lock held)."""
+        # Re-inserting keeps the dict in least-recently-read order
+        self._requested.pop(key, None)
+        self._requested[key] = now
+        if len(self._requested) > self.max_tracked:
+            del self._requested[next(iter(self._requested))]
+
+    def track(self, ticker, asset_type):
+        """Record a read of a symbol that was just quoted successfully outside the store."""
+        with self._lock:
+            self._record((ticker.upper(), asset_type), time.monotonic())
+
+    def update(self, results):
+        """Store successful results from a dict keyed by (ticker, asset_type) and notify listeners."""
+        now = time.monotonic()
+        with self._lock:
+            for (ticker, asset_type), result in results.items():
+                if result and result.get('success'):
+                    self._quotes[(ticker.upper(), asset_type)] = (dict(result), now)
+        for listener in self._listeners:
+            try:
+                listener(results)
+            except Exception as e:
+                print(f"Price store listener error: {e}")
+
+    def add_listener(self, callback):
+        """Call callback(results) after every update, on the updating thread."""
+        self._listeners.append(callback)
+
+    def requested_since(self, seconds):
+        """Return the keys that were read within the last `seconds`."""
+        cutoff = time.monotonic() - seconds
+        with self._lock:
+            return [key for key, at in self._requested.items() if at >= cutoff]
+
+    def read_times(self, seconds):
+        """Return {key: wall-clock time of the last read} for keys read within the last `seconds`."""
+        now = time.monotonic()
+        offset = time.time() - now
+        with self._lock:
+            return {key: at + offset for key, at in self._requested.items() if at >= now - seconds}
+
+    def prune(self, idle_seconds, keep=()):
+        """
+        Forget symbols nobody has read for idle_seconds, except those in keep.
+        Returns the number of symbols removed.
+        """
+        cutoff = time.monotonic() - idle_seconds
+        keep = set(keep)
+        removed = 0
+        with self._lock:
+            for key in [k for k, at in self._requested.items() if at < cutoff]:
+                del self._requested[key]
+            for key in list(self._quotes):
+                if key not in keep and key not in self._requested:
+                    del self._quotes[key]
+                    removed += 1
+        return removed
+
+    def stats(self):
+        """Return size and hit/miss counters."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'size': len(self._quotes),
+                'tracked': len(self._requested),
+                'max_tracked': self.max_tracked,
+                'max_age': self.max_age,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': round(self._hits / lookups, 4) if lookups else 0,
+            }
+
+
+# Shared instance used by the API
+price_store = PriceStore()
@@ -0,0 +1,498 @@
+import math
+import os
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+from backend.utils.upstream import coingecko_client, yahoo_client, UpstreamError, UPSTREAM_READ_TIMEOUT
+
+# CoinGecko API base URL (free, no API key needed)
+COINGECKO_BASE_URL = os.environ.get('COINGECKO_BASE_URL', 'https://api.coingecko.com/api/v3')
+
+# Mapping common crypto symbols to CoinGecko IDs
+CRYPTO_ID_MAP = {
+    'BTC': 'bitcoin',
+    'ETH': 'ethereum',
+    'USDT': 'tether',
+    'BNB': 'binancecoin',
+    'SOL': 'solana',
+    'XRP': 'ripple',
+    'ADA': 'cardano',
+    'DOGE': 'dogecoin',
+    'AVAX': 'avalanche-2',
+    'DOT': 'polkadot',
+    'MATIC': 'matic-network',
+    'LINK': 'chainlink',
+    'UNI': 'uniswap',
+    'ATOM': 'cosmos',
+    'LTC': 'litecoin',
+}
+
+# Bar length in seconds for each history interval
+INTERVAL_SECONDS = {
+    '1m': 60, '2m': 120, '5m': 300, '15m': 900, '30m': 1800, '60m': 3600, '90m': 5400,
+    '1h': 3600, '1d': 86400, '5d': 432000, '1wk': 604800, '1mo': 2592000, '3mo': 7776000
+}
+
+# Maximum symbols per multi-symbol upstream request
+STOCK_BATCH_SIZE = 100
+CRYPTO_BATCH_SIZE = 250
+
+# Provider names per asset class; MARKET_PROVIDER overrides both
+MARKET_PROVIDER = os.environ.get('MARKET_PROVIDER')
+STOCK_PROVIDER = os.environ.get('STOCK_PROVIDER', 'yfinance')
+CRYPTO_PROVIDER = os.environ.get('CRYPTO_PROVIDER', 'coingecko')
+
+# Seed for the simulator so every process generates the same prices
+SIMULATOR_SEED = int(os.environ.get('SIMULATOR_SEED', 42))
+
+
+def _chunks(items, size):
+    """Split a list into consecutive chunks of at most size items."""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def frame_to_bars(data):
+    """Convert a yfinance OHLCV DataFrame to bar tuples without a per-row loop."""
+    if len(data) == 0:
+        return []
+    timestamps = pd.DatetimeIndex(data.index).as_unit('s').asi8
+    return list(zip(
+        timestamps.tolist(),
+        data['Open'].to_numpy(dtype=float).tolist(),
+        data['High'].to_numpy(dtype=float).tolist(),
+        data['Low'].to_numpy(dtype=float).tolist(),
+        data['Close'].to_numpy(dtype=float).tolist(),
+        data['Volume'].fillna(0).to_numpy(dtype=float).tolist()
+    ))
+
+
+def _download(tickers, **kwargs):
+    """
+    yf.download that raises when no symbol came back, so the upstream client
+    counts and retries the failure. Returns (frame, {ticker: error}).
+    """
+    data = yf.download(tickers, **kwargs)
+    errors = {ticker: error for ticker, error in yf.shared._ERRORS.items() if ticker in tickers}
+    if len(data) == 0 or len(errors) >= len(tickers):
+        raise UpstreamError(f"yfinance download failed: {next(iter(errors.values()), 'no data returned')}")
+    return data, errors
+
+
+class MarketDataProvider:
+    """
+    Source of quotes, bars and asset info for one asset class.
+
+    quote, batch_quotes and info return the usual {'success': ...} result
+    dicts; bars returns (ts, open, high, low, close, volume) tuples and may
+    raise on failure.
+    """
+
+    name = None
+
+    def __init__(self, asset_type='stock'):
+        self.asset_type = asset_type
+
+    def quote(self, ticker):
+        """Get the current price for one symbol."""
+        raise NotImplementedError
+
+    def batch_quotes(self, tickers):
+        """Get current prices for many symbols as {ticker: result}."""
+        return {ticker: self.quote(ticker) for ticker in tickers}
+
+    def bars(self, ticker, interval, start_ts, end_ts=None):
+        """Get bars of `interval` in [start_ts, end_ts); end_ts None means now."""
+        raise NotImplementedError
+
+    def info(self, ticker):
+        """Get descriptive information about a symbol."""
+        raise NotImplementedError
+
+
+class YFinanceProvider(MarketDataProvider):
+    """Stocks from Yahoo Finance through yfinance."""
+
+    name = 'yfinance'
+
+    def quote(self, ticker):
+        try:
+            stock = yf.Ticker(ticker, session=yahoo_client.session)
+            data = yahoo_client.call(stock.history, period='1d', interval='1m',
+                                     timeout=UPSTREAM_READ_TIMEOUT, raise_errors=True)
+            if len(data) > 0:
+                current_price = data['Close'].iloc[-1]
+                return {
+                    'success': True,
+                    'ticker': ticker,
+                    'price': round(float(current_price), 2),
+                    'timestamp': datetime.now().isoformat()
+                }
+            return {'success': False, 'error': 'No data available'}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+    def batch_quotes(self, tickers):
+        """One yf.download call per chunk of STOCK_BATCH_SIZE symbols."""
+        results = {}
+        for chunk in _chunks(tickers, STOCK_BATCH_SIZE):
+            try:
+                data, errors = yahoo_client.call(_download, chunk, period='1d', interval='1m',
+                                                 group_by='ticker', threads=True, progress=False,
+                                                 timeout=UPSTREAM_READ_TIMEOUT, session=yahoo_client.session)
+            except Exception as e:
+                for ticker in chunk:
+                    results[ticker] = {'success': False, 'error': str(e)}
+                continue
+
+            for ticker in chunk:
+                try:
+                    if isinstance(data.columns, pd.MultiIndex):
+                        if ticker not in data.columns.get_level_values(0):
+                            raise KeyError(ticker)
+                        closes = data[ticker]['Close'].dropna()
+                    else:
+                        closes = data['Close'].dropna()
+                except KeyError:
+                    closes = []
+
+                if len(closes) > 0:
+                    results[ticker] = {
+                        'success': True,
+                        'ticker': ticker,
+                        'price': round(float(closes.iloc[-1]), 2),
+                        'timestamp': datetime.now().isoformat()
+                    }
+                else:
+                    results[ticker] = {'success': False, 'error': errors.get(ticker, 'No data available')}
+        return results
+
+    def bars(self, ticker, interval, start_ts, end_ts=None):
+        stock = yf.Ticker(ticker, session=yahoo_client.session)
+        data = yahoo_client.call(
+            stock.history,
+            start=datetime.fromtimestamp(start_ts, timezone.utc),
+            end=datetime.fromtimestamp(end_ts, timezone.utc) if end_ts else None,
+            interval=interval,
+            timeout=UPSTREAM_READ_TIMEOUT,
+            raise_errors=True
+        )
+        return frame_to_bars(data)
+
+    def info(self, ticker):
+        try:
+            stock = yf.Ticker(ticker, session=yahoo_client.session)
+            info = yahoo_client.call(stock.get_info)
+
+            return {
+                'success': True,
+                'ticker': ticker,
+                'symbol': info.get('symbol'),
+                'name': info.get('longName', ticker),
+                'sector': info.get('sector', 'N/A'),
+                'market_cap': info.get('marketCap', 0),
+                'pe_ratio': info.get('trailingPE', 0),
+                'volume': info.get('volume', 0),
+                'avg_volume': info.get('averageVolume', 0),
+                '52w_high': info.get('fiftyTwoWeekHigh', 0),
+                '52w_low': info.get('fiftyTwoWeekLow', 0),
+                'description': info.get('longBusinessSummary', 'No description available')
+            }
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+
+class CoinGeckoProvider(MarketDataProvider):
+    """Cryptocurrencies from the CoinGecko public API."""
+
+    name = 'coingecko'
+
+    def quote(self, ticker):
+        return self.batch_quotes([ticker])[ticker]
+
+    def batch_quotes(self, tickers):
+        """One /simple/price call per chunk of CRYPTO_BATCH_SIZE ids."""
+        results = {}
+        ids = {}
+        for ticker in tickers:
+            crypto_id = CRYPTO_ID_MAP.get(ticker.upper())
+            if crypto_id:
+                ids[ticker] = crypto_id
+            else:
+                results[ticker] = {'success': False, 'error': 'Cryptocurrency not found'}
+
+        for chunk in _chunks(list(ids), CRYPTO_BATCH_SIZE):
+            try:
+                url = f"{COINGECKO_BASE_URL}/simple/price"
+                params = {
+                    'ids': ','.join(sorted({ids[t] for t in chunk})),
+                    'vs_currencies': 'usd',
+                    'include_24hr_change': 'true',
+                    'include_market_cap': 'true',
+                    'include_24hr_vol': 'true'
+                }
+                response = coingecko_client.get(url, params)
+                data = response.json()
+            except Exception as e:
+                for ticker in chunk:
+                    results[ticker] = {'success': False, 'error': str(e)}
+                continue
+
+            for ticker in chunk:
+                quote = data.get(ids[ticker])
+                if quote and 'usd' in quote:
+                    results[ticker] = {
+                        'success': True,
+                        'ticker': ticker.upper(),
+                        'price': quote['usd'],
+                        'change_24h': quote.get('usd_24h_change', 0),
+                        'market_cap': quote.get('usd_market_cap', 0),
+                        'volume_24h': quote.get('usd_24h_vol', 0),
+                        'timestamp': datetime.now().isoformat()
+                    }
+                else:
+                    results[ticker] = {'success': False, 'error': 'No data available'}
+        return results
+
+    def bars(self, ticker, interval, start_ts, end_ts=None):
+        """
+        Close-only bars. CoinGecko only serves "the last N days", so the
+        range is widened to end now.
+        """
+        crypto_id = CRYPTO_ID_MAP.get(ticker.upper())
+        if not crypto_id:
+            raise ValueError('Cryptocurrency not found')
+        step = INTERVAL_SECONDS.get(interval, 86400)
+        days = max(1, math.ceil((time.time() - start_ts) / 86400))
+        url = f"{COINGECKO_BASE_URL}/coins/{crypto_id}/market_chart"
+        params = {
+            'vs_currency': 'usd',
+            'days': days,
+            'interval': 'daily' if step >= 86400 else 'hourly'
+        }
+        response = coingecko_client.get(url, params)
+        data = response.json()
+        if 'prices' not in data:
+            raise ValueError(data.get('error', 'No data available'))
+
+        volumes = {point[0]: point[1] for point in data.get('total_volumes', [])}
+        bars = {}
+        for ms, price in data['prices']:
+            # The trailing "now" point replaces the current bucket instead of piling up
+            ts = int(ms // 1000) // step * step
+            bars[ts] = (ts, price, price, price, price, volumes.get(ms, 0) or 0)
+        return list(bars.values())
+
+    def info(self, ticker):
+        try:
+            crypto_id = CRYPTO_ID_MAP.get(ticker.upper())
+            if not crypto_id:
+                return {'success': False, 'error': 'Cryptocurrency not found'}
+
+            url = f"{COINGECKO_BASE_URL}/coins/{crypto_id}"
+            params = {
+                'localization': 'false',
+                'tickers': 'false',
+                'community_data': 'false',
+                'developer_data': 'false'
+            }
+
+            response = coingecko_client.get(url, params)
+            data = response.json()
+
+            market_data = data.get('market_data', {})
+
+            return {
+                'success': True,
+                'ticker': ticker.upper(),
+                'name': data.get('name', ticker),
+                'symbol': data.get('symbol', ticker).upper(),
+                'market_cap': market_data.get('market_cap', {}).get('usd', 0),
+                'total_volume': market_data.get('total_volume', {}).get('usd', 0),
+                'high_24h': market_data.get('high_24h', {}).get('usd', 0),
+                'low_24h': market_data.get('low_24h', {}).get('usd', 0),
+                'price_change_24h': market_data.get('price_change_percentage_24h', 0),
+                'circulating_supply': market_data.get('circulating_supply', 0),
+                'description': data.get('description', {}).get('en', 'No description available')
+            }
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+
+class SimulatorProvider(MarketDataProvider):
+    """
+    In-process market simulator for any symbol, with no network I/O.
+
+    Each symbol follows a seeded geometric random walk built with Lévy's
+    midpoint construction of Brownian motion over 2**LEVELS minutes from
+    ORIGIN. The price at any instant is computed directly from LEVELS hashed
+    normals, so quotes and bars at every interval agree with each other and
+    are identical across processes for the same seed. The walk is pinned to
+    the symbol's base price at ANCHOR so present-day prices stay plausible.
+    """
+
+    name = 'simulator'
+
+    ORIGIN = 946684800  # 2000-01-01 UTC
+    ANCHOR = 1704067200  # 2024-01-01 UTC
+    LEVELS = 25         # 2**25 minutes, about 63 years
+    MAX_BARS = 100000
+
+    # Annualised volatility of the log price per asset class
+    VOLATILITY = {'stock': 0.3, 'crypto': 0.8}
+
+    def __init__(self, asset_type='stock', seed=SIMULATOR_SEED):
+        super().__init__(asset_type)
+        self.seed = seed
+        self.volatility = self.VOLATILITY.get(asset_type, self.VOLATILITY['stock'])
+        levels = np.arange(self.LEVELS)
+        self._levels = levels[:, None]
+        self._scales = (2.0 ** levels)[:, None]
+        self._last_index = (2 ** levels - 1)[:, None]
+        self._weights = (2.0 ** (-levels / 2 - 1))[:, None]
+
+    def _key(self, ticker):
+        return zlib.crc32(ticker.upper().encode()) ^ (self.seed * 0x9E3779B1 & 0xFFFFFFFF)
+
+    @staticmethod
+    def _hash(values):
+        """splitmix64 over a uint64 array."""
+        with np.errstate(over='ignore'):
+            z = values + np.uint64(0x9E3779B97F4A7C15)
+            z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+            z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+            return z ^ (z >> np.uint64(31))
+
+    def _normals(self, key, level, index):
+        """Standard normals keyed by (symbol, level, index), via Box-Muller."""
+        base = ((np.uint64(key) << np.uint64(32))
+                ^ (np.asarray(level).astype(np.uint64) << np.uint64(26))
+                ^ np.asarray(index).astype(np.uint64))
+        h1 = self._hash(base)
+        h2 = self._hash(h1)
+        u1 = ((h1 >> np.uint64(11)).astype(float) + 1) / 2.0 ** 53
+        u2 = (h2 >> np.uint64(11)).astype(float) / 2.0 ** 53
+        return np.sqrt(-2 * np.log(u1)) * np.cos(2 * np.pi * u2)
+
+    def _walk(self, key, timestamps):
+        """Standard Brownian motion on [0, 1] sampled at the given epoch seconds."""
+        t = np.clip((np.asarray(timestamps, dtype=float) - self.ORIGIN) / 60 / 2 ** self.LEVELS, 0, 1)
+        scaled = t * self._scales
+        index = np.minimum(scaled.astype(np.int64), self._last_index)
+        tent = 1 - np.abs(2 * (scaled - index) - 1)
+        walk = (self._normals(key, self._levels, index) * tent * self._weights).sum(axis=0)
+        return walk + self._normals(key, self.LEVELS, 0) * t
+
+    def prices(self, ticker, timestamps):
+        """Simulated prices at an array of epoch seconds."""
+        key = self._key(ticker)
+        timestamps = np.append(np.asarray(timestamps, dtype=float), self.ANCHOR)
+        walk = self._walk(key, timestamps)
+        sigma_total = self.volatility * math.sqrt(2 ** self.LEVELS / 525960)
+        base = 10 + (key % 49000) / 100
+        return base * np.exp(sigma_total * (walk[:-1] - walk[-1]))
+
+    def quote(self, ticker):
+        now = time.time()
+        current, day_ago = self.prices(ticker, [now, now - 86400])
+        return {
+            'success': True,
+            'ticker': ticker.upper(),
+            'price': round(float(current), 2),
+            'change_24h': round(float((current / day_ago - 1) * 100), 4),
+            'timestamp': datetime.now().isoformat()
+        }
+
+    def bars(self, ticker, interval, start_ts, end_ts=None):
+        step = INTERVAL_SECONDS.get(interval, 86400)
+        end_ts = min(end_ts or time.time(), time.time())
+        start_ts = max(start_ts, self.ORIGIN, end_ts - self.MAX_BARS * step)
+        first = -(-int(start_ts) // step) * step
+        starts = np.arange(first, end_ts, step, dtype=np.int64)
+        if len(starts) == 0:
+            return []
+        # Five samples per bar: open, three interior points and the close
+        samples = starts[:, None] + np.array([0, 0.25, 0.5, 0.75, 1.0]) * step
+        samples = np.minimum(samples, time.time())
+        prices = self.prices(ticker, samples.ravel()).reshape(-1, 5)
+        volume = (self._hash(starts.astype(np.uint64) ^ np.uint64(self._key(ticker))) % np.uint64(1000000)).astype(float)
+        return list(zip(
+            starts.tolist(),
+            prices[:, 0].tolist(),
+            prices.max(axis=1).tolist(),
+            prices.min(axis=1).tolist(),
+            prices[:, 4].tolist(),
+            (volume * (step / 60)).tolist()
+        ))
+
+    def info(self, ticker):
+        ticker = ticker.upper()
+        price = float(self.prices(ticker, [time.time()])[0])
+        year = self.prices(ticker, time.time() - np.arange(0, 365 * 86400, 86400))
+        return {
+            'success': True,
+            'ticker': ticker,
+            'symbol': ticker,
+            'name': f'{ticker} (simulated)',
+            'sector': 'Simulated',
+            'market_cap': round(price * (1e8 + self._key(ticker) % 10 ** 10)),
+            'pe_ratio': round(10 + self._key(ticker) % 3000 / 100, 2),
+            'volume': int(self._key(ticker) % 10 ** 7),
+            'avg_volume': int(self._key(ticker) % 10 ** 7),
+            '52w_high': round(float(year.max()), 2),
+            '52w_low': round(float(year.min()), 2),
+            'description': f'Simulated random-walk market data for {ticker}.'
+        }
+
+
+# Registered provider factories by name
+PROVIDERS = {}
+
+_selected = {
+    'stock': MARKET_PROVIDER or STOCK_PROVIDER,
+    'crypto': MARKET_PROVIDER or CRYPTO_PROVIDER,
+}
+_instances = {}
+_lock = threading.Lock()
+
+
+def register_provider(name, factory):
+    """Register a provider factory, called with the asset class, under a config name."""
+    PROVIDERS[name] = factory
+
+
+def use_provider(name, asset_type=None):
+    """Select the provider for one asset class, or for both if asset_type is None."""
+    if name not in PROVIDERS:
+        raise ValueError(f'Unknown market data provider: {name}')
+    for key in ([asset_type] if asset_type else list(_selected)):
+        _selected[key] = name
+
+
+def get_provider(asset_type):
+    """Get the configured provider instance for an asset class."""
+    asset_type = 'crypto' if asset_type == 'crypto' else 'stock'
+    name = _selected[asset_type]
+    with _lock:
+        provider = _instances.get((name, asset_type))
+        if provider is None:
+            if name not in PROVIDERS:
+                raise ValueError(f'Unknown market data provider: {name}')
+            provider = PROVIDERS[name](asset_type)
+            _instances[(name, asset_type)] = provider
+        return provider
+
+
+def selected_providers():
+    """Return the provider name configured for each asset class."""
+    return dict(_selected)
+
+
+register_provider('yfinance', YFinanceProvider)
+register_provider('coingecko', CoinGeckoProvider)
+register_provider('simulator', SimulatorProvider)
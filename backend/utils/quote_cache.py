@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Seconds a quote stays fresh, per asset class
+DEFAULT_TTLS = {
+    'stock': float(os.environ.get('QUOTE_TTL_STOCK', 15)),
+    'crypto': float(os.environ.get('QUOTE_TTL_CRYPTO', 10)),
+}
+
+# Maximum number of (ticker, asset_type) entries kept before LRU eviction
+DEFAULT_MAX_SIZE = int(os.environ.get('QUOTE_CACHE_SIZE', 2048))
+
+
+class _Flight:
+    """A single upstream fetch that other callers can wait on."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+
+class QuoteCache:
+    """
+    Process-wide quote cache keyed by (ticker, asset_type).
+
+    Entries expire after a per-asset-class TTL and the least recently used
+    entry is evicted once the cache is full. Concurrent misses for the same
+    key are merged so that only one caller hits the upstream provider.
+    """
+
+    def __init__(self, ttls=None, max_size=DEFAULT_MAX_SIZE):
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._evictions = 0
+        self._hit_age_total = 0.0
+        self._hit_age_max = 0.0
+
+    def _ttl(self, asset_type):
+        return self.ttls.get(asset_type, self.ttls['stock'])
+
+    def _lookup(self, key, now):
+        """Return a fresh cached result or None. Caller must hold the lock."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        result, stored_at = entry
+        age = now - stored_at
+        if age > self._ttl(key[1]):
+            # Expired entries stay around for get_stale until evicted
+            return None
+        self._entries.move_to_end(key)
+        self._hits += 1
+        self._hit_age_total += age
+        self._hit_age_max = max(self._hit_age_max, age)
+        return result
+
+    def peek(self, ticker, asset_type):
+        """Return a fresh cached quote without fetching, or None."""
+        key = (ticker.upper(), asset_type)
+        with self._lock:
+            result = self._lookup(key, time.monotonic())
+            if result is None:
+                self._misses += 1
+        return dict(result) if result else None
+
+    def get_stale(self, ticker, asset_type):
+        """
+        Return (result, age) for the last known quote even if it has expired,
+        or (None, None) if the ticker was never cached or has been evicted.
+        """
+        key = (ticker.upper(), asset_type)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, None
+            result, stored_at = entry
+            return dict(result), time.monotonic() - stored_at
+
+    def put(self, ticker, asset_type, result):
+        """Store a successful quote result."""
+        if not result or not result.get('success'):
+            return
+        key = (ticker.upper(), asset_type)
+        with self._lock:
+            self._entries[key] = (dict(result), time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def get(self, ticker, asset_type, fetch):
+        """
+        Return the cached quote for ticker, calling fetch(ticker, asset_type)
+        on a miss. Only successful results are cached.
+        """
+        key = (ticker.upper(), asset_type)
+
+        with self._lock:
+            result = self._lookup(key, time.monotonic())
+            if result is not None:
+                return dict(result)
+            self._misses += 1
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._inflight[key] = flight
+            else:
+                self._coalesced += 1
+
+        if not leader:
+            flight.event.wait()
+            return dict(flight.result)
+
+        result = {'success': False, 'error': 'Quote fetch failed'}
+        try:
+            result = fetch(ticker, asset_type)
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+        finally:
+            self.put(ticker, asset_type, result)
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.result = result
+            flight.event.set()
+        return dict(result)
+
+    def invalidate(self, ticker=None, asset_type=None):
+        """Drop one entry, or every entry when ticker is None."""
+        with self._lock:
+            if ticker is None:
+                self._entries.clear()
+            else:
+                self._entries.pop((ticker.upper(), asset_type), None)
+
+    def stats(self):
+        """Return hit/miss counters and entry ages."""
+        now = time.monotonic()
+        with self._lock:
+            lookups = self._hits + self._misses
+            ages = [now - stored_at for _, stored_at in self._entries.values()]
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttls': dict(self.ttls),
+                'hits': self._hits,
+                'misses': self._misses,
+                'coalesced': self._coalesced,
+                'evictions': self._evictions,
+                'in_flight': len(self._inflight),
+                'hit_ratio': round(self._hits / lookups, 4) if lookups else 0,
+                'avg_hit_age': round(self._hit_age_total / self._hits, 3) if self._hits else 0,
+                'max_hit_age': round(self._hit_age_max, 3),
+                'oldest_entry_age': round(max(ages), 3) if ages else 0,
+            }
+
+
+# Shared instance used by the API
+quote_cache = QuoteCache()
@@ -0,0 +1,100 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.utils.data_fetcher import get_cached_price, peek_price
+from backend.utils.quote_cache import quote_cache
+from backend.utils.metrics import carry_spans
+
+# Worker threads shared by every request that fans out quote lookups
+QUOTE_WORKERS = int(os.environ.get('QUOTE_WORKERS', 16))
+
+# Maximum lookups a single request may have running at once
+QUOTE_REQUEST_CONCURRENCY = int(os.environ.get('QUOTE_REQUEST_CONCURRENCY', 8))
+
+# Seconds a request waits for its quotes before answering without them
+QUOTE_DEADLINE = float(os.environ.get('QUOTE_DEADLINE', 2.0))
+
+_executor = ThreadPoolExecutor(max_workers=QUOTE_WORKERS, thread_name_prefix='quote')
+
+
+def fetch_quotes(items, deadline=None, concurrency=None):
+    """
+    Look up current prices for many assets in parallel on the shared executor.
+
+    items: iterable of (ticker, asset_type) pairs
+    Returns a dict keyed by (ticker, asset_type). Lookups that have not
+    finished by the deadline fall back to the last known cached quote marked
+    'stale': True, or to a failed result marked 'timed_out': True. Failed
+    lookups also fall back to the last known quote when there is one. Lookups
+    still running at the deadline finish in the background and land in the
+    quote cache for the next request; queued ones are dropped.
+    """
+    deadline = QUOTE_DEADLINE if deadline is None else deadline
+    concurrency = concurrency or QUOTE_REQUEST_CONCURRENCY
+
+    keys = list(dict.fromkeys(items))
+    results = {}
+    pending = []
+
+    # Fresh cache hits never touch the executor
+    for ticker, asset_type in keys:
+        cached = peek_price(ticker, asset_type)
+        if cached:
+            results[(ticker, asset_type)] = cached
+        else:
+            pending.append((ticker, asset_type))
+
+    if pending:
+        lock = threading.Lock()
+        done = threading.Event()
+        state = {'remaining': len(pending), 'expired': False}
+        queue = list(reversed(pending))
+        fetched = {}
+        fetch = carry_spans(get_cached_price)
+
+        def launch():
+            with lock:
+                if state['expired'] or not queue:
+                    return
+                key = queue.pop()
+            future = _executor.submit(fetch, *key)
+            future.add_done_callback(lambda f, key=key: finish(key, f))
+
+        def finish(key, future):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'success': False, 'error': str(e)}
+            with lock:
+                fetched[key] = result
+                state['remaining'] -= 1
+                if state['remaining'] == 0:
+                    done.set()
+            launch()
+
+        for _ in range(min(concurrency, len(pending))):
+            launch()
+
+        done.wait(deadline)
+        with lock:
+            state['expired'] = True
+            results.update(fetched)
+
+        for ticker, asset_type in pending:
+            result = results.get((ticker, asset_type))
+            if result and result['success']:
+                continue
+            stale, age = quote_cache.get_stale(ticker, asset_type)
+            if stale:
+                stale['stale'] = True
+                stale['age'] = round(age, 3)
+                results[(ticker, asset_type)] = stale
+            elif result is None:
+                results[(ticker, asset_type)] = {
+                    'success': False,
+                    'error': 'Quote not available before deadline',
+                    'timed_out': True
+                }
+
+    return results
@@ -0,0 +1,113 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import request, make_response
+
+# Maximum number of serialized responses kept before LRU eviction
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 1024))
+
+
+class ResponseCache:
+    """
+    Serialized-response cache keyed by path and query arguments.
+
+    Only 200 responses are stored. Each entry keeps the body, mimetype and
+    a content hash used as the ETag.
+    """
+
+    def __init__(self, max_size=RESPONSE_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry['expires_at'] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, mimetype, etag, ttl):
+        with self._lock:
+            self._entries[key] = {
+                'body': body,
+                'mimetype': mimetype,
+                'etag': etag,
+                'ttl': ttl,
+                'expires_at': time.monotonic() + ttl
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0,
+            }
+
+
+# Shared instance used by the market blueprint
+response_cache = ResponseCache()
+
+
+def _cache_key():
+    args = sorted(request.args.items(multi=True))
+    return request.path + '?' + '&'.join(f'{k}={v}' for k, v in args)
+
+
+def _conditional(response, etag, ttl):
+    """Attach validators and turn the response into a 304 if the client has it."""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={int(ttl)}'
+    response.make_conditional(request)
+    if response.status_code == 304:
+        response_cache.not_modified += 1
+    return response
+
+
+def cached_response(ttl):
+    """
+    Decorator that caches a GET view's successful responses for ttl seconds
+    and answers If-None-Match with 304 Not Modified.
+    """
+    def decorator(f):
+        def wrapper(*args, **kwargs):
+            key = _cache_key()
+            entry = response_cache.get(key)
+            if entry is not None:
+                response = make_response(entry['body'])
+                response.mimetype = entry['mimetype']
+                remaining = entry['expires_at'] - time.monotonic()
+                return _conditional(response, entry['etag'], max(remaining, 0))
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+            body = response.get_data()
+            etag = hashlib.sha1(body).hexdigest()
+            response_cache.put(key, body, response.mimetype, etag, ttl)
+            return _conditional(response, etag, ttl)
+        wrapper.__name__ = f.__name__
+        return wrapper
+    return decorator
@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+
+from backend.models.database import (
+    get_held_assets,
+    iter_all_holdings,
+    add_portfolio_snapshots,
+    prune_snapshots,
+    release_db_connection
+)
+from backend.models.bar_store import compact_bars
+from backend.utils.data_fetcher import get_cached_batch_prices
+from backend.utils.quote_cache import quote_cache
+
+# Seconds between snapshot ticks
+SNAPSHOT_INTERVAL = float(os.environ.get('SNAPSHOT_INTERVAL', 3600))
+
+# Seconds between retention passes over raw snapshots and rollups
+SNAPSHOT_PRUNE_INTERVAL = float(os.environ.get('SNAPSHOT_PRUNE_INTERVAL', 86400))
+
+# Seconds a tick is expected to finish within; slower ticks are reported
+SNAPSHOT_TIME_BUDGET = float(os.environ.get('SNAPSHOT_TIME_BUDGET', 60))
+
+
+class SnapshotJob:
+    """
+    Periodic writer for portfolio_snapshots.
+
+    Each tick fetches one shared quote set for every distinct held ticker,
+    values every user's holdings from it in a single pass over the portfolio
+    table and writes all snapshots with one executemany. Old raw rows,
+    rollups and stored market bars are pruned once per SNAPSHOT_PRUNE_INTERVAL.
+    """
+
+    def __init__(self, interval=SNAPSHOT_INTERVAL, time_budget=SNAPSHOT_TIME_BUDGET,
+                 fetch_prices=get_cached_batch_prices):
+        self.interval = interval
+        self.time_budget = time_budget
+        self.fetch_prices = fetch_prices
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_tick = None
+        self.last_pruned_at = None
+        self.ticks = 0
+
+    def _quote_set(self):
+        """Return {(ticker, asset_type): price} for every held asset."""
+        assets = get_held_assets()
+        results = self.fetch_prices(assets)
+        prices = {}
+        for key in assets:
+            result = results.get(key)
+            if not (result and result.get('success')):
+                result, _ = quote_cache.get_stale(*key)
+            if result:
+                prices[key] = result['price']
+        return prices
+
+    def run_once(self):
+        """Value every portfolio and write one snapshot per user. Returns the tick report."""
+        started = time.perf_counter()
+        prices = self._quote_set()
+        quotes_done = time.perf_counter()
+
+        # Users with any unpriced holding are skipped rather than undervalued
+        snapshots = []
+        skipped = 0
+        current_user = None
+        total = 0.0
+        complete = True
+        for user_id, ticker, asset_type, quantity in iter_all_holdings():
+            if user_id != current_user:
+                if current_user is not None:
+                    if complete:
+                        snapshots.append((current_user, round(total, 2)))
+                    else:
+                        skipped += 1
+                current_user, total, complete = user_id, 0.0, True
+            price = prices.get((ticker, asset_type))
+            if price is None:
+                complete = False
+            else:
+                total += price * quantity
+        if current_user is not None:
+            if complete:
+                snapshots.append((current_user, round(total, 2)))
+            else:
+                skipped += 1
+        valued = time.perf_counter()
+
+        if snapshots:
+            add_portfolio_snapshots(snapshots)
+
+        pruned = 0
+        now = time.monotonic()
+        if self.last_pruned_at is None or now - self.last_pruned_at >= SNAPSHOT_PRUNE_INTERVAL:
+            pruned = prune_snapshots() + compact_bars()
+            self.last_pruned_at = now
+        finished = time.perf_counter()
+
+        elapsed = finished - started
+        self.ticks += 1
+        self.last_tick = {
+            'written': len(snapshots),
+            'skipped': skipped,
+            'pruned': pruned,
+            'tickers': len(prices),
+            'quote_seconds': round(quotes_done - started, 3),
+            'value_seconds': round(valued - quotes_done, 3),
+            'write_seconds': round(finished - valued, 3),
+            'total_seconds': round(elapsed, 3),
+            'over_budget': elapsed > self.time_budget,
+        }
+        budget_note = ' (over budget)' if self.last_tick['over_budget'] else ''
+        print(f"Snapshot tick: {len(snapshots)} users written, {skipped} skipped "
+              f"in {elapsed:.2f}s{budget_note}")
+        return self.last_tick
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Snapshot job error: {e}")
+            finally:
+                release_db_connection()
+
+    def start(self):
+        """Start the snapshot thread if it is not already running."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='snapshot-job', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """Stop the snapshot thread."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def stats(self):
+        """Return the tick count and the report of the last tick."""
+        return {
+            'running': bool(self._thread and self._thread.is_alive()),
+            'interval': self.interval,
+            'time_budget': self.time_budget,
+            'ticks': self.ticks,
+            'last_tick': self.last_tick,
+        }
+
+
+# Shared instance started by create_app
+snapshot_job = SnapshotJob()
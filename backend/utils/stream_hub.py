@@ -0,0 +1,386 @@
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from backend.models.database import get_portfolio_state, get_portfolio_versions, release_db_connection
+from backend.utils.data_fetcher import peek_price
+
+# Seconds between fan-out ticks
+STREAM_INTERVAL = float(os.environ.get('STREAM_INTERVAL', 1.0))
+
+# Seconds between keep-alive comments on an idle stream
+STREAM_HEARTBEAT = float(os.environ.get('STREAM_HEARTBEAT', 15))
+
+# Seconds between checks for trades made in other processes (order fills run
+# only in the job-lock leader) on the holdings of streaming users
+STREAM_VERSION_CHECK = float(os.environ.get('STREAM_VERSION_CHECK', 2))
+
+# Open streams per process; each holds a server thread, so keep this below the
+# thread count (gunicorn.conf.py defaults it to half of GUNICORN_THREADS)
+STREAM_MAX_SUBSCRIBERS = int(os.environ.get('STREAM_MAX_SUBSCRIBERS', 64))
+
+# 'store' reads the polled price store, 'fake' uses a seeded random walk
+STREAM_PRICE_SOURCE = os.environ.get('STREAM_PRICE_SOURCE', 'store')
+
+
+def store_price_source(items):
+    """Read quotes from the price store and quote cache without network I/O."""
+    results = {}
+    for ticker, asset_type in items:
+        quote = peek_price(ticker, asset_type)
+        if quote:
+            results[(ticker, asset_type)] = quote
+    return results
+
+
+class FakePriceSource:
+    """Seeded random-walk quotes for exercising the stream locally."""
+
+    def __init__(self, seed=42, start=100.0, volatility=0.002):
+        self._random = random.Random(seed)
+        self._prices = {}
+        self.start = start
+        self.volatility = volatility
+
+    def __call__(self, items):
+        results = {}
+        for ticker, asset_type in items:
+            price = self._prices.get((ticker, asset_type), self.start)
+            price = round(price * (1 + self._random.gauss(0, self.volatility)), 2)
+            self._prices[(ticker, asset_type)] = price
+            results[(ticker, asset_type)] = {
+                'success': True,
+                'ticker': ticker,
+                'price': price,
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')
+            }
+        return results
+
+
+class Subscriber:
+    """
+    One connected stream client.
+
+    Pending events are keyed so that a slow client only ever receives the
+    latest value for each symbol instead of an ever-growing backlog.
+    """
+
+    def __init__(self, items, user_id=None):
+        self.items = set(items)
+        self.user_id = user_id
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self.closed = False
+
+    def push(self, event, key, payload):
+        """Queue an event, replacing any undelivered one with the same key."""
+        with self._lock:
+            self._pending.pop((event, key), None)
+            self._pending[(event, key)] = payload
+            self._ready.set()
+
+    def drain(self, timeout):
+        """Wait up to timeout seconds and return the pending (event, payload) list."""
+        self._ready.wait(timeout)
+        with self._lock:
+            events = [(event, payload) for (event, _), payload in self._pending.items()]
+            self._pending.clear()
+            self._ready.clear()
+        return events
+
+    def close(self):
+        """Mark the stream finished and wake its reader."""
+        self.closed = True
+        self._ready.set()
+
+
+class StreamHub:
+    """
+    Single fan-out loop for every stream subscriber.
+
+    Each tick reads one quote per subscribed symbol, then pushes quote deltas
+    to the subscribers of that symbol and portfolio deltas to the users who
+    hold it. Trades made in this process reload holdings through
+    holdings_changed; ones made elsewhere are caught by comparing the
+    streaming users' portfolio_version every version_check seconds.
+    """
+
+    def __init__(self, price_source=None, interval=STREAM_INTERVAL, max_subscribers=STREAM_MAX_SUBSCRIBERS,
+                 version_check=STREAM_VERSION_CHECK):
+        if price_source is None:
+            price_source = FakePriceSource() if STREAM_PRICE_SOURCE == 'fake' else store_price_source
+        self.price_source = price_source
+        self.interval = interval
+        self.max_subscribers = max_subscribers
+        self.version_check = version_check
+        self._checked_at = 0
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._by_symbol = {}
+        self._holdings = {}
+        self._versions = {}
+        self._holders = {}
+        self._last_quotes = {}
+        self._last_values = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self._shut_down = False
+        self.ticks = 0
+        self.events_sent = 0
+        self.rejected = 0
+        self.reloads = 0
+
+    def _drop_holdings(self, user_id):
+        """Remove a user from the ticker -> users index. Caller holds the lock."""
+        self._versions.pop(user_id, None)
+        for key in self._holdings.pop(user_id, {}):
+            holders = self._holders.get(key)
+            if holders:
+                holders.discard(user_id)
+                if not holders:
+                    del self._holders[key]
+
+    def _load_holdings(self, user_id):
+        """Read a user's holdings as (version, {key: (quantity, avg_buy_price)}). Called without the lock."""
+        version, rows = get_portfolio_state(user_id)
+        return version, {
+            (holding['ticker'], holding['asset_type']): (holding['quantity'], holding['avg_buy_price'])
+            for holding in rows
+        }
+
+    def _index_holdings(self, user_id, loaded):
+        """
+        Swap loaded holdings into the ticker -> users index. Caller holds the lock.
+        Returns False, changing nothing, if a newer version is already indexed.
+        """
+        version, holdings = loaded
+        if self._versions.get(user_id, -1) > version:
+            return False
+        self._drop_holdings(user_id)
+        for key in holdings:
+            self._holders.setdefault(key, set()).add(user_id)
+        self._holdings[user_id] = holdings
+        self._versions[user_id] = version
+        return True
+
+    def _portfolio_value(self, user_id):
+        """Value a user's holdings from the last fan-out quotes. Caller holds the lock."""
+        total_value = 0
+        total_cost = 0
+        holdings = self._holdings.get(user_id, {})
+        for key, (quantity, avg_buy_price) in holdings.items():
+            quote = self._last_quotes.get(key)
+            if quote:
+                total_value += quote['price'] * quantity
+                total_cost += avg_buy_price * quantity
+        profit_loss = total_value - total_cost
+        return {
+            'total_value': round(total_value, 2),
+            'total_cost': round(total_cost, 2),
+            'profit_loss': round(profit_loss, 2),
+            'profit_loss_percent': round(((total_value / total_cost) - 1) * 100, 2) if total_cost > 0 else 0,
+            'holdings_count': len(holdings)
+        }
+
+    def subscribe(self, items, user_id=None):
+        """
+        Register a client for (ticker, asset_type) items and, optionally, its
+        portfolio. Returns None when max_subscribers streams are already open.
+        """
+        if len(self._subscribers) >= self.max_subscribers:
+            self.rejected += 1
+            return None
+        subscriber = Subscriber(items, user_id)
+        # Read SQLite before taking the lock so the fan-out tick never waits on it
+        loaded = self._load_holdings(user_id) if user_id is not None and user_id not in self._holdings else None
+        with self._lock:
+            if self._shut_down:
+                subscriber.close()
+                return subscriber
+            if len(self._subscribers) >= self.max_subscribers:
+                self.rejected += 1
+                return None
+            self._subscribers.add(subscriber)
+            if loaded is not None and user_id not in self._holdings:
+                self._index_holdings(user_id, loaded)
+            for key in self._symbols_for(subscriber):
+                self._by_symbol.setdefault(key, set()).add(subscriber)
+                quote = self._last_quotes.get(key)
+                if quote and key in subscriber.items:
+                    subscriber.push('quote', key, quote)
+            if user_id is not None and user_id in self._last_values:
+                subscriber.push('portfolio', user_id, self._last_values[user_id])
+        self._ensure_running()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """Remove a client and any index entries only it needed."""
+        subscriber.closed = True
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            for key in self._symbols_for(subscriber):
+                subscribers = self._by_symbol.get(key)
+                if subscribers:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._by_symbol[key]
+            user_id = subscriber.user_id
+            if user_id is not None and not any(s.user_id == user_id for s in self._subscribers):
+                self._drop_holdings(user_id)
+                self._last_values.pop(user_id, None)
+
+    def _symbols_for(self, subscriber):
+        """Return the symbols a subscriber needs quotes for. Caller holds the lock."""
+        symbols = set(subscriber.items)
+        if subscriber.user_id is not None:
+            symbols.update(self._holdings.get(subscriber.user_id, {}))
+        return symbols
+
+    def holdings_changed(self, user_id):
+        """Reload a streaming user's holdings after a trade and push the new value."""
+        if user_id not in self._holdings:
+            return
+        loaded = self._load_holdings(user_id)
+        with self._lock:
+            if user_id not in self._holdings:
+                return
+            old = set(self._holdings[user_id])
+            if not self._index_holdings(user_id, loaded):
+                return
+            for subscriber in self._subscribers:
+                if subscriber.user_id != user_id:
+                    continue
+                for key in old - set(self._holdings[user_id]):
+                    subscribers = self._by_symbol.get(key)
+                    if subscribers and key not in subscriber.items:
+                        subscribers.discard(subscriber)
+                        if not subscribers:
+                            del self._by_symbol[key]
+                for key in self._holdings[user_id]:
+                    self._by_symbol.setdefault(key, set()).add(subscriber)
+            self._publish_values({user_id})
+
+    def check_versions(self):
+        """Reload streaming users whose holdings changed in another process. Returns how many."""
+        with self._lock:
+            versions = dict(self._versions)
+        if not versions:
+            return 0
+        changed = [user_id for user_id, version in get_portfolio_versions(versions).items()
+                   if version > versions[user_id]]
+        for user_id in changed:
+            self.holdings_changed(user_id)
+        self.reloads += len(changed)
+        return len(changed)
+
+    def _publish_values(self, user_ids):
+        """Recompute portfolio values and push the ones that changed. Caller holds the lock."""
+        for user_id in user_ids:
+            value = self._portfolio_value(user_id)
+            if self._last_values.get(user_id) == value:
+                continue
+            self._last_values[user_id] = value
+            for subscriber in self._subscribers:
+                if subscriber.user_id == user_id:
+                    subscriber.push('portfolio', user_id, value)
+                    self.events_sent += 1
+
+    def tick(self):
+        """Run one fan-out pass. Returns the number of quotes that changed."""
+        with self._lock:
+            symbols = list(self._by_symbol)
+        if not symbols:
+            return 0
+
+        quotes = self.price_source(symbols)
+
+        with self._lock:
+            for key in [k for k in self._last_quotes if k not in self._by_symbol]:
+                del self._last_quotes[key]
+
+            changed = []
+            for key, quote in quotes.items():
+                if not quote.get('success'):
+                    continue
+                last = self._last_quotes.get(key)
+                if last and last['price'] == quote['price']:
+                    continue
+                payload = {
+                    'ticker': key[0],
+                    'type': key[1],
+                    'price': quote['price'],
+                    'change_24h': quote.get('change_24h'),
+                    'timestamp': quote.get('timestamp')
+                }
+                self._last_quotes[key] = payload
+                changed.append(key)
+
+            affected_users = set()
+            for key in changed:
+                for subscriber in self._by_symbol.get(key, ()):
+                    if key in subscriber.items:
+                        subscriber.push('quote', key, self._last_quotes[key])
+                        self.events_sent += 1
+                affected_users.update(self._holders.get(key, ()))
+            self._publish_values(affected_users)
+            self.ticks += 1
+        return len(changed)
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            try:
+                self.tick()
+                if time.monotonic() - self._checked_at >= self.version_check:
+                    self._checked_at = time.monotonic()
+                    self.check_versions()
+            except Exception as e:
+                print(f"Stream hub error: {e}")
+            finally:
+                release_db_connection()
+            self._stop.wait(self.interval)
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='stream-hub', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the fan-out thread."""
+        self._stop.set()
+
+    def shutdown(self):
+        """Stop fanning out and end every open stream so the process can exit."""
+        with self._lock:
+            self._shut_down = True
+            subscribers = list(self._subscribers)
+        self.stop()
+        for subscriber in subscribers:
+            subscriber.close()
+
+    def stats(self):
+        """Return subscriber and fan-out counters."""
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'symbols': len(self._by_symbol),
+                'streaming_users': len(self._holdings),
+                'max_subscribers': self.max_subscribers,
+                'rejected': self.rejected,
+                'reloads': self.reloads,
+                'ticks': self.ticks,
+                'events_sent': self.events_sent
+            }
+
+
+# Shared instance used by the stream blueprint
+stream_hub = StreamHub()
@@ -0,0 +1,182 @@
+import bisect
+import csv
+import os
+import threading
+import time
+
+# Listing file with symbol,name,type rows loaded into the search index
+SYMBOL_LISTING_PATH = os.environ.get(
+    'SYMBOL_LISTING_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'symbols.csv')
+)
+
+# Seconds between checks of the listing file's mtime for hot reloads
+SYMBOL_RELOAD_CHECK = float(os.environ.get('SYMBOL_RELOAD_CHECK', 30))
+
+# Minimum share of the query's trigrams a name must contain to match fuzzily
+FUZZY_THRESHOLD = 0.5
+
+# Shorter queries only match by prefix; their few trigrams match too much
+FUZZY_MIN_LENGTH = 4
+
+
+def _trigrams(text):
+    """Return the set of padded trigrams in a lowercased string."""
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _IndexData:
+    """Immutable lookup tables built from one listing; swapped in as a whole on reload."""
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.symbols = sorted((entry['symbol'], i) for i, entry in enumerate(entries))
+        words = []
+        self.grams = {}
+        for i, entry in enumerate(entries):
+            name = entry['name'].lower()
+            for word in name.replace('.', ' ').replace(',', ' ').split():
+                words.append((word, i))
+            for gram in _trigrams(name):
+                self.grams.setdefault(gram, []).append(i)
+        self.words = sorted(words)
+
+
+class SymbolIndex:
+    """
+    In-memory symbol search over a local listing file.
+
+    Symbols and name words are kept in sorted arrays for bisect prefix
+    matching, and names carry a trigram inverted index for fuzzy matches.
+    Results rank exact symbols first, then symbol prefixes, name-word
+    prefixes and trigram similarity. The listing is reloaded when its file
+    changes, without a restart.
+    """
+
+    def __init__(self, path=SYMBOL_LISTING_PATH, reload_check=SYMBOL_RELOAD_CHECK):
+        self.path = path
+        self.reload_check = reload_check
+        self._lock = threading.Lock()
+        self._data = _IndexData([])
+        self._mtime = None
+        self._checked_at = 0
+        self.loads = 0
+
+    def load(self, path=None):
+        """Build the index from the listing file and swap it in. Returns the entry count."""
+        path = path or self.path
+        entries = []
+        seen = set()
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                symbol = (row.get('symbol') or '').strip().upper()
+                asset_type = (row.get('type') or 'stock').strip().lower()
+                if not symbol or (symbol, asset_type) in seen:
+                    continue
+                seen.add((symbol, asset_type))
+                entries.append({
+                    'symbol': symbol,
+                    'name': (row.get('name') or symbol).strip(),
+                    'type': asset_type
+                })
+        data = _IndexData(entries)
+        with self._lock:
+            self.path = path
+            self._data = data
+            self._mtime = os.path.getmtime(path)
+            self._checked_at = time.monotonic()
+            self.loads += 1
+        print(f"Symbol index loaded {len(entries)} symbols from {path}")
+        return len(entries)
+
+    def reload_if_changed(self):
+        """Reload the listing if its file changed since the last load."""
+        now = time.monotonic()
+        if self._mtime is not None and now - self._checked_at < self.reload_check:
+            return False
+        with self._lock:
+            self._checked_at = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        try:
+            self.load()
+        except (OSError, csv.Error) as e:
+            print(f"Symbol index reload failed: {e}")
+            return False
+        return True
+
+    def search(self, query, asset_type=None, limit=10):
+        """Return up to limit ranked {'symbol', 'name', 'type'} matches for query."""
+        self.reload_if_changed()
+        data = self._data
+        query = query.strip()
+        if not query:
+            return []
+        upper = query.upper()
+        lower = query.lower()
+        scores = {}
+
+        def consider(i, score):
+            entry = data.entries[i]
+            if asset_type and entry['type'] != asset_type:
+                return
+            if score > scores.get(i, 0):
+                scores[i] = score
+
+        # Symbol prefixes; an exact symbol sorts first in its own range
+        pos = bisect.bisect_left(data.symbols, (upper,))
+        while pos < len(data.symbols) and data.symbols[pos][0].startswith(upper):
+            symbol, i = data.symbols[pos]
+            pos += 1
+            consider(i, 100 if symbol == upper else 80 - min(len(symbol) - len(upper), 20))
+
+        # Name-word prefixes
+        pos = bisect.bisect_left(data.words, (lower,))
+        while pos < len(data.words) and data.words[pos][0].startswith(lower):
+            word, i = data.words[pos]
+            pos += 1
+            consider(i, 60 if word == lower else 50)
+
+        # Trigram similarity on names for typos and infix matches
+        if len(lower) >= FUZZY_MIN_LENGTH:
+            query_grams = _trigrams(lower)
+            shared = {}
+            for gram in query_grams:
+                for i in data.grams.get(gram, ()):
+                    shared[i] = shared.get(i, 0) + 1
+            for i, count in shared.items():
+                similarity = count / len(query_grams)
+                if similarity >= FUZZY_THRESHOLD:
+                    consider(i, 40 * similarity)
+
+        ranked = sorted(scores, key=lambda i: (-scores[i], data.entries[i]['symbol']))
+        return [dict(data.entries[i]) for i in ranked[:limit]]
+
+    def contains(self, symbol, asset_type=None):
+        """Return whether the listing has symbol, optionally of one asset class."""
+        self.reload_if_changed()
+        data = self._data
+        symbol = symbol.strip().upper()
+        pos = bisect.bisect_left(data.symbols, (symbol,))
+        while pos < len(data.symbols) and data.symbols[pos][0] == symbol:
+            if not asset_type or data.entries[data.symbols[pos][1]]['type'] == asset_type:
+                return True
+            pos += 1
+        return False
+
+    def stats(self):
+        """Return the listing path, size and load count."""
+        return {
+            'path': self.path,
+            'symbols': len(self._data.entries),
+            'loads': self.loads,
+        }
+
+
+# Shared instance used by data_fetcher
+symbol_index = SymbolIndex()
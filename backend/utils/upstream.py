@@ -0,0 +1,264 @@
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from backend.utils.metrics import span
+
+# Connect and read timeouts in seconds for every upstream HTTP call
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 3.05))
+UPSTREAM_READ_TIMEOUT = float(os.environ.get('UPSTREAM_READ_TIMEOUT', 10))
+
+# Keep-alive connections pooled per upstream host
+UPSTREAM_POOL_SIZE = int(os.environ.get('UPSTREAM_POOL_SIZE', 16))
+
+# Attempts per call and the jittered exponential backoff between them
+UPSTREAM_RETRIES = int(os.environ.get('UPSTREAM_RETRIES', 3))
+UPSTREAM_BACKOFF_BASE = float(os.environ.get('UPSTREAM_BACKOFF_BASE', 0.5))
+UPSTREAM_BACKOFF_MAX = float(os.environ.get('UPSTREAM_BACKOFF_MAX', 8))
+
+# Consecutive failed calls that open a breaker, and seconds before it half-opens
+BREAKER_FAILURES = int(os.environ.get('BREAKER_FAILURES', 5))
+BREAKER_RESET = float(os.environ.get('BREAKER_RESET', 30))
+
+# Requests per second and burst size allowed to each provider
+COINGECKO_RATE = float(os.environ.get('COINGECKO_RATE', 0.5))
+COINGECKO_BURST = int(os.environ.get('COINGECKO_BURST', 5))
+YAHOO_RATE = float(os.environ.get('YAHOO_RATE', 5))
+YAHOO_BURST = int(os.environ.get('YAHOO_BURST', 10))
+
+# Longest a caller waits for a rate-limit token before giving up
+UPSTREAM_ACQUIRE_TIMEOUT = float(os.environ.get('UPSTREAM_ACQUIRE_TIMEOUT', 5))
+
+# Responses worth retrying; anything else 4xx is the caller's problem
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """An upstream call failed after retries."""
+
+
+class CircuitOpenError(UpstreamError):
+    """The provider's circuit breaker is open; no call was made."""
+
+
+class RateLimitedError(UpstreamError):
+    """No rate-limit token became available in time; no call was made."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate` tokens per second up to `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Take one token, waiting up to timeout seconds. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After `failures` failed calls in a row the breaker opens and rejects
+    calls for `reset_timeout` seconds, then lets a single trial call through
+    (half-open). A success closes it again; a failure re-opens it.
+    """
+
+    def __init__(self, failures=BREAKER_FAILURES, reset_timeout=BREAKER_RESET):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at = None
+        self._trial = False
+        self.opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        """Return True if a call may go out now."""
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def release(self):
+        """Give back a half-open trial slot when no call was actually made."""
+        with self._lock:
+            self._trial = False
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self._trial or self._consecutive >= self.failures:
+                if self._opened_at is None or self._trial:
+                    self.opened += 1
+                self._opened_at = time.monotonic()
+            self._trial = False
+
+
+class UpstreamClient:
+    """
+    Shared client for one market data provider.
+
+    Every call goes through the provider's circuit breaker and token bucket,
+    uses a pooled keep-alive session with connect/read timeouts, and retries
+    429/5xx responses and connection errors with jittered exponential
+    backoff, honouring Retry-After.
+    """
+
+    def __init__(self, name, rate, burst, retries=UPSTREAM_RETRIES,
+                 backoff_base=UPSTREAM_BACKOFF_BASE, backoff_max=UPSTREAM_BACKOFF_MAX,
+                 timeout=(UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT),
+                 acquire_timeout=UPSTREAM_ACQUIRE_TIMEOUT, breaker=None):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = breaker or CircuitBreaker()
+        self.retries = max(1, retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=UPSTREAM_POOL_SIZE, pool_maxsize=UPSTREAM_POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._lock = threading.Lock()
+        self.counters = {
+            'calls': 0,
+            'attempts': 0,
+            'retries': 0,
+            'throttled_upstream': 0,
+            'throttled_local': 0,
+            'short_circuited': 0,
+            'failures': 0,
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _backoff(self, attempt, retry_after=None):
+        """Seconds to sleep before the next attempt."""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        delay = random.uniform(0, delay)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) under the breaker, limiter and retry policy.
+
+        fn may raise, or return a requests.Response; 429/5xx responses and
+        request exceptions are retried, other results are returned as-is.
+        """
+        self._count('calls')
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            raise CircuitOpenError(f'{self.name} circuit open')
+
+        error = None
+        for attempt in range(self.retries):
+            if not self.bucket.acquire(self.acquire_timeout):
+                self._count('throttled_local')
+                if error is None:
+                    self.breaker.release()
+                    raise RateLimitedError(f'{self.name} rate limit exceeded')
+                break
+
+            self._count('attempts')
+            retry_after = None
+            try:
+                with span('upstream', self.name):
+                    result = fn(*args, **kwargs)
+                if isinstance(result, requests.Response) and result.status_code in RETRY_STATUSES:
+                    if result.status_code == 429:
+                        self._count('throttled_upstream')
+                        try:
+                            retry_after = float(result.headers.get('Retry-After', ''))
+                        except ValueError:
+                            pass
+                    error = UpstreamError(f'{self.name} returned HTTP {result.status_code}')
+                else:
+                    self.breaker.record_success()
+                    return result
+            except Exception as e:
+                error = e
+
+            if attempt + 1 < self.retries:
+                self._count('retries')
+                time.sleep(self._backoff(attempt, retry_after))
+
+        self._count('failures')
+        self.breaker.record_failure()
+        if isinstance(error, UpstreamError):
+            raise error
+        raise UpstreamError(f'{self.name} request failed: {error}') from error
+
+    def get(self, url, params=None):
+        """GET url through the retry policy and return the Response."""
+        return self.call(self.session.get, url, params=params, timeout=self.timeout)
+
+    def get_json(self, url, params=None):
+        """GET url and decode its JSON body."""
+        return self.get(url, params).json()
+
+    def stats(self):
+        """Return call counters and breaker state."""
+        with self._lock:
+            counters = dict(self.counters)
+        counters['breaker_state'] = self.breaker.state
+        counters['breaker_opened'] = self.breaker.opened
+        return counters
+
+
+# Shared per-provider clients used by data_fetcher
+coingecko_client = UpstreamClient('coingecko', COINGECKO_RATE, COINGECKO_BURST)
+yahoo_client = UpstreamClient('yahoo', YAHOO_RATE, YAHOO_BURST)
+
+
+def upstream_stats():
+    """Return counters for every provider client."""
+    return {client.name: client.stats() for client in (coingecko_client, yahoo_client)}
@@ -0,0 +1,356 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from backend.models.database import get_portfolio_state, get_portfolio_version, release_db_connection
+from backend.utils.price_store import price_store
+from backend.utils.quote_executor import fetch_quotes
+
+# Seconds after which a held ticker's price is refreshed on read and reported stale
+VALUATION_STALE_AFTER = float(os.environ.get('VALUATION_STALE_AFTER', 30))
+
+# Users kept in memory before the least recently read one is dropped
+VALUATION_MAX_USERS = int(os.environ.get('VALUATION_MAX_USERS', 10000))
+
+# Seconds between background consistency checks of the loaded users
+VALUATION_CHECK_INTERVAL = float(os.environ.get('VALUATION_CHECK_INTERVAL', 600))
+
+# Absolute difference in dollars tolerated by check_consistency
+VALUATION_TOLERANCE = 0.01
+
+
+class _Account:
+    """One user's positions and their running totals."""
+
+    __slots__ = ('version', 'positions', 'value', 'cost', 'missing')
+
+    def __init__(self, version):
+        self.version = version
+        self.positions = {}
+        self.value = 0.0
+        self.cost = 0.0
+        self.missing = 0
+
+
+class ValuationBook:
+    """
+    Incrementally maintained portfolio valuations.
+
+    Each loaded user keeps their positions and running market value and cost
+    totals. Trades adjust one position; a quote change adjusts every holder
+    of that ticker through a ticker -> users index, so reads never revalue a
+    portfolio from scratch. Totals only cover priced positions, matching the
+    previous per-request valuation.
+
+    Every change to a user's holdings bumps users.portfolio_version in the
+    trade transaction. Reads compare it against the loaded version (one
+    primary-key lookup) and reload the user when another process traded.
+    """
+
+    def __init__(self, stale_after=VALUATION_STALE_AFTER, max_users=VALUATION_MAX_USERS,
+                 check_interval=VALUATION_CHECK_INTERVAL, fetch=fetch_quotes):
+        self.stale_after = stale_after
+        self.max_users = max_users
+        self.check_interval = check_interval
+        self.fetch = fetch
+        self._accounts = OrderedDict()
+        self._holders = {}
+        self._prices = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.loads = 0
+        self.trades_applied = 0
+        self.price_updates = 0
+        self.refreshes = 0
+        self.checks = 0
+        self.last_check = None
+
+    def _contribute(self, account, key, position, sign):
+        """Add (sign=1) or remove (sign=-1) a position's share of the totals. Caller holds the lock."""
+        price = self._prices.get(key)
+        if price is None:
+            account.missing += sign
+        else:
+            account.value += sign * position['quantity'] * price[0]
+            account.cost += sign * position['quantity'] * position['avg_buy_price']
+
+    def _index(self, user_id, key):
+        self._holders.setdefault(key, set()).add(user_id)
+
+    def _unindex(self, user_id, key):
+        holders = self._holders.get(key)
+        if holders:
+            holders.discard(user_id)
+            if not holders:
+                del self._holders[key]
+                self._prices.pop(key, None)
+
+    def _drop(self, user_id):
+        """Forget a user and their index entries. Caller holds the lock."""
+        account = self._accounts.pop(user_id, None)
+        if account:
+            for key in account.positions:
+                self._unindex(user_id, key)
+
+    def _install(self, user_id, version, holdings):
+        """Replace a user's account with freshly loaded holdings. Caller holds the lock."""
+        self._drop(user_id)
+        account = _Account(version)
+        for holding in holdings:
+            key = (holding['ticker'], holding['asset_type'])
+            account.positions[key] = holding
+            self._index(user_id, key)
+            self._contribute(account, key, holding, 1)
+        self._accounts[user_id] = account
+        while len(self._accounts) > self.max_users:
+            self._drop(next(iter(self._accounts)))
+        self.loads += 1
+        return account
+
+    def _set_price(self, key, price, updated_at):
+        """Record a new price and move every holder's value by the difference. Caller holds the lock."""
+        old = self._prices.get(key)
+        self._prices[key] = (price, updated_at)
+        if old is not None and old[0] == price:
+            return
+        for user_id in self._holders[key]:
+            account = self._accounts[user_id]
+            position = account.positions[key]
+            if old is None:
+                account.missing -= 1
+                account.value += position['quantity'] * price
+                account.cost += position['quantity'] * position['avg_buy_price']
+            else:
+                account.value += position['quantity'] * (price - old[0])
+        self.price_updates += 1
+
+    def apply_quotes(self, results):
+        """Apply quote results keyed by (ticker, asset_type); tickers nobody holds are ignored."""
+        now = time.monotonic()
+        with self._lock:
+            for (ticker, asset_type), result in results.items():
+                key = (ticker.upper(), asset_type)
+                if key not in self._holders or not (result and result.get('success')):
+                    continue
+                # Fallback quotes keep their age so they are still reported stale
+                updated_at = now - result.get('age', 0) if result.get('stale') else now
+                current = self._prices.get(key)
+                if current is None or updated_at >= current[1]:
+                    self._set_price(key, result['price'], updated_at)
+
+    def apply_trade(self, user_id, version, position, price):
+        """
+        Apply a committed trade from execute_trade to a loaded user.
+
+        The trade price also counts as a fresh quote for the ticker. A user
+        whose loaded version is not exactly the one before this trade missed
+        a change and is dropped, to be reloaded on the next read.
+        """
+        key = (position['ticker'], position['asset_type'])
+        with self._lock:
+            account = self._accounts.get(user_id)
+            if account is None:
+                return
+            if account.version != version - 1:
+                self._drop(user_id)
+                return
+            old = account.positions.get(key)
+            if old is not None:
+                self._contribute(account, key, old, -1)
+            if position['quantity'] > 0:
+                holding = {
+                    'id': position['id'],
+                    'user_id': user_id,
+                    'ticker': position['ticker'],
+                    'asset_type': position['asset_type'],
+                    'quantity': position['quantity'],
+                    'avg_buy_price': position['avg_buy_price']
+                }
+                account.positions[key] = holding
+                self._index(user_id, key)
+                self._contribute(account, key, holding, 1)
+                self._set_price(key, price, time.monotonic())
+            elif old is not None:
+                del account.positions[key]
+                self._unindex(user_id, key)
+            account.version = version
+            self.trades_applied += 1
+
+    def _account(self, user_id):
+        """Return an up-to-date account, loading it from the database if needed."""
+        version = get_portfolio_version(user_id)
+        with self._lock:
+            account = self._accounts.get(user_id)
+            if account is not None and account.version == version:
+                self._accounts.move_to_end(user_id)
+                return account
+        version, holdings = get_portfolio_state(user_id)
+        with self._lock:
+            return self._install(user_id, version, holdings)
+
+    def _refresh(self, account):
+        """Fetch quotes for this account's missing or stale prices."""
+        cutoff = time.monotonic() - self.stale_after
+        with self._lock:
+            keys = [key for key in account.positions
+                    if key not in self._prices or self._prices[key][1] < cutoff]
+        if keys:
+            self.refreshes += 1
+            self.apply_quotes(self.fetch(keys))
+
+    def summary(self, user_id):
+        """Return the portfolio summary from the running totals."""
+        account = self._account(user_id)
+        self._refresh(account)
+        cutoff = time.monotonic() - self.stale_after
+        with self._lock:
+            value = account.value
+            cost = account.cost
+            stale_count = sum(1 for key in account.positions
+                              if key in self._prices and self._prices[key][1] < cutoff)
+            missing_count = account.missing
+            holdings_count = len(account.positions)
+        profit_loss = value - cost
+        return {
+            'total_value': round(value, 2),
+            'total_cost': round(cost, 2),
+            'profit_loss': round(profit_loss, 2),
+            'profit_loss_percent': round(((value / cost) - 1) * 100, 2) if cost > 0 else 0,
+            'holdings_count': holdings_count,
+            'stale_count': stale_count,
+            'missing_count': missing_count
+        }
+
+    def holdings(self, user_id):
+        """Return the user's holdings enriched with current prices and P&L."""
+        account = self._account(user_id)
+        self._refresh(account)
+        cutoff = time.monotonic() - self.stale_after
+        holdings = []
+        with self._lock:
+            for key, position in account.positions.items():
+                holding = dict(position)
+                price = self._prices.get(key)
+                if price is None:
+                    holding['current_price'] = 0
+                    holding['total_value'] = 0
+                    holding['profit_loss'] = 0
+                    holding['profit_loss_percent'] = 0
+                    holding['price_status'] = 'missing'
+                else:
+                    holding['current_price'] = price[0]
+                    holding['total_value'] = price[0] * position['quantity']
+                    holding['profit_loss'] = (price[0] - position['avg_buy_price']) * position['quantity']
+                    holding['profit_loss_percent'] = ((price[0] / position['avg_buy_price']) - 1) * 100
+                    holding['price_status'] = 'stale' if price[1] < cutoff else 'live'
+                holdings.append(holding)
+        return holdings
+
+    def check_consistency(self, user_ids=None):
+        """
+        Recompute loaded users from the database and the current prices.
+
+        Users whose positions or totals disagree with the recompute are
+        reloaded. Users whose holdings changed since they were loaded are
+        reloaded without counting as a mismatch. Returns a report dict.
+        """
+        with self._lock:
+            user_ids = list(self._accounts) if user_ids is None else list(user_ids)
+        started = time.perf_counter()
+        checked = 0
+        reloaded = 0
+        mismatched = []
+        for user_id in user_ids:
+            version, holdings = get_portfolio_state(user_id)
+            with self._lock:
+                account = self._accounts.get(user_id)
+                if account is None:
+                    continue
+                checked += 1
+                if account.version != version:
+                    self._install(user_id, version, holdings)
+                    reloaded += 1
+                    continue
+                expected = _Account(version)
+                positions_match = len(holdings) == len(account.positions)
+                for holding in holdings:
+                    key = (holding['ticker'], holding['asset_type'])
+                    loaded = account.positions.get(key)
+                    if (loaded is None or abs(loaded['quantity'] - holding['quantity']) > 1e-9
+                            or abs(loaded['avg_buy_price'] - holding['avg_buy_price']) > 1e-9):
+                        positions_match = False
+                    self._contribute(expected, key, holding, 1)
+                if (not positions_match or expected.missing != account.missing
+                        or abs(expected.value - account.value) > VALUATION_TOLERANCE
+                        or abs(expected.cost - account.cost) > VALUATION_TOLERANCE):
+                    mismatched.append({
+                        'user_id': user_id,
+                        'positions_match': positions_match,
+                        'value': round(account.value, 4),
+                        'expected_value': round(expected.value, 4),
+                        'cost': round(account.cost, 4),
+                        'expected_cost': round(expected.cost, 4)
+                    })
+                    self._install(user_id, version, holdings)
+        report = {'checked': checked, 'reloaded': reloaded, 'mismatched': mismatched}
+        with self._lock:
+            self.checks += 1
+            self.last_check = {
+                'checked': checked,
+                'reloaded': reloaded,
+                'mismatched': len(mismatched),
+                'examples': mismatched[:5],
+                'seconds': round(time.perf_counter() - started, 3),
+                'at': time.time()
+            }
+        return report
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            try:
+                report = self.check_consistency()
+                if report['mismatched']:
+                    print(f"Valuation check: {len(report['mismatched'])} of {report['checked']} users "
+                          f"disagreed with the database and were reloaded")
+            except Exception as e:
+                print(f"Valuation check error: {e}")
+            finally:
+                release_db_connection()
+
+    def start(self):
+        """Start the periodic consistency check thread if it is not already running."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='valuation-check', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """Stop the consistency check thread."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def stats(self):
+        """Return sizes, update counters and the last consistency check report."""
+        with self._lock:
+            return {
+                'running': bool(self._thread and self._thread.is_alive()),
+                'users': len(self._accounts),
+                'tickers': len(self._holders),
+                'loads': self.loads,
+                'trades_applied': self.trades_applied,
+                'price_updates': self.price_updates,
+                'refreshes': self.refreshes,
+                'stale_after': self.stale_after,
+                'checks': self.checks,
+                'check_interval': self.check_interval,
+                'last_check': self.last_check
+            }
+
+
+# Shared instance kept current by the portfolio routes and the market poller
+valuation_book = ValuationBook()
+price_store.add_listener(valuation_book.apply_quotes)
@@ -0,0 +1,61 @@
+"""
+Production WSGI entry point.
+
+    gunicorn -c gunicorn.conf.py backend.wsgi:app
+
+With preload_app the module is imported once in the gunicorn master, so
+migrations and the symbol index run before the workers fork and are shared
+copy-on-write. Background threads do not survive fork; gunicorn.conf.py
+calls start_worker_jobs in every worker after it is forked.
+"""
+
+import fcntl
+import os
+
+from backend.app import create_app, start_background_jobs, stop_background_jobs
+from backend.models.database import DATABASE_PATH, close_db_connections
+from backend.utils.symbol_index import symbol_index
+
+# Lock file held by the one worker that runs once-per-database jobs
+JOB_LOCK_PATH = os.environ.get('JOB_LOCK_PATH', DATABASE_PATH + '.jobs.lock')
+
+app = create_app(os.environ.get('CELESTA_ENV', 'production'), start_jobs=False)
+
+# Warm shared state before forking, then drop the master's SQLite handles
+symbol_index.reload_if_changed()
+close_db_connections()
+
+_job_lock = None
+
+
+def acquire_job_lock(path=JOB_LOCK_PATH):
+    """
+    Try to become the process that runs once-per-deployment jobs.
+
+    The flock is released by the OS when the holder exits, so the worker
+    gunicorn forks to replace it takes the jobs over.
+    """
+    global _job_lock
+    if _job_lock is not None:
+        return True
+    handle = open(path, 'a')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    _job_lock = handle
+    return True
+
+
+def start_worker_jobs():
+    """Start per-worker threads, plus the snapshot job and order engine if this worker holds the lock."""
+    leader = acquire_job_lock()
+    start_background_jobs(app, leader=leader)
+    return leader
+
+
+def stop_worker_jobs():
+    """Stop this worker's threads and close its database connections."""
+    stop_background_jobs()
+    close_db_connections()
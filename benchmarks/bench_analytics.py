@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Portfolio analytics benchmark on simulated market data.
+
+Builds a user with N holdings and a year of daily value snapshots in a
+throwaway database, then times /api/portfolio/analytics' computation with
+cold bars (simulated upstream), with bars already in the bar store, the
+shared close series already in memory (another user's request), the
+NumPy part alone and a cached read. The metrics are cross-checked against
+a straightforward pandas computation. Exits non-zero on a mismatch.
+
+    python benchmarks/bench_analytics.py --holdings 50 --window 1y
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('MARKET_PROVIDER', 'simulator')
+
+import numpy as np
+import pandas as pd
+
+import backend.models.database as db
+from backend.utils import analytics
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    return result, statistics.median(times) * 1000
+
+
+def pandas_reference(series, quantities):
+    """Value the same holdings with pandas, the obvious way."""
+    frame = pd.concat([
+        pd.Series(closes, index=pd.to_datetime(timestamps, unit='s').floor('D')).groupby(level=0).last()
+        for timestamps, closes in series
+    ], axis=1).sort_index().ffill().dropna()
+    benchmark = frame.iloc[:, -1]
+    values = (frame.iloc[:, :-1] * quantities).sum(axis=1)
+    returns = values.pct_change().dropna()
+    years = (frame.index[-1] - frame.index[0]).days / 365.25
+    periods = len(returns) / years
+    volatility = returns.std() * np.sqrt(periods)
+    return {
+        'cumulative_return': values.iloc[-1] / values.iloc[0] - 1,
+        'annualized_volatility': volatility,
+        'sharpe_ratio': returns.mean() * periods / volatility,
+        'max_drawdown': (values / values.cummax() - 1).min(),
+        'beta': returns.cov(benchmark.pct_change().dropna()) / benchmark.pct_change().dropna().var(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--holdings', type=int, default=50)
+    parser.add_argument('--window', default='1y', choices=analytics.ANALYTICS_WINDOWS)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    db.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'analytics.db')
+    db.init_db()
+    user_id = db.create_user('analyst', 'analyst@example.com', 'x')['user_id']
+    for n in range(args.holdings):
+        ticker, asset_type = (f'C{n:03d}', 'crypto') if n % 5 == 0 else (f'S{n:03d}', 'stock')
+        db.execute_trade(user_id, ticker, asset_type, 'buy', rng.uniform(1, 20), rng.uniform(10, 500))
+
+    # A year of daily snapshots for the time-weighted return
+    value = 10000.0
+    for day in range(365, 0, -1):
+        value *= 1 + rng.gauss(0.0004, 0.01)
+        stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - day * 86400))
+        db.add_portfolio_snapshots([(user_id, round(value, 2))], timestamp=stamp)
+
+    _, holdings = db.get_portfolio_state(user_id)
+
+    started = time.perf_counter()
+    result = analytics.compute_analytics(user_id, args.window, 'SPY', holdings)
+    cold_ms = (time.perf_counter() - started) * 1000
+
+    def from_store():
+        analytics.series_cache.clear()
+        return analytics.compute_analytics(user_id, args.window, 'SPY', holdings)
+
+    result, warm_ms = timed(from_store, args.repeat)
+    result, shared_ms = timed(lambda: analytics.compute_analytics(user_id, args.window, 'SPY', holdings), args.repeat)
+
+    series = [analytics._load_closes(h['ticker'], h['asset_type'], args.window) for h in holdings]
+    series.append(analytics._load_closes('SPY', 'stock', args.window))
+    quantities = np.array([h['quantity'] for h in holdings])
+
+    def numpy_only():
+        days, prices = analytics.align_closes(series)
+        return analytics.portfolio_metrics(days, prices[:, :-1], quantities, prices[:, -1])
+
+    metrics, numpy_ms = timed(numpy_only, args.repeat)
+    _, pandas_ms = timed(lambda: pandas_reference(series, quantities), args.repeat)
+
+    analytics.get_portfolio_analytics(user_id, args.window, 'SPY')
+    cached, cached_ms = timed(lambda: analytics.get_portfolio_analytics(user_id, args.window, 'SPY'), args.repeat)
+
+    print(f"{args.holdings} holdings, {args.window} window, {result['periods']} periods")
+    print(f"  cold (simulated upstream bars)   {cold_ms:8.1f} ms")
+    print(f"  warm (bars from the bar store)   {warm_ms:8.1f} ms")
+    print(f"  shared close series cached       {shared_ms:8.1f} ms")
+    print(f"  alignment + metrics (NumPy)      {numpy_ms:8.2f} ms")
+    print(f"  same metrics with pandas         {pandas_ms:8.2f} ms")
+    print(f"  cached read                      {cached_ms:8.3f} ms  (cached={cached['cached']})")
+    print(f"  twr {result['time_weighted_return']}, return {result['cumulative_return']}, "
+          f"vol {result['annualized_volatility']}, sharpe {result['sharpe_ratio']}, "
+          f"mdd {result['max_drawdown']}, beta {result['beta']}")
+
+    reference = pandas_reference(series, quantities)
+    failures = [name for name, expected in reference.items()
+                if not np.isclose(metrics[name], expected, rtol=1e-6, atol=1e-9)]
+    contributions = sum(c['contribution'] for c in result['contributions'])
+    values = np.asarray(series[0][1])
+    if failures:
+        print(f"FAIL: differs from pandas on {', '.join(failures)}")
+        sys.exit(1)
+    print(f"OK: matches pandas reference (contributions sum {contributions:.6f}, {len(values)} bars/asset)")
+
+
+if __name__ == '__main__':
+    main()
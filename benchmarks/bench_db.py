@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+SQLite trade throughput benchmark.
+
+Runs concurrent buy/sell traffic against a temporary database twice: once
+with a fresh default-journal connection per call (how database.py used to
+work) and once with the pooled WAL connections, then prints trades/sec and
+how many trades failed with 'database is locked'.
+
+    python benchmarks/bench_db.py --threads 8 --trades 500
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backend.models.database as db
+
+
+def legacy_connection():
+    """Per-call connection with default pragmas, as before pooling."""
+    conn = sqlite3.connect(db.DATABASE_PATH)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def run(mode, threads, trades):
+    db.close_db_connections()
+    db.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), f'bench_{mode}.db')
+    db.init_db()
+    db.close_db_connections()
+
+    pooled_get = db.get_db_connection
+    if mode == 'legacy':
+        conn = sqlite3.connect(db.DATABASE_PATH)
+        conn.execute('PRAGMA journal_mode=DELETE')
+        conn.close()
+        db.get_db_connection = legacy_connection
+
+    errors = []
+
+    def worker(user_id):
+        for i in range(trades):
+            try:
+                if i % 3 == 2:
+                    db.remove_from_portfolio(user_id, 'AAPL', 1)
+                    db.add_transaction(user_id, 'AAPL', 'stock', 'sell', 1, 100.0)
+                else:
+                    db.add_to_portfolio(user_id, 'AAPL', 'stock', 1, 100.0)
+                    db.add_transaction(user_id, 'AAPL', 'stock', 'buy', 1, 100.0)
+                db.get_user_portfolio(user_id)
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+            finally:
+                if mode == 'pooled':
+                    db.release_db_connection()
+
+    workers = [threading.Thread(target=worker, args=(n + 1,)) for n in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    db.get_db_connection = pooled_get
+    total = threads * trades
+    return {
+        'mode': mode,
+        'trades': total,
+        'seconds': round(elapsed, 3),
+        'trades_per_sec': round((total - len(errors)) / elapsed, 1),
+        'locked_errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--trades', type=int, default=300, help='trades per thread')
+    args = parser.parse_args()
+
+    for mode in ('legacy', 'pooled'):
+        result = run(mode, args.threads, args.trades)
+        print(f"{result['mode']:>7}: {result['trades_per_sec']:>9} trades/sec "
+              f"({result['trades']} trades in {result['seconds']}s, "
+              f"{result['locked_errors']} locked errors)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Leaderboard benchmark and correctness check at scale.
+
+Seeds N users with H holdings each over T tickers (popularity skewed
+towards a few tickers) in a throwaway database, loads the ranking, then
+interleaves quote ticks and trades through execute_trade. Reports the
+cost of the initial load, of each tick and trade, and of top-N, rank and
+rank-window reads. After every round the ranking must match a brute-force
+valuation and sort of the portfolio table, and the final full re-rank
+must find nothing to correct. Exits non-zero on any mismatch.
+
+    python benchmarks/bench_leaderboard.py --users 100000 --holdings 8 --tickers 500
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backend.models.database as db
+from backend.utils.leaderboard import Leaderboard, LEADERBOARD_TOLERANCE
+
+
+def seed(users, holdings, keys, prices, rng):
+    conn = db.get_db_connection()
+    conn.executemany(
+        'INSERT INTO users (id, username, email, password_hash) VALUES (?, ?, ?, ?)',
+        ((n, f'player{n}', f'player{n}@example.com', 'x') for n in range(1, users + 1))
+    )
+    weights = [1 / (rank + 1) for rank in range(len(keys))]
+    rows = []
+    for user_id in range(1, users + 1):
+        held = set()
+        while len(held) < holdings:
+            held.add(rng.choices(range(len(keys)), weights)[0])
+        for index in held:
+            ticker, asset_type = keys[index]
+            rows.append((user_id, ticker, asset_type, rng.uniform(0.1, 100), prices[keys[index]]))
+    conn.executemany(
+        'INSERT INTO portfolio (user_id, ticker, asset_type, quantity, avg_buy_price) VALUES (?, ?, ?, ?, ?)', rows
+    )
+    conn.commit()
+    return len(rows)
+
+
+def brute_force(prices):
+    """Value every user from the portfolio table and sort, the way a naive endpoint would."""
+    values = {}
+    for user_id, ticker, asset_type, quantity in db.iter_all_holdings():
+        values[user_id] = values.get(user_id, 0.0) + quantity * prices.get((ticker, asset_type), 0.0)
+    return sorted(values.items(), key=lambda item: (-item[1], item[0]))
+
+
+def compare(board, expected):
+    """Return the number of ranks or users where the board disagrees with the brute-force ranking."""
+    with board._lock:
+        board._settle()
+        ranked = list(zip(board._ranked_values.tolist(), board._user_ids[board._ranked_slots].tolist()))
+    values = {user_id: -value for value, user_id in ranked}
+    mismatches = abs(len(ranked) - len(expected))
+    # Users within the tolerance of each other may legitimately swap places
+    for (value, _), (user_id, expected_value) in zip(ranked, expected):
+        if abs(-value - expected_value) > LEADERBOARD_TOLERANCE:
+            mismatches += 1
+        elif abs(values.get(user_id, float('inf')) - expected_value) > LEADERBOARD_TOLERANCE:
+            mismatches += 1
+    return mismatches
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--holdings', type=int, default=8, help='holdings per user')
+    parser.add_argument('--tickers', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--ticks', type=int, default=20, help='quote ticks per round')
+    parser.add_argument('--trades', type=int, default=300, help='trades per round')
+    parser.add_argument('--reads', type=int, default=2000, help='reads of each kind per round')
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    db.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'leaderboard.db')
+    db.init_db()
+
+    keys = [(f'T{i:04d}', 'crypto' if i % 7 == 0 else 'stock') for i in range(args.tickers)]
+    prices = {key: rng.uniform(5, 500) for key in keys}
+    started = time.perf_counter()
+    positions = seed(args.users, args.holdings, keys, prices, rng)
+    print(f"seeded {args.users} users, {positions} positions in {time.perf_counter() - started:.1f}s")
+
+    def fetch(items):
+        return {key: {'success': True, 'price': prices[key]} for key in items if key in prices}
+
+    board = Leaderboard(fetch_prices=fetch)
+    report = board.rerank()
+    print(f"initial load: {report['total_seconds'] * 1000:.0f} ms "
+          f"(portfolio read {report['load_seconds'] * 1000:.0f} ms)")
+
+    tick_times = []
+    settle_times = []
+    trade_times = []
+    top_times = []
+    rank_times = []
+    window_times = []
+    failures = 0
+    for round_number in range(args.rounds):
+        for _ in range(args.ticks):
+            moved = rng.sample(keys, max(1, len(keys) // 20))
+            results = {}
+            for key in moved:
+                prices[key] *= rng.uniform(0.98, 1.02)
+                results[key] = {'success': True, 'price': prices[key]}
+            started = time.perf_counter()
+            board.apply_quotes(results)
+            tick_times.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            board.top(10)
+            settle_times.append(time.perf_counter() - started)
+
+        for _ in range(args.trades):
+            user_id = rng.randint(1, args.users)
+            key = rng.choice(keys)
+            if rng.random() < 0.6:
+                result = db.execute_trade(user_id, key[0], key[1], 'buy', rng.uniform(0.1, 50), prices[key])
+            else:
+                holdings = db.get_user_portfolio(user_id)
+                if not holdings:
+                    continue
+                holding = rng.choice(holdings)
+                key = (holding['ticker'], holding['asset_type'])
+                quantity = holding['quantity'] if rng.random() < 0.3 else holding['quantity'] * rng.uniform(0.1, 0.9)
+                result = db.execute_trade(user_id, key[0], key[1], 'sell', quantity, prices[key])
+            if result['success']:
+                started = time.perf_counter()
+                board.apply_trade(user_id, result['position'], prices[key])
+                board.rank(user_id)
+                trade_times.append(time.perf_counter() - started)
+
+        for _ in range(args.reads):
+            user_id = rng.randint(1, args.users)
+            started = time.perf_counter()
+            board.top(10)
+            top_times.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            board.rank(user_id)
+            rank_times.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            board.rank(user_id, window=5)
+            window_times.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        expected = brute_force(prices)
+        brute_ms = (time.perf_counter() - started) * 1000
+        mismatches = compare(board, expected)
+        if mismatches:
+            failures += mismatches
+            print(f"FAIL round {round_number}: {mismatches} ranks differ from brute force")
+
+    report = board.rerank()
+    if report['moved'] or report['drifted']:
+        failures += 1
+        print(f"FAIL: full re-rank corrected the running ranking: {report}")
+
+    stats = board.stats()
+    print(f"{stats['users']} ranked users over {stats['tickers']} tickers: "
+          f"{stats['price_updates']} price updates, {stats['trades_applied']} trades, "
+          f"{stats['placements']} placements, {stats['rebuilds']} rebuilds")
+    print(f"  quote tick ({len(keys) // 20} tickers)  p50 {percentile(tick_times, 0.5):8.0f}us  "
+          f"p99 {percentile(tick_times, 0.99):8.0f}us")
+    print(f"  first read after tick      p50 {percentile(settle_times, 0.5):8.0f}us  "
+          f"p99 {percentile(settle_times, 0.99):8.0f}us")
+    print(f"  trade + rank read          p50 {percentile(trade_times, 0.5):8.0f}us  "
+          f"p99 {percentile(trade_times, 0.99):8.0f}us")
+    print(f"  top 10                     p50 {percentile(top_times, 0.5):8.1f}us")
+    print(f"  rank                       p50 {percentile(rank_times, 0.5):8.1f}us")
+    print(f"  rank window +-5            p50 {percentile(window_times, 0.5):8.1f}us")
+    print(f"  full re-rank {report['total_seconds'] * 1000:.0f} ms, "
+          f"brute-force valuation and sort {brute_ms:.0f} ms")
+    print(f"  mean tick {statistics.mean(tick_times) * 1000:.2f} ms")
+    print('OK: ranking matches brute force' if not failures else f'FAIL: {failures} mismatches')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Order engine benchmark and correctness check with a large resting book.
+
+Seeds users with holdings and N resting limit, stop and stop-limit orders
+spread around each ticker's price in a throwaway database, loads the
+trigger index, then streams random-walk quote batches through
+apply_quotes and executes everything that fired. Reports load time and
+memory, quote throughput against a scan of every open order, and batched
+fill throughput against one transaction per fill. One batched fill is
+made to fail and must be retried on the next pass. Every filled order
+must have crossed its price, every order left open must never have been
+crossed and every fill must have exactly one matching transaction. Exits
+non-zero on any violation.
+
+    python benchmarks/bench_orders.py --orders 1000000 --tickers 500 --batches 2000
+"""
+
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backend.models.database as db
+from backend.utils.order_engine import OrderEngine
+
+
+def seed(args, keys, prices, rng):
+    conn = db.get_db_connection()
+    conn.executemany(
+        'INSERT INTO users (id, username, email, password_hash) VALUES (?, ?, ?, ?)',
+        ((n, f'trader{n}', f'trader{n}@example.com', 'x') for n in range(1, args.users + 1))
+    )
+    conn.executemany(
+        'INSERT INTO portfolio (user_id, ticker, asset_type, quantity, avg_buy_price) VALUES (?, ?, ?, ?, ?)',
+        ((user_id, ticker, asset_type, 1000.0, prices[(ticker, asset_type)])
+         for user_id in range(1, args.users + 1) for ticker, asset_type in rng.sample(keys, args.holdings))
+    )
+    held = {}
+    for user_id, ticker, asset_type in conn.execute('SELECT user_id, ticker, asset_type FROM portfolio'):
+        held.setdefault(user_id, []).append((ticker, asset_type))
+
+    def orders():
+        for _ in range(args.orders):
+            user_id = rng.randint(1, args.users)
+            side = 'sell' if rng.random() < 0.5 else 'buy'
+            ticker, asset_type = rng.choice(held[user_id]) if side == 'sell' else rng.choice(keys)
+            price = prices[(ticker, asset_type)]
+            order_type = rng.choice(('limit', 'limit', 'stop', 'stop_limit'))
+            # Resting orders start out of the money: limits away from the
+            # price, stops beyond it
+            away = rng.uniform(0.001, args.spread)
+            below = price * (1 - away)
+            above = price * (1 + away)
+            limit_price = stop_price = None
+            if order_type == 'limit':
+                limit_price = below if side == 'buy' else above
+            elif order_type == 'stop':
+                stop_price = above if side == 'buy' else below
+            else:
+                stop_price = above if side == 'buy' else below
+                limit_price = stop_price * (1 + rng.uniform(-0.01, 0.01))
+            yield (user_id, ticker, asset_type, side, order_type, rng.uniform(0.1, 5), limit_price, stop_price)
+
+    conn.executemany(
+        '''INSERT INTO orders (user_id, ticker, asset_type, side, order_type, quantity, limit_price, stop_price)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', orders()
+    )
+    conn.commit()
+
+
+def scan_all(orders, quotes):
+    """Fire check over every open order, the way a naive engine would handle one batch of quotes."""
+    crossed = 0
+    for order_id, ticker, asset_type, side, order_type, limit_price, stop_price, _ in orders:
+        price = quotes.get((ticker, asset_type))
+        if price is None:
+            continue
+        level = stop_price if order_type != 'limit' else limit_price
+        if (side == 'buy') == (order_type == 'limit'):
+            crossed += price <= level
+        else:
+            crossed += price >= level
+    return crossed
+
+
+def check(lows, highs):
+    """Return a list of orders whose final state disagrees with the prices seen."""
+    conn = db.get_db_connection()
+    problems = []
+    filled = 0
+    cursor = conn.execute(
+        '''SELECT o.id, o.ticker, o.asset_type, o.side, o.order_type, o.quantity, o.limit_price, o.stop_price,
+                  o.status, o.triggered_at, o.fill_price, t.quantity, t.price, t.transaction_type
+           FROM orders o LEFT JOIN transactions t ON t.id = o.transaction_id'''
+    )
+    for (order_id, ticker, asset_type, side, order_type, quantity, limit_price, stop_price,
+         status, triggered_at, fill_price, tx_quantity, tx_price, tx_type) in cursor:
+        low, high = lows[(ticker, asset_type)], highs[(ticker, asset_type)]
+        stop_hit = stop_price is not None and (high >= stop_price if side == 'buy' else low <= stop_price)
+        if status == 'filled':
+            filled += 1
+            if tx_price is None or tx_price != fill_price or tx_type != side or abs(tx_quantity - quantity) > 1e-9:
+                problems.append(f'order {order_id} has no matching transaction')
+            elif limit_price is not None and (fill_price > limit_price if side == 'buy' else fill_price < limit_price):
+                problems.append(f'{side} {order_type} {order_id} filled at {fill_price} past limit {limit_price}')
+            elif order_type != 'limit' and not stop_hit:
+                problems.append(f'{side} {order_type} {order_id} filled without reaching stop {stop_price}')
+        elif status == 'open':
+            if order_type == 'limit' and (low <= limit_price if side == 'buy' else high >= limit_price):
+                problems.append(f'{side} limit {order_id} at {limit_price} still open inside {low}-{high}')
+            elif order_type != 'limit' and not triggered_at and stop_hit:
+                problems.append(f'{side} {order_type} {order_id} stop {stop_price} never fired inside {low}-{high}')
+    return filled, problems
+
+
+def rate(count, seconds):
+    return count / seconds if seconds else float('inf')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--orders', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--holdings', type=int, default=5, help='tickers held per user')
+    parser.add_argument('--tickers', type=int, default=500)
+    parser.add_argument('--spread', type=float, default=0.2, help='orders rest up to this fraction from the price')
+    parser.add_argument('--batches', type=int, default=2000, help='quote batches, one quote per ticker each')
+    parser.add_argument('--move', type=float, default=0.001, help='largest quote move per batch')
+    parser.add_argument('--batch-size', type=int, default=500, help='fills per transaction')
+    parser.add_argument('--single-fills', type=int, default=500, help='fills timed one transaction each')
+    parser.add_argument('--fail-batch', type=int, default=2, help='batched fill that raises once, 0 for none')
+    parser.add_argument('--seed', type=int, default=9)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    db.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'orders.db')
+    db.init_db()
+
+    keys = [(f'T{i:04d}', 'crypto' if i % 7 == 0 else 'stock') for i in range(args.tickers)]
+    prices = {key: rng.uniform(5, 500) for key in keys}
+    started = time.perf_counter()
+    seed(args, keys, prices, rng)
+    print(f"seeded {args.orders} orders for {args.users} users in {time.perf_counter() - started:.1f}s")
+
+    engine = OrderEngine(batch_size=args.batch_size, publish=lambda result: None)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    engine.sync()
+    load_s = time.perf_counter() - started
+    rss_mb = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024
+    print(f"loaded trigger index in {load_s:.2f}s ({rate(args.orders, load_s):,.0f} orders/s), "
+          f"peak RSS +{rss_mb:.0f} MB (index plus SQLite pages read)")
+
+    lows = dict(prices)
+    highs = dict(prices)
+    quote_s = 0.0
+    quotes = 0
+    for _ in range(args.batches):
+        results = {}
+        for key in keys:
+            prices[key] *= 1 + rng.uniform(-args.move, args.move)
+            lows[key] = min(lows[key], prices[key])
+            highs[key] = max(highs[key], prices[key])
+            results[key] = {'success': True, 'price': prices[key]}
+        started = time.perf_counter()
+        engine.apply_quotes(results)
+        quote_s += time.perf_counter() - started
+        quotes += len(results)
+    fired = engine.orders_fired
+
+    resting = list(db.iter_open_orders())
+    started = time.perf_counter()
+    scan_all(resting, prices)
+    scan_s = time.perf_counter() - started
+
+    # Time the first fills one transaction each, then let the engine drain the rest in batches
+    single = [engine._queue.popleft() for _ in range(min(args.single_fills, len(engine._queue)))]
+    started = time.perf_counter()
+    single_results = [result for fill in single for result in db.fill_orders([fill])]
+    single_s = time.perf_counter() - started
+    batched = len(engine._queue)
+    # One batch's fill raises part way through the drain; it must stay queued for the next pass
+    fail_at = min(args.fail_batch, -(-batched // args.batch_size))
+    calls = 0
+
+    def failing_fill(batch):
+        nonlocal calls
+        calls += 1
+        if calls == fail_at:
+            raise RuntimeError('simulated fill failure')
+        return db.fill_orders(batch)
+
+    engine.fill = failing_fill
+    requeue_problems = []
+    started = time.perf_counter()
+    if fail_at:
+        try:
+            engine.run_once()
+            requeue_problems.append(f'fill failure in batch {fail_at} was not raised')
+        except RuntimeError:
+            expected = batched - (fail_at - 1) * args.batch_size
+            if len(engine._queue) != expected:
+                requeue_problems.append(f'{len(engine._queue)} orders queued after the failed batch, expected {expected}')
+    engine.run_once()
+    batched_s = time.perf_counter() - started
+
+    filled, problems = check(lows, highs)
+    problems.extend(requeue_problems)
+    for problem in problems[:20]:
+        print(f"FAIL {problem}")
+    stats = engine.stats()
+    engine_filled = stats['orders_filled'] + sum(result['success'] for result in single_results)
+    if engine_filled != filled:
+        problems.append('fill count mismatch')
+        print(f"FAIL engine filled {engine_filled}, orders table has {filled}")
+
+    print(f"{quotes:,} quotes in {args.batches} batches fired {fired:,} orders "
+          f"({filled:,} filled, {fired - filled:,} rejected), {stats['resting']:,} still resting")
+    print(f"  trigger index  {rate(quotes, quote_s):12,.0f} quotes/s  ({quote_s / args.batches * 1000:.2f} ms per batch)")
+    print(f"  scan all open  {rate(len(keys), scan_s):12,.0f} quotes/s  ({scan_s * 1000:.0f} ms per batch, "
+          f"{len(resting):,} orders)")
+    print(f"  fills, 1 per transaction   {rate(len(single), single_s):10,.0f}/s ({len(single)} fills)")
+    retried = f', batch {fail_at} failed once and was retried' if fail_at else ''
+    print(f"  fills, {args.batch_size} per transaction {rate(batched, batched_s):10,.0f}/s ({batched:,} fills{retried})")
+    print('OK: every fill crossed its price and nothing crossed was left open'
+          if not problems else f'FAIL: {len(problems)} problems')
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Historical bar serialization micro-benchmark.
+
+Compares the original DataFrame.iterrows() conversion with the vectorized
+frame_to_bars + bars_to_records / bars_to_columns path, including
+json.dumps of the result, for 10k and 100k bars.
+
+    python benchmarks/bench_serialization.py --sizes 10000 100000 --repeat 3
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.utils.data_fetcher import bars_to_records, bars_to_columns
+from backend.utils.providers import frame_to_bars
+
+
+def make_frame(size):
+    rng = np.random.default_rng(42)
+    close = 100 + np.cumsum(rng.normal(0, 1, size))
+    index = pd.date_range('2020-01-01', periods=size, freq='min', tz='America/New_York')
+    return pd.DataFrame({
+        'Open': close + rng.normal(0, 0.1, size),
+        'High': close + 1,
+        'Low': close - 1,
+        'Close': close,
+        'Volume': rng.integers(1_000, 1_000_000, size),
+    }, index=index)
+
+
+def legacy(data):
+    """The conversion loop get_stock_historical_data used before vectorizing."""
+    historical_data = []
+    for index, row in data.iterrows():
+        historical_data.append({
+            'timestamp': index.isoformat(),
+            'open': round(float(row['Open']), 2),
+            'high': round(float(row['High']), 2),
+            'low': round(float(row['Low']), 2),
+            'close': round(float(row['Close']), 2),
+            'volume': int(row['Volume'])
+        })
+    return historical_data
+
+
+def vectorized_records(data):
+    return bars_to_records(frame_to_bars(data))
+
+
+def vectorized_columns(data):
+    return bars_to_columns(frame_to_bars(data))
+
+
+def best_of(fn, data, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        json.dumps(fn(data))
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        data = make_frame(size)
+        baseline = best_of(legacy, data, args.repeat)
+        print(f"{size:>7} bars  iterrows loop       {baseline * 1000:9.1f} ms")
+        for name, fn in (('vectorized records', vectorized_records), ('vectorized columns', vectorized_columns)):
+            elapsed = best_of(fn, data, args.repeat)
+            print(f"{size:>7} bars  {name:<19} {elapsed * 1000:9.1f} ms  ({baseline / elapsed:5.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
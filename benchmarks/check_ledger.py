@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Tax-lot ledger check against a full history replay.
+
+Runs random buys and sells through execute_trade in a throwaway database,
+then checks every user's realized P&L and open lots against a replay of
+their whole transaction history (what realized P&L used to cost), and
+that the backfill rebuilds exactly the state the trades maintained.
+Reports read latency against the replay and backfill throughput. Exits
+non-zero on any mismatch.
+
+    python benchmarks/check_ledger.py --users 300 --trades 20000 --method fifo
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backend.models.database as db
+from backend.models import ledger
+
+
+def replay(user_id, method):
+    """Realized P&L and open lots per ticker from the user's full history."""
+    conn = db.get_db_connection()
+    rows = conn.execute(
+        'SELECT ticker, transaction_type, quantity, price FROM transactions WHERE user_id = ? ORDER BY timestamp, id',
+        (user_id,)
+    ).fetchall()
+    lots = {}
+    realized = {}
+    for ticker, transaction_type, quantity, price in rows:
+        open_lots = lots.setdefault(ticker, [])
+        if transaction_type == 'buy':
+            open_lots.append([quantity, price])
+            continue
+        if method == 'lifo':
+            order = open_lots[::-1]
+        elif method == 'hifo':
+            order = sorted(open_lots, key=lambda lot: -lot[1])
+        else:
+            order = open_lots
+        remaining = quantity
+        cost = 0.0
+        for lot in order:
+            take = min(lot[0], remaining)
+            lot[0] -= take
+            cost += take * lot[1]
+            remaining -= take
+            if remaining <= 1e-9:
+                break
+        lots[ticker] = [lot for lot in open_lots if lot[0] > 1e-9]
+        realized[ticker] = realized.get(ticker, 0.0) + quantity * price - cost
+    return realized, {ticker: open_lots for ticker, open_lots in lots.items() if open_lots}
+
+
+def ledger_state(user_id):
+    realized = {row['ticker']: row['realized_pnl'] for row in db.get_realized_pnl(user_id)}
+    lots = {}
+    for lot in db.get_user_lots(user_id):
+        lots.setdefault(lot['ticker'], []).append([lot['quantity'], lot['cost_price']])
+    return realized, lots
+
+
+def compare(user_id, expected, actual):
+    """Return a description of the first difference, or None."""
+    (expected_realized, expected_lots), (realized, lots) = expected, actual
+    if set(expected_realized) != set(realized):
+        return f'realized tickers {sorted(expected_realized)} vs {sorted(realized)}'
+    for ticker, value in expected_realized.items():
+        if abs(value - realized[ticker]) > 1e-6:
+            return f'{ticker} realized {value:.6f} vs {realized[ticker]:.6f}'
+    if set(expected_lots) != set(lots):
+        return f'lot tickers {sorted(expected_lots)} vs {sorted(lots)}'
+    for ticker, open_lots in expected_lots.items():
+        if len(open_lots) != len(lots[ticker]) or any(
+                abs(a[0] - b[0]) > 1e-9 or abs(a[1] - b[1]) > 1e-9 for a, b in zip(open_lots, lots[ticker])):
+            return f'{ticker} lots {open_lots} vs {lots[ticker]}'
+    for holding in db.get_user_portfolio(user_id):
+        open_lots = lots.get(holding['ticker'], [])
+        quantity = sum(lot[0] for lot in open_lots)
+        if abs(quantity - holding['quantity']) > 1e-6:
+            return f"{holding['ticker']} lots hold {quantity} of {holding['quantity']}"
+        if abs(sum(lot[0] * lot[1] for lot in open_lots) / quantity - holding['avg_buy_price']) > 1e-6:
+            return f"{holding['ticker']} avg_buy_price {holding['avg_buy_price']} differs from its lots"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--tickers', type=int, default=20)
+    parser.add_argument('--trades', type=int, default=20000)
+    parser.add_argument('--method', default='fifo', choices=sorted(ledger.LOT_ORDER_SQL))
+    parser.add_argument('--seed', type=int, default=11)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    ledger.LOT_METHOD = args.method
+    db.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'ledger.db')
+    db.init_db()
+
+    keys = [(f'T{i:03d}', 'crypto' if i % 5 == 0 else 'stock') for i in range(args.tickers)]
+    prices = {key: rng.uniform(5, 500) for key in keys}
+    users = [db.create_user(f'lot{n}', f'lot{n}@example.com', 'x')['user_id'] for n in range(args.users)]
+    held = {user_id: {} for user_id in users}
+
+    started = time.perf_counter()
+    for _ in range(args.trades):
+        user_id = rng.choice(users)
+        key = rng.choice(keys)
+        prices[key] *= rng.uniform(0.97, 1.03)
+        if not held[user_id] or rng.random() < 0.55:
+            result = db.execute_trade(user_id, key[0], key[1], 'buy', rng.uniform(0.1, 20), prices[key])
+        else:
+            key = rng.choice(sorted(held[user_id]))
+            quantity = held[user_id][key]
+            if rng.random() > 0.25:
+                quantity *= rng.uniform(0.05, 0.9)
+            result = db.execute_trade(user_id, key[0], key[1], 'sell', quantity, prices[key])
+        if result['success'] and result['position']['quantity'] > 0:
+            held[user_id][key] = result['position']['quantity']
+        else:
+            held[user_id].pop(key, None)
+    trade_ms = (time.perf_counter() - started) * 1000 / args.trades
+
+    failures = 0
+    ledger_times = []
+    replay_times = []
+    online = {}
+    for user_id in users:
+        started = time.perf_counter()
+        state = ledger_state(user_id)
+        ledger_times.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        expected = replay(user_id, args.method)
+        replay_times.append(time.perf_counter() - started)
+        online[user_id] = state
+        problem = compare(user_id, expected, state)
+        if problem:
+            failures += 1
+            print(f"FAIL user {user_id}: {problem}")
+
+    conn = db.get_db_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    started = time.perf_counter()
+    report = ledger.backfill_ledger(conn, args.method)
+    backfill_s = time.perf_counter() - started
+    conn.commit()
+    for user_id in users:
+        problem = compare(user_id, online[user_id], ledger_state(user_id))
+        if problem:
+            failures += 1
+            print(f"FAIL backfill user {user_id}: {problem}")
+
+    print(f"{args.users} users, {args.trades} trades ({args.method}): execute_trade {trade_ms:.3f} ms/trade")
+    print(f"realized + lots read p50 {statistics.median(ledger_times) * 1e6:.0f}us "
+          f"(history replay {statistics.median(replay_times) * 1e6:.0f}us)")
+    print(f"backfill {report['transactions']} transactions in {backfill_s * 1000:.0f} ms "
+          f"({report['transactions'] / backfill_s:,.0f}/s): {report}")
+    print('OK: ledger matches history replay and backfill' if not failures else f'FAIL: {failures} mismatches')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
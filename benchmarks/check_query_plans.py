@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Query plan check for the hot history queries.
+
+Seeds a temporary database, then asserts with EXPLAIN QUERY PLAN that the
+transaction history, snapshot range, tax-lot and order queries are
+answered from their indexes without a full scan or a temp sort, and
+prints their latency. The ledger backfill's single pass is allowed to
+scan, but must read transactions in index order, and the open-order
+ticker list may scan only the partial index of open orders. Exits
+non-zero if a plan regresses.
+
+    python benchmarks/check_query_plans.py --users 200 --rows 50
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backend.models.database as db
+from backend.models import ledger
+
+CHECKS = [
+    ('get_user_transactions', db.USER_TRANSACTIONS_SQL, (1, 50), 'idx_transactions_user_time'),
+    ('get_portfolio_snapshots', db.USER_SNAPSHOTS_SQL, (1, 24 * 30), 'idx_snapshots_user_time'),
+    ('get_user_cash_flows', db.USER_CASH_FLOWS_SQL, (1, 24 * 365), 'idx_transactions_user_time'),
+    ('get_user_lots', db.USER_LOTS_SQL, (1,), 'idx_tax_lots_user_ticker'),
+    ('get_realized_pnl', db.USER_REALIZED_SQL, (1,), 'PRIMARY KEY'),
+    ('backfill_ledger', ledger.BACKFILL_TRANSACTIONS_SQL, (), 'idx_transactions_user_time'),
+    ('get_user_orders', db.USER_ORDERS_BY_STATUS_SQL, (1, 'open', 100), 'idx_orders_user_status'),
+    ('iter_open_orders', db.OPEN_ORDERS_SQL, (0,), 'INTEGER PRIMARY KEY'),
+    ('get_open_order_assets', db.OPEN_ORDER_ASSETS_SQL, (), 'idx_orders_open_assets'),
+]
+
+# Whole-table passes, checked only for reading through the right index
+SCANS_ALLOWED = {'backfill_ledger', 'get_open_order_assets'}
+
+
+def seed(users, rows):
+    conn = db.get_db_connection()
+    conn.executemany(
+        '''INSERT INTO transactions (user_id, ticker, asset_type, transaction_type, quantity, price, timestamp)
+           VALUES (?, 'AAPL', 'stock', 'buy', 1, 100, datetime('now', '-' || ? || ' minutes'))''',
+        ((u, r) for u in range(1, users + 1) for r in range(rows))
+    )
+    conn.executemany(
+        '''INSERT INTO portfolio_snapshots (user_id, total_value, timestamp)
+           VALUES (?, 1000, datetime('now', '-' || ? || ' hours'))''',
+        ((u, r) for u in range(1, users + 1) for r in range(rows))
+    )
+    conn.executemany(
+        '''INSERT INTO orders (user_id, ticker, asset_type, side, order_type, quantity, limit_price, status)
+           VALUES (?, 'AAPL', 'stock', 'buy', 'limit', 1, 100, ?)''',
+        ((u, 'open' if r % 5 == 0 else 'filled') for u in range(1, users + 1) for r in range(rows))
+    )
+    conn.commit()
+    conn.execute('ANALYZE')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--rows', type=int, default=50, help='rows per user per table')
+    args = parser.parse_args()
+
+    db.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'plans.db')
+    db.init_db()
+    seed(args.users, args.rows)
+    conn = db.get_db_connection()
+
+    failed = False
+    for name, sql, params, index in CHECKS:
+        plan = db.explain_query_plan(sql, params)
+        started = time.perf_counter()
+        for _ in range(100):
+            conn.execute(sql, params).fetchall()
+        per_query_ms = (time.perf_counter() - started) * 10
+
+        problems = []
+        if not any(index in line for line in plan):
+            problems.append(f'does not use {index}')
+        if name not in SCANS_ALLOWED and any(line.startswith('SCAN') for line in plan):
+            problems.append('full table scan')
+        if any('TEMP B-TREE' in line for line in plan):
+            problems.append('temp sort')
+
+        status = 'FAIL' if problems else 'OK'
+        print(f"{status}: {name} ({per_query_ms:.3f} ms/query)")
+        for line in plan:
+            print(f"    {line}")
+        for problem in problems:
+            print(f"    -> {problem}")
+        failed = failed or bool(problems)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Upstream client check against a local fake HTTP server.
+
+Starts a throwaway HTTP server that can answer normally, throttle with
+429 + Retry-After, fail with 500 or stall past the read timeout, then
+asserts that UpstreamClient rate-limits, retries with backoff, times out,
+opens and recovers its circuit breaker, and that data_fetcher serves the
+last known quote while the CoinGecko breaker is open. Exits non-zero on
+any failed check.
+
+    python benchmarks/check_upstream.py
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeUpstream(BaseHTTPRequestHandler):
+    """Answers by path: /ok, /throttle/<n>, /down, /slow and /simple/price."""
+
+    hits = {}
+    throttled = {}
+    mode = 'ok'
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client already gave up on a deliberately slow response
+            pass
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        FakeUpstream.hits[path] = FakeUpstream.hits.get(path, 0) + 1
+        if path.startswith('/throttle/'):
+            remaining = FakeUpstream.throttled.setdefault(path, int(path.rsplit('/', 1)[1]))
+            if remaining > 0:
+                FakeUpstream.throttled[path] -= 1
+                return self._json(429, {'error': 'rate limited'}, {'Retry-After': '0.1'})
+            return self._json(200, {'ok': True})
+        if path == '/down':
+            return self._json(500, {'error': 'down'})
+        if path == '/slow':
+            time.sleep(1)
+            return self._json(200, {'ok': True})
+        if path == '/simple/price':
+            if FakeUpstream.mode == 'down':
+                return self._json(503, {'error': 'down'})
+            return self._json(200, {'bitcoin': {'usd': 50000.0, 'usd_24h_change': 1.5}})
+        return self._json(200, {'ok': True})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--port', type=int, default=0, help='port for the fake server (0 = any)')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), FakeUpstream)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+
+    # data_fetcher reads its provider URL at import time
+    os.environ['COINGECKO_BASE_URL'] = base
+    from backend.utils import data_fetcher
+    from backend.utils.quote_cache import quote_cache
+    from backend.utils.upstream import (
+        UpstreamClient, CircuitBreaker, UpstreamError, CircuitOpenError, coingecko_client
+    )
+
+    failures = []
+
+    def check(name, ok, detail=''):
+        print(f"{'OK' if ok else 'FAIL'}: {name}{' (' + detail + ')' if detail else ''}")
+        if not ok:
+            failures.append(name)
+
+    # Token bucket: 5 burst + 15 more at 10/s takes about 1.5s
+    client = UpstreamClient('bucket', rate=10, burst=5)
+    started = time.perf_counter()
+    for _ in range(20):
+        client.get_json(f'{base}/ok')
+    elapsed = time.perf_counter() - started
+    check('token bucket paces calls', 1.3 <= elapsed <= 3, f'20 calls in {elapsed:.2f}s')
+
+    # 429 + Retry-After is retried until it succeeds
+    client = UpstreamClient('retry', rate=100, burst=100, retries=4, backoff_base=0.05)
+    body = client.get_json(f'{base}/throttle/2')
+    stats = client.stats()
+    check('429 retried with backoff', body == {'ok': True} and stats['throttled_upstream'] == 2
+          and stats['retries'] == 2, f"{stats['throttled_upstream']} throttled, {stats['retries']} retries")
+
+    # Read timeout bounds a stalled upstream
+    client = UpstreamClient('timeout', rate=100, burst=100, retries=2, backoff_base=0.01,
+                            timeout=(1, 0.2))
+    started = time.perf_counter()
+    try:
+        client.get(f'{base}/slow')
+        timed_out = False
+    except UpstreamError:
+        timed_out = True
+    elapsed = time.perf_counter() - started
+    check('read timeout enforced', timed_out and elapsed < 1, f'gave up after {elapsed:.2f}s')
+
+    # Breaker opens after consecutive failures, short-circuits, then recovers
+    client = UpstreamClient('breaker', rate=100, burst=100, retries=1,
+                            breaker=CircuitBreaker(failures=3, reset_timeout=0.5))
+    for _ in range(3):
+        try:
+            client.get(f'{base}/down')
+        except UpstreamError:
+            pass
+    hits_before = FakeUpstream.hits.get('/down', 0)
+    try:
+        client.get(f'{base}/down')
+        short_circuited = False
+    except CircuitOpenError:
+        short_circuited = True
+    check('breaker opens and short-circuits', short_circuited and client.breaker.state == 'open'
+          and FakeUpstream.hits.get('/down', 0) == hits_before)
+    time.sleep(0.6)
+    client.get_json(f'{base}/ok')
+    check('breaker half-opens and closes on success', client.breaker.state == 'closed')
+
+    # data_fetcher serves the last known quote while CoinGecko's breaker is open
+    coingecko_client.breaker = CircuitBreaker(failures=1, reset_timeout=60)
+    coingecko_client.retries = 1
+    quote_cache.ttls['crypto'] = 0
+    fresh = data_fetcher.get_cached_price('BTC', 'crypto')
+    FakeUpstream.mode = 'down'
+    time.sleep(0.01)
+    failed = data_fetcher.get_cached_price('BTC', 'crypto')
+    hits_before = FakeUpstream.hits.get('/simple/price', 0)
+    stale = data_fetcher.get_cached_price('BTC', 'crypto')
+    check('stale quote served while breaker open',
+          fresh.get('success') and not fresh.get('stale')
+          and failed.get('stale') and stale.get('stale') and stale['price'] == fresh['price']
+          and coingecko_client.breaker.state == 'open'
+          and FakeUpstream.hits.get('/simple/price', 0) == hits_before,
+          f"breaker {coingecko_client.breaker.state}, price {stale.get('price')}")
+
+    server.shutdown()
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
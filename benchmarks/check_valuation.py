@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Materialized valuation check against a full recompute.
+
+Creates users with random holdings in a throwaway database, then
+interleaves price ticks, trades applied through ValuationBook.apply_trade
+and trades made behind its back (as another worker would). After every
+round each user's summary must match a from-scratch valuation of the
+portfolio table at the same prices, and check_consistency must find no
+mismatches. Also reports read latency against the per-request recompute.
+Exits non-zero on any mismatch.
+
+    python benchmarks/check_valuation.py --users 500 --tickers 40 --rounds 20
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backend.models.database as db
+from backend.utils.valuation import ValuationBook
+
+
+def recompute(user_id, prices):
+    """Value a user the way the summary endpoint did before the book."""
+    value = cost = 0.0
+    holdings = db.get_user_portfolio(user_id)
+    for holding in holdings:
+        price = prices.get((holding['ticker'], holding['asset_type']))
+        if price is not None:
+            value += price * holding['quantity']
+            cost += holding['avg_buy_price'] * holding['quantity']
+    return round(value, 2), round(cost, 2), len(holdings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--tickers', type=int, default=40)
+    parser.add_argument('--holdings', type=int, default=8, help='initial holdings per user')
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--trades', type=int, default=200, help='trades per round')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    db.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'valuation.db')
+    db.init_db()
+
+    keys = [(f'T{i:03d}', 'crypto' if i % 5 == 0 else 'stock') for i in range(args.tickers)]
+    prices = {key: rng.uniform(5, 500) for key in keys}
+
+    def fetch(items):
+        return {key: {'success': True, 'price': prices[key]} for key in items if key in prices}
+
+    book = ValuationBook(stale_after=3600, fetch=fetch)
+
+    users = []
+    for n in range(args.users):
+        user_id = db.create_user(f'val{n}', f'val{n}@example.com', 'x')['user_id']
+        for key in rng.sample(keys, min(args.holdings, len(keys))):
+            db.execute_trade(user_id, key[0], key[1], 'buy', rng.uniform(0.1, 50), prices[key])
+        users.append(user_id)
+        book.summary(user_id)
+
+    failures = 0
+    book_times = []
+    full_times = []
+    for round_number in range(args.rounds):
+        # Price tick over a random subset of tickers
+        moved = rng.sample(keys, max(1, len(keys) // 3))
+        for key in moved:
+            prices[key] *= rng.uniform(0.95, 1.05)
+        book.apply_quotes({key: {'success': True, 'price': prices[key]} for key in moved})
+
+        for _ in range(args.trades):
+            user_id = rng.choice(users)
+            key = rng.choice(keys)
+            if rng.random() < 0.5:
+                result = db.execute_trade(user_id, key[0], key[1], 'buy', rng.uniform(0.1, 20), prices[key])
+            else:
+                held = {(h['ticker'], h['asset_type']): h['quantity'] for h in db.get_user_portfolio(user_id)}
+                if not held:
+                    continue
+                key = rng.choice(sorted(held))
+                quantity = held[key] if rng.random() < 0.3 else held[key] * rng.uniform(0.1, 0.9)
+                result = db.execute_trade(user_id, key[0], key[1], 'sell', quantity, prices[key])
+            # One in ten trades happens in "another process" and is only seen via the version
+            if result['success'] and rng.random() < 0.9:
+                book.apply_trade(user_id, result['version'], result['position'], prices[key])
+
+        for user_id in users:
+            started = time.perf_counter()
+            summary = book.summary(user_id)
+            book_times.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            value, cost, count = recompute(user_id, prices)
+            full_times.append(time.perf_counter() - started)
+            if (abs(summary['total_value'] - value) > 0.02 or abs(summary['total_cost'] - cost) > 0.02
+                    or summary['holdings_count'] != count):
+                failures += 1
+                print(f"FAIL round {round_number} user {user_id}: book {summary['total_value']}/"
+                      f"{summary['total_cost']}/{summary['holdings_count']}, recompute {value}/{cost}/{count}")
+
+        report = book.check_consistency()
+        if report['mismatched']:
+            failures += len(report['mismatched'])
+            print(f"FAIL round {round_number}: check_consistency {report['mismatched'][:3]}")
+
+    stats = book.stats()
+    print(f"{args.users} users x {args.rounds} rounds: {stats['trades_applied']} trades applied, "
+          f"{stats['loads']} loads, {stats['price_updates']} price updates")
+    print(f"summary read p50 {statistics.median(book_times) * 1e6:.0f}us "
+          f"(full recompute from the database {statistics.median(full_times) * 1e6:.0f}us, "
+          f"before any quote lookups)")
+    print('OK: book matches full recompute' if not failures else f'FAIL: {failures} mismatches')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
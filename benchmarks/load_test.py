@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Load-test harness for the CELESTA HTTP API.
+
+Seeds users with holdings and transaction history, then drives a weighted
+mix of requests from concurrent clients for a fixed duration and reports
+throughput and latency percentiles per endpoint. By default the app runs
+in-process on a temporary database with the offline simulator provider,
+so runs are reproducible and need no network. --url targets a server that
+is already running instead; clients and server then stop sharing one GIL,
+which is the better setup for absolute numbers. Results are written as
+JSON, and --baseline prints the change against an earlier results file.
+
+    python benchmarks/load_test.py --mix dashboard --users 50 --concurrency 16 --duration 20
+    python benchmarks/load_test.py --mix mixed --output after.json --baseline before.json
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Results land next to the harness rather than in whatever directory it was run from
+DEFAULT_OUTPUT = os.path.join(ROOT, 'benchmarks', 'results', 'load_test_results.json')
+
+PERIODS = ['1d', '5d', '1mo', '3mo', '1y']
+
+# Relative weights of each action in a named traffic mix
+MIXES = {
+    'dashboard': {'holdings': 4, 'summary': 4, 'trending': 2, 'value_history': 1, 'batch_prices': 2},
+    'trading': {'buy': 4, 'sell': 3, 'transactions': 2, 'price': 3, 'holdings': 1},
+    'charts': {'history': 5, 'info': 2, 'search': 2, 'price': 1},
+    'mixed': {
+        'holdings': 4, 'summary': 4, 'trending': 2, 'value_history': 2, 'batch_prices': 2,
+        'buy': 1, 'sell': 1, 'transactions': 1, 'price': 2, 'history': 2, 'info': 1, 'search': 1,
+    },
+}
+
+
+def load_universe():
+    """Return (stocks, cryptos) symbol lists from the bundled listing file."""
+    stocks, cryptos = [], []
+    with open(os.path.join(ROOT, 'backend', 'data', 'symbols.csv'), newline='') as f:
+        for row in csv.DictReader(f):
+            (cryptos if row['type'] == 'crypto' else stocks).append(row['symbol'])
+    return stocks, cryptos
+
+
+class Client:
+    """One simulated user: a logged-in HTTP session plus the actions it can take."""
+
+    def __init__(self, base_url, username, password, universe, rng):
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.stocks, self.cryptos = universe
+        self.rng = rng
+        self.session = requests.Session()
+        self.held = []
+
+    def _asset(self):
+        if self.rng.random() < 0.2:
+            return self.rng.choice(self.cryptos), 'crypto'
+        return self.rng.choice(self.stocks), 'stock'
+
+    def request(self, method, path, label=None, **kwargs):
+        """Send one request and return (label, status, seconds)."""
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=30, **kwargs)
+            status = response.status_code
+        except requests.RequestException:
+            status = 0
+        return label or f'{method} {path}', status, time.perf_counter() - started
+
+    def signup_or_login(self):
+        _, status, _ = self.request('POST', '/api/auth/signup', json={
+            'username': self.username,
+            'email': f'{self.username}@example.com',
+            'password': self.password
+        })
+        if status != 201:
+            _, status, _ = self.request('POST', '/api/auth/login', json={
+                'username': self.username, 'password': self.password
+            })
+        if status not in (200, 201):
+            raise RuntimeError(f'could not sign up or log in {self.username}: HTTP {status}')
+
+    def trade(self, side, ticker, asset_type, quantity):
+        return self.request('POST', f'/api/portfolio/{side}', f'POST /api/portfolio/{side}', json={
+            'ticker': ticker, 'asset_type': asset_type, 'quantity': quantity
+        })
+
+    # Actions named in MIXES
+
+    def holdings(self):
+        return self.request('GET', '/api/portfolio/holdings')
+
+    def summary(self):
+        return self.request('GET', '/api/portfolio/summary')
+
+    def trending(self):
+        return self.request('GET', '/api/market/trending')
+
+    def value_history(self):
+        return self.request('GET', '/api/portfolio/value-history?hours=168',
+                            'GET /api/portfolio/value-history')
+
+    def transactions(self):
+        return self.request('GET', '/api/portfolio/transactions?limit=50',
+                            'GET /api/portfolio/transactions')
+
+    def price(self):
+        ticker, asset_type = self._asset()
+        return self.request('GET', f'/api/market/price/{ticker}?type={asset_type}',
+                            'GET /api/market/price/<ticker>')
+
+    def batch_prices(self):
+        items = [self._asset() for _ in range(10)]
+        return self.request('POST', '/api/market/batch-prices', json={
+            'tickers': [{'ticker': ticker, 'type': asset_type} for ticker, asset_type in items]
+        })
+
+    def buy(self):
+        ticker, asset_type = self._asset()
+        self.held.append((ticker, asset_type))
+        return self.trade('buy', ticker, asset_type, 1)
+
+    def sell(self):
+        if not self.held:
+            return self.buy()
+        ticker, asset_type = self.rng.choice(self.held)
+        return self.trade('sell', ticker, asset_type, 1)
+
+    def history(self):
+        ticker, asset_type = self._asset()
+        period = self.rng.choice(PERIODS)
+        return self.request('GET', f'/api/market/history/{ticker}?period={period}&type={asset_type}',
+                            'GET /api/market/history/<ticker>')
+
+    def info(self):
+        ticker, asset_type = self._asset()
+        return self.request('GET', f'/api/market/info/{ticker}?type={asset_type}',
+                            'GET /api/market/info/<ticker>')
+
+    def search(self):
+        symbol = self.rng.choice(self.stocks)
+        query = symbol[:self.rng.randint(1, len(symbol))]
+        return self.request('GET', f'/api/market/search?q={query}', 'GET /api/market/search')
+
+
+def start_local_server(db_path):
+    """Start the app in-process on a threaded WSGI server. Returns (base_url, server)."""
+    os.environ.setdefault('MARKET_PROVIDER', 'simulator')
+    os.environ.setdefault('SNAPSHOT_JOB', '0')
+    from werkzeug.serving import make_server
+    import backend.models.database as db
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    db.DATABASE_PATH = db_path
+    from backend.app import create_app
+
+    server = make_server('127.0.0.1', 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
+
+
+def seed_snapshots(user_ids, days):
+    """Write hourly portfolio snapshots for every user directly to the local database."""
+    import backend.models.database as db
+    rng = random.Random(0)
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    values = {user_id: 10000.0 for user_id in user_ids}
+    for hour in range(days * 24, 0, -1):
+        for user_id in user_ids:
+            values[user_id] *= 1 + rng.gauss(0, 0.003)
+        timestamp = (now - timedelta(hours=hour)).strftime('%Y-%m-%d %H:%M:%S')
+        db.add_portfolio_snapshots(((u, round(v, 2)) for u, v in values.items()), timestamp)
+    db.release_db_connection()
+
+
+def seed(clients, holdings, transactions):
+    """Give every client `holdings` positions and `transactions` extra trades over HTTP."""
+    def seed_one(client):
+        client.signup_or_login()
+        for _ in range(holdings):
+            ticker, asset_type = client._asset()
+            client.trade('buy', ticker, asset_type, client.rng.randint(5, 50))
+            client.held.append((ticker, asset_type))
+        for i in range(transactions):
+            ticker, asset_type = client.rng.choice(client.held)
+            client.trade('sell' if i % 2 else 'buy', ticker, asset_type, 1)
+
+    threads = [threading.Thread(target=seed_one, args=(client,)) for client in clients]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    """Aggregate (label, status, seconds) samples into per-endpoint stats."""
+    by_label = {}
+    for label, status, seconds in samples:
+        by_label.setdefault(label, []).append((status, seconds))
+
+    def stats(rows):
+        latencies = sorted(seconds * 1000 for _, seconds in rows)
+        statuses = {}
+        for status, _ in rows:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        return {
+            'requests': len(rows),
+            'rps': round(len(rows) / elapsed, 1),
+            'errors': sum(1 for status, _ in rows if status == 0 or status >= 500),
+            'statuses': statuses,
+            'mean_ms': round(sum(latencies) / len(latencies), 2),
+            'p50_ms': round(percentile(latencies, 0.50), 2),
+            'p90_ms': round(percentile(latencies, 0.90), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'max_ms': round(latencies[-1], 2),
+        }
+
+    endpoints = {label: stats(rows) for label, rows in sorted(by_label.items())}
+    total = stats([(status, seconds) for _, status, seconds in samples]) if samples else {}
+    return endpoints, total
+
+
+def print_report(endpoints, total, baseline=None):
+    print(f"\n{'endpoint':<40} {'reqs':>7} {'rps':>8} {'err':>5} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+    rows = list(endpoints.items()) + [('TOTAL', total)]
+    for label, s in rows:
+        line = (f"{label:<40} {s['requests']:>7} {s['rps']:>8} {s['errors']:>5} "
+                f"{s['p50_ms']:>8} {s['p90_ms']:>8} {s['p99_ms']:>8} {s['max_ms']:>8}")
+        before = (baseline or {}).get('total' if label == 'TOTAL' else 'endpoints', {})
+        before = before if label == 'TOTAL' else before.get(label)
+        if before:
+            def delta(key):
+                return (s[key] / before[key] - 1) * 100 if before[key] else 0
+            line += f"   rps {delta('rps'):+.0f}%  p99 {delta('p99_ms'):+.0f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--mix', choices=sorted(MIXES), default='mixed')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--holdings', type=int, default=5, help='positions seeded per user')
+    parser.add_argument('--transactions', type=int, default=20, help='extra trades seeded per user')
+    parser.add_argument('--snapshot-days', type=int, default=7, help='days of hourly snapshots (local only)')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20, help='seconds of measured load')
+    parser.add_argument('--warmup', type=float, default=3, help='seconds of unmeasured load first')
+    parser.add_argument('--think-time', type=float, default=0, help='seconds each client waits between requests')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--url', help='target a running server instead of starting one in-process')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='results JSON (default benchmarks/results/, git-ignored)')
+    parser.add_argument('--baseline', help='earlier results JSON to compare against')
+    args = parser.parse_args()
+
+    universe = load_universe()
+    server = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        base_url, server = start_local_server(os.path.join(tempfile.mkdtemp(), 'load.db'))
+
+    prefix = f'load{int(time.time())}'
+    clients = [
+        Client(base_url, f'{prefix}_{n}', 'loadtest-password', universe, random.Random(args.seed + n))
+        for n in range(args.users)
+    ]
+    started = time.perf_counter()
+    seed(clients, args.holdings, args.transactions)
+    if server is not None and args.snapshot_days:
+        import backend.models.database as db
+        user_ids = [db.get_user_by_username(c.username)['id'] for c in clients]
+        seed_snapshots(user_ids, args.snapshot_days)
+    print(f"Seeded {args.users} users x {args.holdings} holdings + {args.transactions} trades "
+          f"in {time.perf_counter() - started:.1f}s against {base_url}")
+
+    actions = list(MIXES[args.mix])
+    weights = [MIXES[args.mix][name] for name in actions]
+    samples = []
+    lock = threading.Lock()
+    measure_from = time.perf_counter() + args.warmup
+    stop_at = measure_from + args.duration
+
+    def worker(n):
+        client = clients[n % len(clients)]
+        rng = random.Random(args.seed * 1000 + n)
+        local = []
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                break
+            result = getattr(client, rng.choices(actions, weights)[0])()
+            if now >= measure_from:
+                local.append(result)
+            if args.think_time:
+                time.sleep(args.think_time)
+        with lock:
+            samples.extend(local)
+
+    print(f"Running '{args.mix}' mix: {args.concurrency} clients, "
+          f"{args.warmup:.0f}s warmup + {args.duration:.0f}s measured")
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    endpoints, total = summarize(samples, args.duration)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(endpoints, total, baseline)
+
+    results = {
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'provider': os.environ.get('MARKET_PROVIDER') if server is not None else None,
+        'finished_at': datetime.utcnow().isoformat() + 'Z',
+        'total': total,
+        'endpoints': endpoints,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
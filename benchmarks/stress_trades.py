@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Concurrent sell stress test for execute_trade.
+
+Buys a holding, then fires many parallel sells of one unit each at it.
+Exactly `quantity` sells may succeed; the rest must fail with
+'Insufficient quantity' or 'Holding not found', the holding must end up
+closed and the transactions table must match. Exits non-zero on any
+oversell or lost update.
+
+    python benchmarks/stress_trades.py --quantity 200 --sellers 400 --threads 32
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backend.models.database as db
+
+
+def sell_once(user_id):
+    try:
+        return db.execute_trade(user_id, 'AAPL', 'stock', 'sell', 1, 100.0)
+    finally:
+        db.release_db_connection()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--quantity', type=int, default=200)
+    parser.add_argument('--sellers', type=int, default=400)
+    parser.add_argument('--threads', type=int, default=32)
+    args = parser.parse_args()
+
+    db.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'stress.db')
+    db.init_db()
+    user_id = db.create_user('stress', 'stress@example.com', 'x')['user_id']
+    db.execute_trade(user_id, 'AAPL', 'stock', 'buy', args.quantity, 100.0)
+    db.release_db_connection()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(sell_once, [user_id] * args.sellers))
+    elapsed = time.perf_counter() - started
+
+    filled = sum(1 for r in results if r['success'])
+    rejected = [r['error'] for r in results if not r['success']]
+    unexpected = [e for e in rejected if e not in ('Insufficient quantity', 'Holding not found')]
+    holdings = db.get_user_portfolio(user_id)
+    sells = [t for t in db.get_user_transactions(user_id, limit=args.sellers + 1)
+             if t['transaction_type'] == 'sell']
+
+    print(f"{args.sellers} sells on {args.threads} threads in {elapsed:.3f}s: "
+          f"{filled} filled, {len(rejected)} rejected")
+
+    failures = []
+    if filled != min(args.quantity, args.sellers):
+        failures.append(f"expected {min(args.quantity, args.sellers)} fills, got {filled}")
+    if len(sells) != filled:
+        failures.append(f"{len(sells)} sell transactions recorded for {filled} fills")
+    if args.sellers >= args.quantity and holdings:
+        failures.append(f"holding not closed: {holdings}")
+    if unexpected:
+        failures.append(f"unexpected errors: {sorted(set(unexpected))}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK: no oversell, holding and transactions consistent")
+
+
+if __name__ == '__main__':
+    main()
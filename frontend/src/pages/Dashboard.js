@@ -1,5 +1,5 @@
 import React, { useState, useEffect, useCallback } from 'react';
-import { getHoldings, getPortfolioSummary, getPortfolioValueHistory, sellAsset } from '../services/api';
+import { getHoldings, getPortfolioSummary, getPortfolioValueHistory, sellAsset, openPriceStream } from '../services/api';
 import PortfolioChart from '../components/PortfolioChart';
 import StockCard from '../components/StockCard';
 import TradeModal from '../components/TradeModal';
@@ -14,6 +14,7 @@ function Dashboard({ user }) {
   const [tradeModalOpen, setTradeModalOpen] = useState(false);
   const [tradeType, setTradeType] = useState('buy');
   const [autoRefresh, setAutoRefresh] = useState(true);
+  const [streamRefused, setStreamRefused] = useState(false);
 
   const fetchData = useCallback(async () => {
     try {
@@ -45,13 +46,62 @@ function Dashboard({ user }) {
     fetchData();
   }, [fetchData]);
 
-  // Auto-refresh every 5 seconds
+  const streamKey = holdings.map(h => `${h.ticker}:${h.asset_type}`).sort().join(',');
+
+  // Live updates are pushed by the server; only changed quotes and values arrive
+  useEffect(() => {
+    if (!autoRefresh || streamRefused) return;
+
+    const tickers = streamKey
+      ? streamKey.split(',').map(key => {
+          const [ticker, type] = key.split(':');
+          return { ticker, type };
+        })
+      : [];
+
+    const source = openPriceStream(tickers, {
+      quote: (quote) => {
+        setHoldings(prev => prev.map(h => {
+          if (h.ticker !== quote.ticker || h.asset_type !== quote.type) return h;
+          return {
+            ...h,
+            current_price: quote.price,
+            total_value: quote.price * h.quantity,
+            profit_loss: (quote.price - h.avg_buy_price) * h.quantity,
+            profit_loss_percent: ((quote.price / h.avg_buy_price) - 1) * 100,
+            price_status: 'live',
+          };
+        }));
+      },
+      portfolio: (value) => {
+        setSummary(prev => ({ ...(prev || {}), ...value }));
+      },
+      fallback: () => setStreamRefused(true),
+    });
+
+    return () => source.close();
+  }, [autoRefresh, streamKey, streamRefused]);
+
+  // The server is at its stream limit: poll instead, and try streaming again later
+  useEffect(() => {
+    if (!autoRefresh || !streamRefused) return;
+
+    const poll = setInterval(fetchData, 15000);
+    const retry = setTimeout(() => setStreamRefused(false), 120000);
+
+    return () => {
+      clearInterval(poll);
+      clearTimeout(retry);
+    };
+  }, [autoRefresh, streamRefused, fetchData]);
+
+  // Full refresh (value history, new holdings) at a much slower pace
   useEffect(() => {
     if (!autoRefresh) return;
 
     const interval = setInterval(() => {
       fetchData();
-    }, 5000); // 5 seconds
+    }, 60000); // 60 seconds
 
     return () => clearInterval(interval);
   }, [autoRefresh, fetchData]);
@@ -89,7 +139,7 @@ function Dashboard({ user }) {
             />
             <span className="slider"></span>
           </label>
-          <span>Auto-refresh (5s)</span>
+          <span>Live updates</span>
         </div>
       </div>
 
@@ -91,8 +91,9 @@ export const getPrice = async (ticker, assetType = 'stock') => {
   return response.data;
 };
 
-export const getHistoricalData = async (ticker, assetType = 'stock', period = '1mo') => {
-  const response = await api.get(`/market/history/${ticker}?type=${assetType}&period=${period}`);
+// format: 'records' (list of bars) or 'columns' ({ timestamps: [...], open: [...], ... })
+export const getHistoricalData = async (ticker, assetType = 'stock', period = '1mo', format = 'records') => {
+  const response = await api.get(`/market/history/${ticker}?type=${assetType}&period=${period}&format=${format}`);
   return response.data;
 };
 
@@ -116,5 +117,33 @@ export const getBatchPrices = async (tickers) => {
   return response.data;
 };
 
+// ============================================
+// STREAMING
+// ============================================
+
+// tickers: [{ ticker, type }]; handlers: { quote, portfolio } callbacks, plus
+// fallback, called if the server refuses the stream (it is at capacity)
+export const openPriceStream = (tickers, handlers = {}, includePortfolio = true) => {
+  const { fallback, ...events } = handlers;
+  const tickerParam = tickers
+    .map(({ ticker, type }) => (type === 'crypto' ? `${ticker}:crypto` : ticker))
+    .join(',');
+  const url = `${API_BASE_URL}/stream?tickers=${encodeURIComponent(tickerParam)}&portfolio=${includePortfolio ? 1 : 0}`;
+  const source = new EventSource(url, { withCredentials: true });
+
+  Object.entries(events).forEach(([event, handler]) => {
+    source.addEventListener(event, (e) => handler(JSON.parse(e.data)));
+  });
+
+  // EventSource retries dropped streams itself, but gives up on an error response
+  source.onerror = () => {
+    if (source.readyState === EventSource.CLOSED && fallback) {
+      fallback();
+    }
+  };
+
+  return source;
+};
+
 export default api;
 
@@ -0,0 +1,62 @@
+"""
+Gunicorn settings for serving CELESTA in production.
+
+    gunicorn -c gunicorn.conf.py backend.wsgi:app
+
+Every setting can be overridden with the environment variable next to it.
+"""
+
+import multiprocessing
+import os
+import signal
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', 5001)}")
+
+# One process per core; threads cover I/O waits and long-lived event streams
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+
+# Each open event stream holds a thread for as long as it is connected; past
+# this many per worker, clients fall back to polling so requests always get a thread
+os.environ.setdefault('STREAM_MAX_SUBSCRIBERS', str(max(1, threads // 2)))
+
+# Import the app (migrations, symbol index) once in the master before forking
+preload_app = True
+
+# Seconds before a silent worker is restarted, and to finish requests on shutdown
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 20))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers after this many requests (0 = never), with jitter so they do not restart together
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 0))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    from backend.wsgi import start_worker_jobs
+    if start_worker_jobs():
+        server.log.info('Worker %s runs the snapshot job and order engine', worker.pid)
+
+
+def post_worker_init(worker):
+    # SIGTERM starts a graceful shutdown; end event streams first so their
+    # requests finish instead of holding the worker until graceful_timeout
+    from backend.utils.stream_hub import stream_hub
+    handle_exit = signal.getsignal(signal.SIGTERM)
+
+    def on_term(signum, frame):
+        stream_hub.shutdown()
+        handle_exit(signum, frame)
+
+    signal.signal(signal.SIGTERM, on_term)
+
+
+def worker_exit(server, worker):
+    from backend.wsgi import stop_worker_jobs
+    stop_worker_jobs()
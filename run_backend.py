@@ -2,17 +2,24 @@
 """
 CELESTA Backend Runner
 Run this script to start the Flask API server.
+
+Uses the Werkzeug dev server by default. With CELESTA_ENV=production it
+starts gunicorn with gunicorn.conf.py instead.
 """
 
 import sys
 import os
 
 # Add the project root to the Python path
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-
-from backend.app import create_app
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
 
 if __name__ == '__main__':
-    app = create_app()
-    app.run(debug=True, host='0.0.0.0', port=5001)
+    if os.environ.get('CELESTA_ENV') == 'production':
+        os.chdir(ROOT)
+        os.execvp(sys.executable, [sys.executable, '-m', 'gunicorn',
+                                   '-c', 'gunicorn.conf.py', 'backend.wsgi:app'])
 
+    from backend.app import create_app
+    app = create_app()
+    app.run(debug=app.config['DEBUG'], host='0.0.0.0', port=5001)